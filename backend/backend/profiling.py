@@ -0,0 +1,155 @@
+# backend/profiling.py
+import logging
+import random
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(AssertionError):
+    """A view ran more queries than its budget allows"""
+
+
+class QueryProfile:
+    """Collects every statement run while installed as an execute wrapper.
+
+    Works without DEBUG: it hooks ``connection.execute_wrapper`` instead of
+    reading ``connection.queries``. ``duplicates`` counts statements re-run
+    with identical SQL and params; ``repeated`` counts re-runs of the same
+    SQL with any params, which is what an N+1 loop looks like.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.slowest_sql = ''
+        self.slowest_duration = 0.0
+        self._statements = Counter()
+        self._templates = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.count += 1
+            self.duration += elapsed
+            if elapsed > self.slowest_duration:
+                self.slowest_duration = elapsed
+                self.slowest_sql = sql
+            self._templates[sql] += 1
+            try:
+                self._statements[(sql, repr(params))] += 1
+            except Exception:
+                pass
+
+    @property
+    def duplicates(self):
+        return sum(n - 1 for n in self._statements.values())
+
+    @property
+    def repeated(self):
+        return sum(n - 1 for n in self._templates.values())
+
+    def most_repeated(self, n=3):
+        return [(sql, count) for sql, count in self._templates.most_common(n) if count > 1]
+
+    def as_dict(self):
+        return {
+            'queries': self.count,
+            'db_ms': round(self.duration * 1000, 2),
+            'duplicates': self.duplicates,
+            'repeated': self.repeated,
+            'slowest_ms': round(self.slowest_duration * 1000, 2),
+            'slowest_sql': self.slowest_sql[:500],
+        }
+
+
+@contextmanager
+def profile_queries(aliases=None):
+    """Profile the queries run inside the block on every (or the given) connection"""
+    profile = QueryProfile()
+    with ExitStack() as stack:
+        for alias in aliases or connections:
+            stack.enter_context(connections[alias].execute_wrapper(profile))
+        yield profile
+
+
+def get_budget(view_name):
+    return settings.QUERY_BUDGETS.get(view_name, settings.QUERY_BUDGET_DEFAULT)
+
+
+def _server_timing(profile, total):
+    desc = f'{profile.count} queries, {profile.duplicates} duplicate'
+    return ', '.join([
+        f'db;dur={profile.duration * 1000:.2f};desc="{desc}"',
+        f'db-slowest;dur={profile.slowest_duration * 1000:.2f}',
+        f'app;dur={total * 1000:.2f}',
+    ])
+
+
+class QueryProfilingMiddleware:
+    """Measure the SQL each view runs and hold views to a query budget.
+
+    Profiles a ``QUERY_PROFILING_SAMPLE_RATE`` share of requests (every
+    request while budgets are enforced), adds a ``Server-Timing`` header and
+    logs a structured record. Views from ``QUERY_BUDGET_APPS`` that go over
+    their ``QUERY_BUDGETS`` entry are logged as warnings, or raise
+    QueryBudgetExceeded when ``QUERY_BUDGET_ENFORCE`` is on (as in tests).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def should_profile(self, request):
+        if settings.QUERY_BUDGET_ENFORCE:
+            return True
+        rate = settings.QUERY_PROFILING_SAMPLE_RATE
+        return rate > 0 and random.random() < rate
+
+    def __call__(self, request):
+        if not self.should_profile(request):
+            return self.get_response(request)
+
+        start = time.perf_counter()
+        with profile_queries() as profile:
+            response = self.get_response(request)
+        total = time.perf_counter() - start
+
+        response['Server-Timing'] = _server_timing(profile, total)
+        self.report(request, response, profile)
+        return response
+
+    def report(self, request, response, profile):
+        match = request.resolver_match
+        view_name = match.view_name if match else ''
+        record = {
+            'view': view_name,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            **profile.as_dict(),
+        }
+        message = "%s %s queries=%d db_ms=%.2f duplicates=%d repeated=%d"
+        args = (request.method, view_name or request.path, profile.count,
+                profile.duration * 1000, profile.duplicates, profile.repeated)
+
+        budget = get_budget(view_name)
+        app = match.func.__module__.split('.')[0] if match else None
+        if app not in settings.QUERY_BUDGET_APPS or budget is None or profile.count <= budget:
+            logger.info(message, *args, extra={'query_profile': record})
+            return
+
+        record['budget'] = budget
+        logger.warning(message + " over budget of %d", *args, budget, extra={'query_profile': record})
+        if settings.QUERY_BUDGET_ENFORCE:
+            repeated = ''.join(f'\n  {count}x {sql}' for sql, count in profile.most_repeated())
+            raise QueryBudgetExceeded(
+                f"{view_name} ran {profile.count} queries, budget is {budget}{repeated}"
+            )
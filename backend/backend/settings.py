@@ -1,5 +1,6 @@
 # backend/settings.py
 import os
+import sys
 from pathlib import Path
 import dj_database_url
 
@@ -37,12 +38,14 @@ INSTALLED_APPS = [
     'corsheaders',
     'users',
     'shop',
+    'jobs',
 ]
 
 AUTH_USER_MODEL = 'users.User'
 
 # ────────────── Middleware ──────────────
 MIDDLEWARE = [
+    'backend.profiling.QueryProfilingMiddleware',  # keep first: sees every query
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  # serve static files
@@ -91,6 +94,153 @@ else:
         'default': dj_database_url.config(default=db_url or 'sqlite:///db.sqlite3')
     }
 
+if DATABASES['default']['ENGINE'].endswith('sqlite3'):
+    # Take the write lock at BEGIN so concurrent writers wait on the busy
+    # timeout instead of failing on a read-to-write lock upgrade, and keep
+    # the test database on disk so threaded tests can share it.
+    DATABASES['default'].setdefault('OPTIONS', {}).update({
+        'transaction_mode': 'IMMEDIATE',
+        'timeout': 20,
+    })
+    DATABASES['default']['TEST'] = {'NAME': str(ROOT_DIR / 'test_db.sqlite3')}
+
+# ────────────── Cache ──────────────
+# Local memory by default; set CACHE_URL=redis://host:6379/0 to share the
+# cache (catalog versions, responses, counters) across gunicorn workers.
+# CACHE_URL is required whenever more than one process serves the site
+# or changes the catalog (`check --deploy` reports its absence): a version
+# bump in a local memory cache only reaches the process that made it.
+CACHE_URL = os.getenv('CACHE_URL', '')
+if CACHE_URL.startswith(('redis://', 'rediss://')):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'lindsay-default',
+        }
+    }
+
+# Longest lifetime of version-invalidated entries (catalog responses,
+# category tree, closed-period reports) while the cache is per process
+LOCAL_CACHE_TIMEOUT = int(os.getenv('LOCAL_CACHE_TIMEOUT', 30))
+
+# Cache alias and lifetime for product list/detail responses
+CATALOG_CACHE_ALIAS = os.getenv('CATALOG_CACHE_ALIAS', 'default')
+CATALOG_CACHE_TIMEOUT = int(os.getenv('CATALOG_CACHE_TIMEOUT', 60 * 60 * 24))
+
+# Product view counting (see shop.view_counter): 'memory' buffers per
+# worker, 'cache' aggregates in the shared cache via atomic incr
+VIEW_COUNTER_BACKEND = os.getenv('VIEW_COUNTER_BACKEND', 'memory')
+VIEW_COUNTER_FLUSH_INTERVAL = int(os.getenv('VIEW_COUNTER_FLUSH_INTERVAL', 30))
+VIEW_COUNTER_DEDUP_WINDOW = int(os.getenv('VIEW_COUNTER_DEDUP_WINDOW', 30 * 60))  # 0 disables
+VIEW_COUNTER_IGNORE_BOTS = os.getenv('VIEW_COUNTER_IGNORE_BOTS', 'True').lower() in ('true', '1', 'yes')
+
+# Order numbers reserved per worker per database round trip (1 keeps
+# numbers strictly sequential; larger blocks trade ordering for fewer writes)
+ORDER_NUMBER_BLOCK_SIZE = int(os.getenv('ORDER_NUMBER_BLOCK_SIZE', 1))
+
+# Sales reports (see shop.reports) over periods that ended this many days
+# ago are cached until a change to one of their orders invalidates them
+REPORTS_CLOSED_AFTER_DAYS = int(os.getenv('REPORTS_CLOSED_AFTER_DAYS', 7))
+REPORTS_CACHE_TIMEOUT = int(os.getenv('REPORTS_CACHE_TIMEOUT', 60 * 60 * 24 * 30))
+
+# ────────────── Query profiling ──────────────
+# Share of requests that get a Server-Timing header and a structured SQL
+# log record (see backend.profiling); budgets are enforced while testing
+TESTING = sys.argv[1:2] == ['test']
+QUERY_PROFILING_SAMPLE_RATE = float(os.getenv('QUERY_PROFILING_SAMPLE_RATE', 0.01))
+QUERY_BUDGET_ENFORCE = os.getenv('QUERY_BUDGET_ENFORCE', str(TESTING)).lower() in ('true', '1', 'yes')
+QUERY_BUDGET_APPS = ('shop', 'users')
+QUERY_BUDGET_DEFAULT = int(os.getenv('QUERY_BUDGET_DEFAULT', 10))
+QUERY_BUDGETS = {
+    # url name: max queries per request (None disables the check)
+    'product_list': 4,
+    'product_detail': 4,
+    'product_search': 4,
+    'category_tree': 4,
+    'cart_detail': 4,
+    # writes: session + cart creation, savepoints, then the cart read back
+    'cart_add_item': 20,
+    'cart_item': 15,
+    'cart_merge': 15,
+}
+
+# ────────────── AliExpress ──────────────
+ALIEXPRESS_API_KEY = os.getenv('ALIEXPRESS_API_KEY', '')
+ALIEXPRESS_API_SECRET = os.getenv('ALIEXPRESS_API_SECRET', '')
+ALIEXPRESS_TRACKING_ID = os.getenv('ALIEXPRESS_TRACKING_ID', '')
+ALIEXPRESS_API_URL = os.getenv('ALIEXPRESS_API_URL', 'https://api.aliexpress.com/rest')
+# Keep-alive connections (and calls in flight) per worker, seconds per
+# attempt, and retries for throttled/5xx calls (see aliexpress_client)
+ALIEXPRESS_MAX_CONNECTIONS = int(os.getenv('ALIEXPRESS_MAX_CONNECTIONS', 10))
+ALIEXPRESS_TIMEOUT = float(os.getenv('ALIEXPRESS_TIMEOUT', 10))
+ALIEXPRESS_MAX_RETRIES = int(os.getenv('ALIEXPRESS_MAX_RETRIES', 3))
+# Product detail lookups are coalesced for this many seconds into calls of
+# up to this many ids (see aliexpress_batching)
+ALIEXPRESS_BATCH_WINDOW = float(os.getenv('ALIEXPRESS_BATCH_WINDOW', 0.01))
+ALIEXPRESS_DETAIL_BATCH_SIZE = int(os.getenv('ALIEXPRESS_DETAIL_BATCH_SIZE', 20))
+# Search/detail cache (see aliexpress_cache): entries per worker, seconds
+# fresh and then served stale while refreshing, and an optional shared
+# cache alias ('' keeps the cache per worker)
+ALIEXPRESS_CACHE_SIZE = int(os.getenv('ALIEXPRESS_CACHE_SIZE', 1000))
+ALIEXPRESS_CACHE_TTLS = {'search': 60 * 5, 'details': 60 * 60}
+ALIEXPRESS_CACHE_STALE = {'search': 60 * 60, 'details': 60 * 60 * 24}
+ALIEXPRESS_CACHE_ALIAS = os.getenv('ALIEXPRESS_CACHE_ALIAS', '')
+# Outbound call governor (see aliexpress_governor), shared by the workers
+# through this cache alias: calls per second with a burst allowance, how
+# long a caller may wait for a token, and a breaker that opens for
+# ALIEXPRESS_BREAKER_RESET seconds once this share of at least
+# MIN_CALLS calls in a WINDOW-second window have failed. With a cache
+# local to each process, each of the WEB_CONCURRENCY workers (as passed
+# to gunicorn) gets 1/WEB_CONCURRENCY of the rate and burst
+ALIEXPRESS_GOVERNOR_ALIAS = os.getenv('ALIEXPRESS_GOVERNOR_ALIAS', 'default')
+WEB_CONCURRENCY = int(os.getenv('WEB_CONCURRENCY', 1))
+ALIEXPRESS_RATE_LIMIT = float(os.getenv('ALIEXPRESS_RATE_LIMIT', 10))
+ALIEXPRESS_RATE_BURST = int(os.getenv('ALIEXPRESS_RATE_BURST', 20))
+ALIEXPRESS_RATE_MAX_WAIT = float(os.getenv('ALIEXPRESS_RATE_MAX_WAIT', 1))
+ALIEXPRESS_BREAKER_THRESHOLD = float(os.getenv('ALIEXPRESS_BREAKER_THRESHOLD', 0.5))
+ALIEXPRESS_BREAKER_MIN_CALLS = int(os.getenv('ALIEXPRESS_BREAKER_MIN_CALLS', 10))
+ALIEXPRESS_BREAKER_WINDOW = int(os.getenv('ALIEXPRESS_BREAKER_WINDOW', 30))
+ALIEXPRESS_BREAKER_RESET = int(os.getenv('ALIEXPRESS_BREAKER_RESET', 30))
+
+# ────────────── User activity ──────────────
+# Events are buffered per worker and bulk-inserted (see users.activity):
+# rows per insert, seconds between background flushes (0: only explicit
+# flushes, as in tests), events held before new ones are dropped, days
+# kept before `manage.py prune_activity` deletes them, and the latest days
+# every rollup run recounts in full (see users.rollups)
+ACTIVITY_FLUSH_SIZE = int(os.getenv('ACTIVITY_FLUSH_SIZE', 500))
+ACTIVITY_FLUSH_INTERVAL = float(os.getenv('ACTIVITY_FLUSH_INTERVAL', 0 if TESTING else 5))
+ACTIVITY_MAX_BUFFER = int(os.getenv('ACTIVITY_MAX_BUFFER', 10000))
+ACTIVITY_RETENTION_DAYS = int(os.getenv('ACTIVITY_RETENTION_DAYS', 180))
+ACTIVITY_ROLLUP_TRAILING_DAYS = int(os.getenv('ACTIVITY_ROLLUP_TRAILING_DAYS', 2))
+
+# ────────────── Background jobs ──────────────
+# Database-backed queue run by `manage.py run_worker` (see jobs.worker):
+# jobs claimed per poll, idle sleep, seconds before a silent worker's jobs
+# are requeued, retry backoff base/cap, and days finished jobs are kept
+JOBS_BATCH_SIZE = int(os.getenv('JOBS_BATCH_SIZE', 5))
+JOBS_POLL_INTERVAL = float(os.getenv('JOBS_POLL_INTERVAL', 1))
+JOBS_LOCK_TIMEOUT = int(os.getenv('JOBS_LOCK_TIMEOUT', 60 * 10))
+JOBS_RETRY_BACKOFF = float(os.getenv('JOBS_RETRY_BACKOFF', 10))
+JOBS_RETRY_BACKOFF_MAX = float(os.getenv('JOBS_RETRY_BACKOFF_MAX', 60 * 60))
+JOBS_KEEP_DONE = int(os.getenv('JOBS_KEEP_DONE', 7))
+
+# ────────────── Email ──────────────
+DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', 'Lindsay Classics <no-reply@lindsay.up.railway.app>')
+FRONTEND_URL = os.getenv('FRONTEND_URL', 'https://lindsay.up.railway.app')
+PASSWORD_RESET_URL = FRONTEND_URL + '/reset-password/{uid}/{token}'
+# Newsletter sending (see users.newsletter): messages per progress
+# checkpoint and subscriber rows fetched per database round trip
+NEWSLETTER_BATCH_SIZE = int(os.getenv('NEWSLETTER_BATCH_SIZE', 500))
+NEWSLETTER_CHUNK_SIZE = int(os.getenv('NEWSLETTER_CHUNK_SIZE', 2000))
+
 # ────────────── CORS ──────────────
 CORS_ALLOW_ALL_ORIGINS = DEBUG
 CORS_ALLOWED_ORIGINS = [
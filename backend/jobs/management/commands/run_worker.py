@@ -0,0 +1,48 @@
+import multiprocessing
+import signal
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from jobs.worker import Worker
+
+
+def _work(options):
+    worker = Worker(batch_size=options['batch_size'], poll_interval=options['poll_interval'])
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    return worker.run(burst=options['burst'])
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs, in one process or a pool of them"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1, help='Worker processes to fork')
+        parser.add_argument('--batch-size', type=int, default=None, help='Jobs claimed per poll')
+        parser.add_argument('--poll-interval', type=float, default=None, help='Seconds to sleep when idle')
+        parser.add_argument('--burst', action='store_true', help='Exit once the queue is empty')
+
+    def handle(self, *args, **options):
+        if options['processes'] <= 1:
+            stats = _work(options)
+            self.stdout.write(f"Done {stats['done']}, retried {stats['retried']}, failed {stats['failed']}.")
+            return
+
+        # Children must not share the parent's database connections
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        processes = [context.Process(target=_work, args=(options,)) for _ in range(options['processes'])]
+        for process in processes:
+            process.start()
+
+        def forward(signum, frame):
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()  # SIGTERM: finish the current job, then exit
+
+        signal.signal(signal.SIGTERM, forward)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)  # the terminal already signals the whole group
+        for process in processes:
+            process.join()
+        self.stdout.write(f"{len(processes)} workers stopped.")
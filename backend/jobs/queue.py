@@ -0,0 +1,93 @@
+# backend/jobs/queue.py
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Job
+
+_registry = {}
+
+
+class Task:
+    """A function the worker can run by name; created by ``@task``"""
+
+    def __init__(self, fn, name, priority=0, max_attempts=3, retry_backoff=None):
+        self.fn = fn
+        self.name = name
+        self.priority = priority
+        self.max_attempts = max_attempts
+        self.retry_backoff = settings.JOBS_RETRY_BACKOFF if retry_backoff is None else retry_backoff
+        self.__doc__ = fn.__doc__
+
+    def __call__(self, *args, **kwargs):
+        return self.fn(*args, **kwargs)
+
+    def __repr__(self):
+        return f'<Task {self.name}>'
+
+    def enqueue(self, *args, **kwargs):
+        """Queue a call with the task's defaults; returns the Job"""
+        return self.schedule(args, kwargs)
+
+    def schedule(self, args=(), kwargs=None, priority=None, delay=None, run_at=None, idempotency_key=None):
+        """Queue a call with explicit options; see ``enqueue()``"""
+        return enqueue(
+            self.name, args, kwargs,
+            priority=self.priority if priority is None else priority,
+            max_attempts=self.max_attempts, delay=delay, run_at=run_at, idempotency_key=idempotency_key,
+        )
+
+    def backoff(self, attempts):
+        """Seconds before retry number ``attempts``: exponential, half jittered"""
+        delay = min(settings.JOBS_RETRY_BACKOFF_MAX, self.retry_backoff * 2 ** (attempts - 1))
+        return random.uniform(delay / 2, delay)
+
+
+def task(fn=None, *, name=None, priority=0, max_attempts=3, retry_backoff=None):
+    """Register a function as a background task.
+
+    Arguments must be JSON-serializable, so pass ids rather than model
+    instances. Calling the task still runs it inline; ``.enqueue()``
+    queues it for ``run_worker``::
+
+        @task(priority=10)
+        def send_receipt(order_id):
+            ...
+
+        send_receipt.enqueue(order.pk)
+    """
+    def register(fn):
+        registered = Task(fn, name or f'{fn.__module__}.{fn.__qualname__}', priority, max_attempts, retry_backoff)
+        _registry[registered.name] = registered
+        return registered
+    return register(fn) if fn is not None else register
+
+
+def get_task(name):
+    return _registry.get(name)
+
+
+def enqueue(name, args=(), kwargs=None, priority=0, max_attempts=3, delay=None, run_at=None, idempotency_key=None):
+    """Insert a Job row and return it; costs a single INSERT.
+
+    ``delay`` (seconds or timedelta) or ``run_at`` hold the job back until
+    then. With an ``idempotency_key`` a job queued, running or done (and
+    not yet purged) under that key is returned instead of a new one. A job
+    that failed for good gives its key up, so the call can be queued again.
+    Inside a transaction the job only becomes visible to workers once it
+    commits, so it never runs against rows that were rolled back.
+    """
+    if run_at is None:
+        run_at = timezone.now()
+        if delay:
+            run_at += delay if isinstance(delay, timedelta) else timedelta(seconds=delay)
+    fields = {
+        'name': name, 'args': list(args), 'kwargs': kwargs or {}, 'priority': priority,
+        'max_attempts': max_attempts, 'run_at': run_at,
+    }
+    if idempotency_key is None:
+        return Job.objects.create(**fields)
+    job, _ = Job.objects.get_or_create(idempotency_key=idempotency_key, defaults=fields)
+    return job
@@ -0,0 +1,143 @@
+from datetime import timedelta
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from .models import Job
+from .queue import enqueue, task
+from .worker import Worker
+
+calls = []
+
+
+@task(name='tests.record')
+def record(value):
+    calls.append(value)
+
+
+@task(name='tests.flaky', max_attempts=3, retry_backoff=0)
+def flaky(fail_times):
+    calls.append('attempt')
+    if calls.count('attempt') <= fail_times:
+        raise RuntimeError('boom')
+
+
+@override_settings(JOBS_POLL_INTERVAL=0)
+class JobQueueTests(TestCase):
+
+    def setUp(self):
+        calls.clear()
+
+    def test_jobs_run_by_priority_and_schedule(self):
+        record.enqueue('low')
+        record.schedule(['high'], priority=5)
+        record.schedule(['later'], delay=60)
+        record('inline')
+        self.assertEqual(Worker(batch_size=1).run(burst=True)['done'], 2)
+        self.assertEqual(calls, ['inline', 'high', 'low'])
+        self.assertEqual(Job.objects.filter(status=Job.QUEUED).get().args, ['later'])
+
+        Job.objects.filter(status=Job.QUEUED).update(run_at=timezone.now())
+        Worker().run(burst=True)
+        self.assertEqual(calls[-1], 'later')
+        self.assertFalse(Job.objects.exclude(status=Job.DONE).exists())
+
+    def test_failures_are_retried_then_given_up(self):
+        flaky.enqueue(1)
+        with self.assertLogs('jobs.worker', 'WARNING'):
+            stats = Worker().run(burst=True)
+        self.assertEqual(stats, {'done': 1, 'retried': 1, 'failed': 0})
+        job = Job.objects.get()
+        self.assertEqual((job.status, job.attempts, job.last_error), (Job.DONE, 2, ''))
+
+        calls.clear()
+        flaky.enqueue(5)
+        with self.assertLogs('jobs.worker', 'WARNING') as logs:
+            stats = Worker().run(burst=True)
+        self.assertEqual(stats, {'done': 0, 'retried': 2, 'failed': 1})
+        job = Job.objects.latest('id')
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 3))
+        self.assertIn('RuntimeError: boom', job.last_error)
+        self.assertIn('failed for good', logs.output[-1])
+
+    def test_retry_is_delayed_by_backoff(self):
+        job = enqueue('tests.flaky', [5], max_attempts=2)
+        flaky.retry_backoff = 30
+        self.addCleanup(setattr, flaky, 'retry_backoff', 0)
+        with self.assertLogs('jobs.worker', 'WARNING'):
+            Worker().run(burst=True)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.QUEUED)
+        self.assertGreater(job.run_at, timezone.now() + timedelta(seconds=10))
+
+    def test_idempotency_key_deduplicates(self):
+        first = record.schedule(['a'], idempotency_key='once')
+        second = record.schedule(['b'], idempotency_key='once')
+        self.assertEqual(first.pk, second.pk)
+        Worker().run(burst=True)
+        self.assertEqual(record.schedule(['c'], idempotency_key='once').status, Job.DONE)
+        self.assertEqual(calls, ['a'])
+
+    def test_failed_jobs_free_their_key_and_are_purged(self):
+        failed = enqueue('tests.flaky', [5], max_attempts=1, idempotency_key='retry-me')
+        with self.assertLogs('jobs.worker', 'ERROR'):
+            Worker().run(burst=True)
+        failed.refresh_from_db()
+        self.assertEqual((failed.status, failed.idempotency_key), (Job.FAILED, None))
+
+        again = enqueue('tests.flaky', [0], idempotency_key='retry-me')
+        self.assertNotEqual(again.pk, failed.pk)
+        Worker().run(burst=True)
+        self.assertEqual(Job.objects.get(pk=again.pk).status, Job.DONE)
+
+        Job.objects.update(finished_at=timezone.now() - timedelta(days=30))
+        self.assertEqual(Worker().purge(), 2)
+
+    def test_workers_claim_disjoint_jobs(self):
+        for i in range(6):
+            record.enqueue(i)
+        first, second = Worker(name='a', batch_size=4), Worker(name='b', batch_size=4)
+        claimed = first.claim() + second.claim()
+        self.assertEqual(sorted(job.args[0] for job in claimed), list(range(6)))
+        self.assertEqual(second.claim(), [])
+
+    def test_unknown_task_fails_and_abandoned_jobs_are_recovered(self):
+        enqueue('tests.missing', max_attempts=1)
+        with self.assertLogs('jobs.worker', 'ERROR'):
+            Worker().run(burst=True)
+        self.assertIn('LookupError', Job.objects.get().last_error)
+
+        job = record.enqueue('x')
+        Worker(name='dead').claim()
+        Job.objects.filter(pk=job.pk).update(claimed_at=timezone.now() - timedelta(hours=1))
+        with self.assertLogs('jobs.worker', 'WARNING'):
+            Worker(lock_timeout=60).run(burst=True)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.DONE, 2))
+
+    def test_jobs_recovered_while_waiting_in_a_batch_run_once(self):
+        def takeover():
+            # This job outlives the lock: another worker requeues and runs the rest of its batch
+            Job.objects.filter(status=Job.RUNNING).exclude(name='tests.takeover').update(
+                claimed_at=timezone.now() - timedelta(hours=1),
+            )
+            with self.assertLogs('jobs.worker', 'WARNING'):
+                Worker(name='other', lock_timeout=60).run(burst=True)
+
+        task(name='tests.takeover')(takeover).schedule(priority=10)
+        record.enqueue('once')
+        with self.assertLogs('jobs.worker', 'WARNING') as logs:
+            Worker(name='slow', batch_size=2).run(burst=True)
+        self.assertEqual(calls, ['once'])
+        self.assertIn('recovered by another worker', logs.output[-1])
+        self.assertFalse(Job.objects.exclude(status=Job.DONE).exists())
+
+    def test_stopped_worker_releases_unstarted_jobs(self):
+        for i in range(3):
+            record.enqueue(i)
+        worker = Worker(batch_size=3)
+        task(name='tests.stop')(worker.stop).schedule(priority=10)  # claimed first, with two of the others
+        worker.run()
+        self.assertEqual(calls, [])
+        self.assertEqual(Job.objects.get(name='tests.stop').status, Job.DONE)
+        self.assertEqual(list(Job.objects.filter(status=Job.QUEUED).values_list('attempts', flat=True)), [0, 0, 0])
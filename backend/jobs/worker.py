@@ -0,0 +1,167 @@
+# backend/jobs/worker.py
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+from datetime import timedelta
+from itertools import count
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+from .queue import get_task
+
+logger = logging.getLogger(__name__)
+
+_current = threading.local()
+
+
+def heartbeat():
+    """Tell the queue the running job is alive; long jobs call this now and then.
+
+    Pushes the job's claim forward so it is not mistaken for abandoned once
+    it runs past JOBS_LOCK_TIMEOUT. A no-op outside a worker.
+    """
+    job = getattr(_current, 'job', None)
+    if job is not None:
+        Job.objects.filter(pk=job.pk, claimed_by=job.claimed_by).update(claimed_at=timezone.now())
+
+
+class Worker:
+    """Claims runnable jobs from the Job table and runs them.
+
+    Claiming is a conditional UPDATE from ``queued`` to ``running`` tagged
+    with a per-batch token, so several workers (processes or hosts) can
+    poll the same table without a broker or row locks: a job only goes to
+    the worker whose UPDATE matched it. Jobs come out by priority, then
+    ``run_at``. A failure is retried after the task's backoff until
+    ``max_attempts`` is reached. Jobs left ``running`` for longer than
+    ``lock_timeout`` by a worker that died are put back in the queue.
+    Jobs wait in a claimed batch without a heartbeat, so each one is
+    re-claimed just before it starts (see ``start()``); one recovered and
+    run by another worker meanwhile is skipped, never run twice.
+    """
+
+    def __init__(self, name=None, batch_size=None, poll_interval=None, lock_timeout=None):
+        self.name = (name or f'{socket.gethostname()}:{os.getpid()}')[:48]
+        self.batch_size = batch_size or settings.JOBS_BATCH_SIZE
+        self.poll_interval = settings.JOBS_POLL_INTERVAL if poll_interval is None else poll_interval
+        self.lock_timeout = timedelta(seconds=lock_timeout or settings.JOBS_LOCK_TIMEOUT)
+        self.stats = {'done': 0, 'retried': 0, 'failed': 0}
+        self._batches = count(1)
+        self._stopping = False
+        self._maintained_at = 0
+
+    def stop(self, *args):
+        """Finish the job in hand, then return from ``run()``"""
+        self._stopping = True
+
+    def claim(self):
+        now = timezone.now()
+        ids = list(
+            Job.objects.filter(status=Job.QUEUED, run_at__lte=now)
+            .order_by('-priority', 'run_at', 'id')
+            .values_list('pk', flat=True)[:self.batch_size]
+        )
+        if not ids:
+            return []
+        token = f'{self.name}:{next(self._batches)}'
+        Job.objects.filter(pk__in=ids, status=Job.QUEUED).update(
+            status=Job.RUNNING, claimed_by=token, claimed_at=now, attempts=F('attempts') + 1,
+        )
+        return list(Job.objects.filter(claimed_by=token, status=Job.RUNNING).order_by('-priority', 'run_at', 'id'))
+
+    def start(self, job):
+        """Renew the claim on ``job`` right before running it; False when it is no longer ours"""
+        return bool(Job.objects.filter(pk=job.pk, claimed_by=job.claimed_by, status=Job.RUNNING).update(
+            claimed_at=timezone.now(),
+        ))
+
+    def execute(self, job):
+        task = get_task(job.name)
+        _current.job = job
+        try:
+            if task is None:
+                raise LookupError(f'No task registered as {job.name!r}')
+            task.fn(*job.args, **job.kwargs)
+        except Exception:
+            self.failed(job, task, traceback.format_exc())
+        else:
+            self._finish(job, status=Job.DONE, finished_at=timezone.now(), last_error='')
+            self.stats['done'] += 1
+        finally:
+            _current.job = None
+
+    def failed(self, job, task, error):
+        if task is not None and job.attempts < job.max_attempts:
+            delay = task.backoff(job.attempts)
+            logger.warning("Job %s failed (attempt %d/%d), retrying in %.0fs", job, job.attempts, job.max_attempts, delay)
+            self._finish(job, status=Job.QUEUED, run_at=timezone.now() + timedelta(seconds=delay), last_error=error)
+            self.stats['retried'] += 1
+        else:
+            logger.error("Job %s failed for good:\n%s", job, error)
+            # The key is given up so the same call can be queued again
+            self._finish(job, status=Job.FAILED, finished_at=timezone.now(), last_error=error, idempotency_key=None)
+            self.stats['failed'] += 1
+
+    def _finish(self, job, **fields):
+        # Only while still ours: a job recovered from us may be running elsewhere
+        Job.objects.filter(pk=job.pk, claimed_by=job.claimed_by, status=Job.RUNNING).update(
+            claimed_by='', claimed_at=None, **fields,
+        )
+
+    def release(self, jobs):
+        """Hand claimed jobs that were never started back to the queue"""
+        Job.objects.filter(pk__in=[job.pk for job in jobs], status=Job.RUNNING, claimed_by=jobs[0].claimed_by).update(
+            status=Job.QUEUED, claimed_by='', claimed_at=None, attempts=F('attempts') - 1,
+        )
+
+    def recover(self):
+        """Requeue (or fail) jobs whose worker stopped reporting back"""
+        expired = Job.objects.filter(status=Job.RUNNING, claimed_at__lt=timezone.now() - self.lock_timeout)
+        failed = expired.filter(attempts__gte=F('max_attempts')).update(
+            status=Job.FAILED, claimed_by='', claimed_at=None, finished_at=timezone.now(), last_error='Worker lost',
+            idempotency_key=None,
+        )
+        requeued = expired.update(status=Job.QUEUED, claimed_by='', claimed_at=None, last_error='Worker lost')
+        if failed or requeued:
+            logger.warning("Recovered %d abandoned jobs (%d failed)", failed + requeued, failed)
+        return failed + requeued
+
+    def purge(self):
+        """Delete done and failed jobs that finished over JOBS_KEEP_DONE days ago"""
+        cutoff = timezone.now() - timedelta(days=settings.JOBS_KEEP_DONE)
+        return Job.objects.filter(status__in=[Job.DONE, Job.FAILED], finished_at__lt=cutoff).delete()[0]
+
+    def maintain(self):
+        if time.monotonic() - self._maintained_at >= self.lock_timeout.total_seconds() / 4:
+            self._maintained_at = time.monotonic()
+            self.recover()
+            self.purge()
+
+    def run(self, burst=False):
+        """Process jobs until stopped; ``burst`` returns once the queue is idle"""
+        while not self._stopping:
+            if not connection.in_atomic_block:  # a caller's transaction, e.g. in tests
+                close_old_connections()
+            self.maintain()
+            jobs = self.claim()
+            if not jobs:
+                if burst:
+                    break
+                time.sleep(self.poll_interval)
+                continue
+            for index, job in enumerate(jobs):
+                if self._stopping:
+                    self.release(jobs[index:])
+                    break
+                if not self.start(job):
+                    logger.warning("Job %s was recovered by another worker, skipping it", job)
+                    continue
+                self.execute(job)
+        return self.stats
@@ -3,7 +3,12 @@ from django.utils.html import format_html
 from django.contrib import admin
 from django.utils.html import format_html
 from django.urls import reverse
-from django.db.models import Count, Sum, Avg
+from django.db import transaction
+from django.db.models import Count, Sum, Avg, Q
+from . import reports, search
+from .categories import invalidate_tree
+from .response_cache import invalidate_catalog
+from .services import ratings
 from .models import Category, Product, ProductReview, Cart, CartItem, Order, OrderItem, Wishlist
 
 class CartItemInline(admin.TabularInline):
@@ -14,8 +19,12 @@ class CartItemInline(admin.TabularInline):
     readonly_fields = ['total']
     can_delete = True
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('product')
+    
     def total(self, obj):
-        return obj.total
+        # The blank "add another" row has no product or price yet
+        return obj.total if obj.pk else '-'
     total.short_description = 'Total'
 
 
@@ -27,8 +36,12 @@ class OrderItemInline(admin.TabularInline):
     readonly_fields = ['total']
     can_delete = False
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('product')
+    
     def total(self, obj):
-        return obj.total
+        # The blank "add another" row has no product or price yet
+        return obj.total if obj.pk else '-'
     total.short_description = 'Total'
 
 
@@ -79,12 +92,16 @@ class CategoryAdmin(admin.ModelAdmin):
         }),
     )
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(product_total=Count('products'))
+    
     def product_count(self, obj):
         """Count products in category"""
-        count = obj.products.count()
+        count = obj.product_total
         url = reverse('admin:shop_product_changelist') + f'?category__id__exact={obj.id}'
         return format_html('<a href="{}">{}</a>', url, count)
     product_count.short_description = 'Products'
+    product_count.admin_order_field = 'product_total'
     
     def category_icon(self, obj):
         """Show category icon"""
@@ -111,10 +128,12 @@ class ProductAdmin(admin.ModelAdmin):
     
     list_editable = ['price', 'quantity', 'is_active', 'is_featured']
     
-    readonly_fields = ['views_count', 'sales_count', 'created_at', 'updated_at', 'product_preview']
+    readonly_fields = ['views_count', 'sales_count', 'rating_avg', 'rating_count', 'created_at', 'updated_at', 'product_preview']
     
     list_per_page = 25
     
+    list_select_related = ['category']
+    
     fieldsets = (
         ('Basic Information', {
             'fields': ('category', 'name', 'slug', 'sku', 'description', 'short_description')
@@ -136,7 +155,7 @@ class ProductAdmin(admin.ModelAdmin):
             'fields': ('is_featured', 'is_new', 'is_active')
         }),
         ('Statistics', {
-            'fields': ('views_count', 'sales_count'),
+            'fields': ('views_count', 'sales_count', 'rating_avg', 'rating_count'),
             'classes': ('collapse',)
         }),
         ('Timestamps', {
@@ -147,6 +166,18 @@ class ProductAdmin(admin.ModelAdmin):
     
     actions = ['make_featured', 'remove_featured', 'make_active', 'make_inactive']
     
+    # Upper bound on full-text matches handed to the changelist
+    search_result_limit = 1000
+    
+    def get_search_results(self, request, queryset, search_term):
+        """Use the full-text index instead of icontains scans"""
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        ranked = search.search(search_term, limit=self.search_result_limit, prefix=True, active_only=False)
+        ids = [product_id for product_id, _ in ranked]
+        return queryset.filter(Q(id__in=ids) | Q(sku=search_term)), False
+    
     def product_image(self, obj):
         """Show product thumbnail"""
         if obj.image:
@@ -179,24 +210,30 @@ class ProductAdmin(admin.ModelAdmin):
     def make_featured(self, request, queryset):
         """Make selected products featured"""
         updated = queryset.update(is_featured=True)
+        invalidate_catalog()
         self.message_user(request, f'{updated} products marked as featured.')
     make_featured.short_description = "Mark as featured"
     
     def remove_featured(self, request, queryset):
         """Remove featured from selected products"""
         updated = queryset.update(is_featured=False)
+        invalidate_catalog()
         self.message_user(request, f'{updated} products removed from featured.')
     remove_featured.short_description = "Remove from featured"
     
     def make_active(self, request, queryset):
         """Make selected products active"""
         updated = queryset.update(is_active=True)
+        invalidate_tree()
+        invalidate_catalog()
         self.message_user(request, f'{updated} products activated.')
     make_active.short_description = "Activate products"
     
     def make_inactive(self, request, queryset):
         """Make selected products inactive"""
         updated = queryset.update(is_active=False)
+        invalidate_tree()
+        invalidate_catalog()
         self.message_user(request, f'{updated} products deactivated.')
     make_inactive.short_description = "Deactivate products"
 
@@ -214,6 +251,8 @@ class ProductReviewAdmin(admin.ModelAdmin):
     
     search_fields = ['product__name', 'user__email', 'comment']
     
+    list_select_related = ['product', 'user']
+    
     list_editable = ['is_approved']
     
     readonly_fields = ['created_at', 'updated_at']
@@ -242,13 +281,13 @@ class ProductReviewAdmin(admin.ModelAdmin):
     
     def approve_reviews(self, request, queryset):
         """Approve selected reviews"""
-        updated = queryset.update(is_approved=True)
+        updated = ratings.set_approved(queryset, True)
         self.message_user(request, f'{updated} reviews approved.')
     approve_reviews.short_description = "Approve selected reviews"
     
     def disapprove_reviews(self, request, queryset):
         """Disapprove selected reviews"""
-        updated = queryset.update(is_approved=False)
+        updated = ratings.set_approved(queryset, False)
         self.message_user(request, f'{updated} reviews disapproved.')
     disapprove_reviews.short_description = "Disapprove selected reviews"
 
@@ -267,15 +306,22 @@ class CartAdmin(admin.ModelAdmin):
     
     inlines = [CartItemInline]
     
+    list_select_related = ['user']
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_totals()
+    
     def total_items(self, obj):
         """Total items in cart"""
         return obj.total_items
     total_items.short_description = 'Items'
+    total_items.admin_order_field = 'item_count'
     
     def subtotal(self, obj):
         """Cart subtotal"""
         return f"K{obj.subtotal:.2f}"
     subtotal.short_description = 'Subtotal'
+    subtotal.admin_order_field = 'subtotal_amount'
 
 
 # backend/shop/admin.py - Fixed OrderAdmin
@@ -297,6 +343,8 @@ class OrderAdmin(admin.ModelAdmin):
     
     inlines = [OrderItemInline]
     
+    list_select_related = ['user']
+    
     fieldsets = (
         ('Order Information', {
             'fields': ('order_number', 'user', 'status', 'payment_status', 'payment_method')
@@ -386,24 +434,29 @@ class OrderAdmin(admin.ModelAdmin):
     def mark_as_processing(self, request, queryset):
         """Mark orders as processing"""
         updated = queryset.update(status='processing')
+        # update() skips post_save, which drops reports covering old orders
+        transaction.on_commit(reports.invalidate_reports)
         self.message_user(request, f'{updated} orders marked as processing.')
     mark_as_processing.short_description = "Mark as processing"
     
     def mark_as_shipped(self, request, queryset):
         """Mark orders as shipped"""
         updated = queryset.update(status='shipped')
+        transaction.on_commit(reports.invalidate_reports)
         self.message_user(request, f'{updated} orders marked as shipped.')
     mark_as_shipped.short_description = "Mark as shipped"
     
     def mark_as_delivered(self, request, queryset):
         """Mark orders as delivered"""
         updated = queryset.update(status='delivered')
+        transaction.on_commit(reports.invalidate_reports)
         self.message_user(request, f'{updated} orders marked as delivered.')
     mark_as_delivered.short_description = "Mark as delivered"
     
     def mark_as_cancelled(self, request, queryset):
         """Mark orders as cancelled"""
         updated = queryset.update(status='cancelled')
+        transaction.on_commit(reports.invalidate_reports)
         self.message_user(request, f'{updated} orders marked as cancelled.')
     mark_as_cancelled.short_description = "Mark as cancelled"
 
@@ -422,7 +475,13 @@ class WishlistAdmin(admin.ModelAdmin):
     
     filter_horizontal = ['products']
     
+    list_select_related = ['user']
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(product_total=Count('products'))
+    
     def product_count(self, obj):
         """Count products in wishlist"""
-        return obj.products.count()
+        return obj.product_total
     product_count.short_description = 'Products'
+    product_count.admin_order_field = 'product_total'
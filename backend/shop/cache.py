@@ -0,0 +1,53 @@
+# backend/shop/cache.py
+import time
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+
+def is_shared(backend=None):
+    """Whether every worker process sees the same entries (not locmem/dummy)"""
+    backend = caches['default'] if backend is None else backend
+    return not isinstance(backend, (LocMemCache, DummyCache))
+
+
+def cache_timeout(timeout, backend=None):
+    """``timeout`` capped to LOCAL_CACHE_TIMEOUT when the cache is per process.
+
+    Version bumps only reach the process that made them unless the cache
+    is shared, so per-process entries must expire on their own quickly.
+    """
+    if is_shared(backend):
+        return timeout
+    return min(timeout, settings.LOCAL_CACHE_TIMEOUT)
+
+
+def _version_key(namespace):
+    return f'{namespace}:version'
+
+
+def get_version(namespace):
+    """Current version number for a cache namespace"""
+    key = _version_key(namespace)
+    version = cache.get(key)
+    if version is None:
+        # Seed from the clock so a lost counter never reuses an old version
+        cache.add(key, int(time.time() * 1000), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(namespace):
+    """Invalidate every entry cached under the namespace's current version"""
+    key = _version_key(namespace)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        get_version(namespace)
+        return cache.incr(key)
+
+
+def versioned_key(namespace, *parts):
+    return ':'.join([namespace, f'v{get_version(namespace)}', *map(str, parts)])
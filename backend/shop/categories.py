@@ -0,0 +1,93 @@
+# backend/shop/categories.py
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db.models import Count, Q
+
+from .cache import bump_version, cache_timeout, versioned_key
+from .models import Category, Product
+
+TREE_NAMESPACE = 'category_tree'
+TREE_TIMEOUT = 60 * 60 * 24  # the version bump, not expiry, keeps it fresh
+
+
+def invalidate_tree():
+    bump_version(TREE_NAMESPACE)
+
+
+def build_tree():
+    """Build the active category hierarchy with product counts in two queries"""
+    rows = (
+        Category.objects.filter(is_active=True)
+        .order_by('path')
+        .values('id', 'name', 'slug', 'image', 'parent_id', 'path', 'depth')
+    )
+    counts = dict(
+        Product.objects.filter(is_active=True)
+        .values_list('category_id')
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+
+    nodes = {}
+    ordered = []
+    roots = []
+    # Path order guarantees every parent is seen before its children
+    for row in rows:
+        parent_id = row['parent_id']
+        if parent_id is not None and parent_id not in nodes:
+            continue  # an ancestor is inactive, so the branch is hidden
+        node = {
+            'id': row['id'],
+            'name': row['name'],
+            'slug': row['slug'],
+            'image': default_storage.url(row['image']) if row['image'] else None,
+            'depth': row['depth'],
+            'product_count': counts.get(row['id'], 0),
+            'total_product_count': counts.get(row['id'], 0),
+            'children': [],
+        }
+        nodes[row['id']] = node
+        ordered.append((row, node))
+        if parent_id is None:
+            roots.append(node)
+        else:
+            nodes[parent_id]['children'].append(node)
+
+    # Children come after parents, so walking backwards rolls totals upwards
+    for row, node in reversed(ordered):
+        if row['parent_id'] is not None:
+            nodes[row['parent_id']]['total_product_count'] += node['total_product_count']
+
+    for row, node in ordered:
+        node['children'].sort(key=lambda child: child['name'])
+
+    return {
+        'tree': roots,
+        'paths': {row['id']: row['path'] for row, _ in ordered},
+    }
+
+
+def get_tree():
+    key = versioned_key(TREE_NAMESPACE, 'tree')
+    data = cache.get(key)
+    if data is None:
+        data = build_tree()
+        cache.set(key, data, cache_timeout(TREE_TIMEOUT))
+    return data
+
+
+def get_category_path(category_id):
+    path = get_tree()['paths'].get(category_id)
+    if path is None:
+        # Inactive categories are not in the cached tree
+        path = Category.objects.filter(pk=category_id).values_list('path', flat=True).first()
+    return path
+
+
+def subtree_condition(category_id, field='category'):
+    """Q matching rows whose category lies in the subtree of category_id"""
+    path = get_category_path(category_id)
+    if not path:
+        return Q(pk__in=[])
+    lower, upper = Category.subtree_bounds(path)
+    return Q(**{f'{field}__path__gte': lower, f'{field}__path__lt': upper})
@@ -0,0 +1,34 @@
+# backend/shop/checks.py
+from django.conf import settings
+from django.core.cache import caches
+from django.core.checks import Error, Tags, Warning, register
+
+from .cache import is_shared
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """Catalog, category tree and report invalidation need a cache every process shares"""
+    errors = []
+    for alias in dict.fromkeys(['default', settings.CATALOG_CACHE_ALIAS]):
+        if not is_shared(caches[alias]):
+            errors.append(Error(
+                f'Cache {alias!r} is local to each process.',
+                hint='Set CACHE_URL to a Redis URL so cache invalidation reaches every worker.',
+                id='shop.E001',
+            ))
+    return errors
+
+
+@register(Tags.caches, deploy=True)
+def check_governor_cache(app_configs, **kwargs):
+    """The AliExpress rate limit is only global when its bucket is shared"""
+    alias = settings.ALIEXPRESS_GOVERNOR_ALIAS
+    if is_shared(caches[alias]):
+        return []
+    return [Warning(
+        f'AliExpress governor cache {alias!r} is local to each process; '
+        f'each of the {settings.WEB_CONCURRENCY} workers enforces 1/{settings.WEB_CONCURRENCY} of the rate limit.',
+        hint='Point ALIEXPRESS_GOVERNOR_ALIAS at a shared cache, or keep WEB_CONCURRENCY equal to the worker count.',
+        id='shop.W001',
+    )]
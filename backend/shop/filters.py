@@ -0,0 +1,126 @@
+# backend/shop/filters.py
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+
+from .categories import subtree_condition
+
+
+# ============================================
+# Value parsers
+# ============================================
+
+def parse_decimal(value):
+    try:
+        return Decimal(value)
+    except InvalidOperation:
+        raise ValueError(f"'{value}' is not a number")
+
+
+def parse_bool(value):
+    lowered = value.lower()
+    if lowered in ('true', '1', 'yes'):
+        return True
+    if lowered in ('false', '0', 'no'):
+        return False
+    raise ValueError(f"'{value}' is not a boolean")
+
+
+def parse_list(value):
+    items = [item.strip() for item in value.split(',') if item.strip()]
+    if not items:
+        raise ValueError('Expected at least one value')
+    return items
+
+
+def parse_int(value):
+    return int(value)
+
+
+# ============================================
+# Filter builders
+# ============================================
+
+def category_subtree(category_id):
+    """Match products in the category or any of its descendants"""
+    return subtree_condition(category_id)
+
+
+def in_stock(value):
+    return Q(quantity__gt=0) if value else Q(quantity__lte=0)
+
+
+def flag(field):
+    """Builder matching a boolean column through its index.
+
+    ``field=True`` compiles to a bare ``WHERE field``, which SQLite cannot
+    use to seek an index on that column; ``IN (...)`` compiles to an
+    equality every backend can.
+    """
+    return lambda value: Q(**{f'{field}__in': [value]})
+
+
+# ============================================
+# Product catalog filter/sort declaration
+# ============================================
+
+class ProductFilterSet:
+    """Declarative filters and sorts for the product catalog.
+
+    ``filters`` maps a query param to ``(parser, lookup)`` where ``lookup`` is
+    either an ORM lookup or a callable returning a ``Q``. ``sorts`` maps the
+    ``sort=`` param to a deterministic ordering usable by KeysetPagination.
+    Every entry here is backed by an index declared on ``Product.Meta``.
+    """
+
+    filters = {
+        'category': (parse_int, category_subtree),
+        'min_price': (parse_decimal, 'price__gte'),
+        'max_price': (parse_decimal, 'price__lte'),
+        'brand': (parse_list, 'brand__in'),
+        'color': (parse_list, 'color__in'),
+        'size': (parse_list, 'size__in'),
+        'is_featured': (parse_bool, flag('is_featured')),
+        'is_new': (parse_bool, flag('is_new')),
+        'in_stock': (parse_bool, in_stock),
+    }
+
+    sorts = {
+        'newest': ('-created_at', '-id'),
+        'price': ('price', 'id'),
+        '-price': ('-price', '-id'),
+        'best_selling': ('-sales_count', '-id'),
+        'most_viewed': ('-views_count', '-id'),
+    }
+
+    default_sort = 'newest'
+
+    def __init__(self, params):
+        self.params = params
+
+    def get_condition(self):
+        condition = Q()
+        errors = {}
+        for param, (parser, lookup) in self.filters.items():
+            raw = self.params.get(param)
+            if raw in (None, ''):
+                continue
+            try:
+                value = parser(raw)
+            except ValueError as e:
+                errors[param] = str(e)
+                continue
+            condition &= lookup(value) if callable(lookup) else Q(**{lookup: value})
+        if errors:
+            raise ValidationError(errors)
+        return condition
+
+    def get_ordering(self):
+        sort = self.params.get('sort') or self.default_sort
+        if sort not in self.sorts:
+            raise ValidationError({'sort': f"Unknown sort '{sort}'. Choose from: {', '.join(self.sorts)}"})
+        return self.sorts[sort]
+
+    def filter_queryset(self, queryset):
+        return queryset.filter(self.get_condition()).order_by(*self.get_ordering())
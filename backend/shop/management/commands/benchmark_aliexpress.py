@@ -0,0 +1,63 @@
+import asyncio
+import time
+
+from django.core.management.base import BaseCommand
+
+from shop.services.aliexpress_batching import ProductDetailBatcher
+from shop.services.aliexpress_client import AliExpressClient, AliExpressTransport
+from shop.services.aliexpress_fake import FakeAliExpressServer
+
+
+class Command(BaseCommand):
+    help = "Measure AliExpress client throughput against the local fake API"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=20, help='Pooled connections / calls in flight')
+        parser.add_argument('--latency', type=float, default=0.05, help='Fake server latency per call (s)')
+        parser.add_argument('--failures', type=int, default=0, help='Script this many 503s to exercise retries')
+
+    def handle(self, *args, **options):
+        count = options['requests']
+        with FakeAliExpressServer(latency=options['latency']) as server:
+            transport = AliExpressTransport(
+                max_connections=options['concurrency'], backoff_base=0.01, backoff_max=0.1,
+            )
+            client = AliExpressClient(transport=transport, base_url=server.url)
+            ids = list(range(1, count + 1))
+
+            # Blocking facade, one call after another (a tenth of the calls)
+            sequential = max(count // 10, 1)
+            started = time.perf_counter()
+            for product_id in ids[:sequential]:
+                client.get_product_details([product_id])
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f'sync:  {sequential} calls in {elapsed:.2f}s ({sequential / elapsed:.1f}/s)')
+
+            server.fail_next(options['failures'])
+            connections = server.connections
+
+            async def fan_out():
+                return await asyncio.gather(*(client.aget_product_details([pid]) for pid in ids))
+
+            started = time.perf_counter()
+            results = asyncio.run(fan_out())
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f'async: {count} calls in {elapsed:.2f}s ({count / elapsed:.1f}/s), '
+                f'{sum(1 for r in results if r)} ok, {server.connections - connections} new connections, '
+                f'{transport.stats["retries"]} retries'
+            )
+
+            # Same lookups coalesced into multi-id detail calls
+            batcher = ProductDetailBatcher(client)
+            requests_before = len(server.requests)
+            started = time.perf_counter()
+            results = asyncio.run(batcher.aget_many(ids))
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f'batched: {count} lookups in {elapsed:.2f}s, '
+                f'{len(server.requests) - requests_before} API calls'
+            )
+            batcher.close()
+            transport.close()
@@ -0,0 +1,79 @@
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from shop.models import Cart, CartItem, Category, Order, Product
+from shop.services.checkout import checkout
+
+CUSTOMER = {
+    'first_name': 'Bench', 'last_name': 'Buyer', 'email': 'bench@example.com',
+    'phone': '+260970000000', 'address_line1': '1 Cairo Road', 'city': 'Lusaka',
+    'postal_code': '10101',
+}
+
+
+class Command(BaseCommand):
+    help = "Stress checkout with parallel buyers competing for limited stock"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--buyers', type=int, default=200)
+        parser.add_argument('--stock', type=int, default=50)
+        parser.add_argument('--quantity', type=int, default=1, help='Units per buyer')
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--keep', action='store_true', help='Keep the generated data')
+
+    def handle(self, *args, **options):
+        tag = uuid.uuid4().hex[:8]
+        User = get_user_model()
+        category = Category.objects.create(name=f'bench-{tag}')
+        product = Product.objects.create(
+            category=category, name=f'Bench {tag}', sku=f'BENCH-{tag}',
+            description='Checkout benchmark product', price=Decimal('10.00'),
+            quantity=options['stock'],
+        )
+        users = User.objects.bulk_create([
+            User(username=f'bench-{tag}-{i}', email=f'bench-{tag}-{i}@example.com')
+            for i in range(options['buyers'])
+        ])
+        carts = Cart.objects.bulk_create([Cart(user=user) for user in users])
+        CartItem.objects.bulk_create([
+            CartItem(cart=cart, product=product, quantity=options['quantity']) for cart in carts
+        ])
+
+        def buy(pair):
+            cart, user = pair
+            try:
+                return checkout(cart, user, 'cash', CUSTOMER).success
+            finally:
+                connections.close_all()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+            outcomes = list(pool.map(buy, zip(carts, users)))
+        elapsed = time.perf_counter() - started
+
+        product.refresh_from_db()
+        sold = Order.objects.filter(user__in=users).count()
+        expected = min(options['buyers'], options['stock'] // options['quantity'])
+        oversold = product.quantity < 0 or sold * options['quantity'] > options['stock']
+
+        self.stdout.write(
+            f"{options['buyers']} buyers, {options['threads']} threads, stock {options['stock']}: "
+            f"{sum(outcomes)} orders, {len(outcomes) - sum(outcomes)} rejected, "
+            f"{product.quantity} left, sales_count {product.sales_count}"
+        )
+        self.stdout.write(f"{len(outcomes) / elapsed:.1f} checkouts/s ({elapsed:.2f}s)")
+
+        if not options['keep']:
+            Order.objects.filter(user__in=users).delete()
+            User.objects.filter(pk__in=[user.pk for user in users]).delete()
+            category.delete()
+
+        if oversold or sold != expected:
+            raise CommandError(f'Inconsistent stock: expected {expected} orders, got {sold}')
+        self.stdout.write(self.style.SUCCESS('No overselling detected.'))
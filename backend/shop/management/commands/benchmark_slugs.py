@@ -0,0 +1,58 @@
+import time
+import uuid
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+
+from backend.profiling import profile_queries
+from shop.models import Category, Product
+from shop.services.slugs import SlugAllocator, base_slug
+
+
+class Command(BaseCommand):
+    help = "Create many products sharing one name and report slug allocation cost"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=10000)
+        parser.add_argument('--keep', action='store_true', help='Keep the generated data')
+
+    def handle(self, *args, **options):
+        count = options['count']
+        tag = uuid.uuid4().hex[:8]
+        name = f'Bench Shirt {tag}'
+        category = Category.objects.create(name=f'bench-{tag}')
+
+        def product(i):
+            return Product(
+                category=category, name=name, sku=f'SLUG-{tag}-{i}',
+                description='Slug benchmark product', price=Decimal('10.00'),
+            )
+
+        # One save() per product, the way the admin and API create them
+        started = time.perf_counter()
+        with profile_queries() as profile:
+            for i in range(count):
+                product(i).save()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f'save(): {count} products in {elapsed:.2f}s, {profile.count / count:.1f} queries each '
+            f'(the old exists() loop would have run {count * (count + 1) // 2} lookups)'
+        )
+
+        # Batch path used by imports
+        started = time.perf_counter()
+        with profile_queries() as profile:
+            allocator = SlugAllocator(Product)
+            rows = [product(count + i) for i in range(count)]
+            for row in rows:
+                row.slug = allocator.allocate(base_slug(name))
+            Product.objects.bulk_create(rows, batch_size=1000)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f'SlugAllocator + bulk_create: {count} products in {elapsed:.2f}s, {profile.count} queries')
+
+        slugs = Product.objects.filter(category=category).values_list('slug', flat=True)
+        if len(set(slugs)) != 2 * count:
+            self.stderr.write('Duplicate slugs were allocated!')
+
+        if not options['keep']:
+            category.delete()
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from shop.models import Product
+from shop.services.catalog_io import detect_format, export_rows, write_rows
+
+
+class Command(BaseCommand):
+    help = "Stream the product catalog to a CSV or JSONL file"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Output file, or '-' for stdout")
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Defaults to the file extension')
+        parser.add_argument('--active-only', action='store_true')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = detect_format(path, options['format'])
+        queryset = Product.objects.all()
+        if options['active_only']:
+            queryset = queryset.filter(is_active=True)
+
+        if path == '-':
+            count = write_rows(export_rows(queryset), self.stdout, fmt)
+        else:
+            with open(path, 'w', newline='', encoding='utf-8') as stream:
+                count = write_rows(export_rows(queryset), stream, fmt)
+            self.stdout.write(f'Exported {count} products to {path}.')
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from shop import view_counter
+
+
+class Command(BaseCommand):
+    help = "Write buffered product view counts to Product.views_count"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=int, default=0,
+                            help='Keep running, flushing every N seconds')
+        parser.add_argument('--all', action='store_true',
+                            help='Also drain the newest generation (cache backend)')
+
+    def flush(self, drain_all):
+        counter = view_counter.get_counter()
+        if drain_all and isinstance(counter, view_counter.CacheViewCounter):
+            return counter.flush(settle=False)
+        return view_counter.flush()
+
+    def handle(self, *args, **options):
+        while True:
+            written = self.flush(options['all'])
+            self.stdout.write(f'Flushed {written} product views.')
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from shop.services.catalog_io import import_file
+
+
+class Command(BaseCommand):
+    help = "Upsert products from a CSV or JSONL file, matching on sku"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--create-categories', action='store_true',
+                            help='Create categories missing from the database')
+        parser.add_argument('--resume', action='store_true',
+                            help='Skip the rows an interrupted run already committed')
+        parser.add_argument('--state', help='Progress file (default: <path>.progress)')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        result = import_file(
+            options['path'],
+            fmt=options['format'],
+            batch_size=options['batch_size'],
+            create_categories=options['create_categories'],
+            resume=options['resume'],
+            state_path=options['state'],
+        )
+        elapsed = time.perf_counter() - started
+        for number, message in result.errors[:20]:
+            self.stderr.write(f'Row {number}: {message}')
+        if len(result.errors) > 20:
+            self.stderr.write(f'... and {len(result.errors) - 20} more errors')
+        self.stdout.write(
+            f'Read {result.rows} rows: {result.created} created, {result.updated} updated, '
+            f'{len(result.errors)} skipped in {elapsed:.1f}s.'
+        )
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from shop.services import ratings
+
+
+class Command(BaseCommand):
+    help = "Recompute Product rating aggregates from approved reviews"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Products recounted per query')
+
+    def handle(self, *args, **options):
+        fixed = ratings.recompute(batch_size=options['batch_size'])
+        self.stdout.write(f'Corrected ratings of {fixed} products.')
@@ -0,0 +1,28 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from shop.services.aliexpress_sync import sync_products
+
+
+class Command(BaseCommand):
+    help = "Refresh products mapped to AliExpress items and record the run"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stale-after', type=float, default=6,
+                            help='Only sync mappings not refreshed for this many hours (0 syncs all)')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--interval', type=int, default=0,
+                            help='Keep running, syncing every N seconds')
+
+    def handle(self, *args, **options):
+        stale_after = timedelta(hours=options['stale_after']) if options['stale_after'] else None
+        while True:
+            run = sync_products(stale_after=stale_after, batch_size=options['batch_size'])
+            self.stdout.write(
+                f'Fetched {run.fetched}, changed {run.changed}, failed {run.failed} in {run.duration:.1f}s.'
+            )
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,46 @@
+# Adds a generated tsvector column and GIN index on PostgreSQL only. The
+# column is not declared on the model; shop.search queries it directly and
+# other backends fall back to the in-process index.
+
+from django.db import migrations
+
+SEARCH_VECTOR_SQL = [
+    """
+ALTER TABLE shop_product ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+    setweight(to_tsvector('simple', coalesce(name, '')), 'A') ||
+    setweight(to_tsvector('simple', coalesce(sku, '')), 'A') ||
+    setweight(to_tsvector('simple', coalesce(brand, '')), 'B') ||
+    setweight(to_tsvector('simple', coalesce(short_description, '')), 'C') ||
+    setweight(to_tsvector('simple', coalesce(description, '')), 'D')
+) STORED
+""",
+    "CREATE INDEX product_search_vector_idx ON shop_product USING gin (search_vector)",
+]
+
+DROP_SEARCH_VECTOR_SQL = [
+    "DROP INDEX IF EXISTS product_search_vector_idx",
+    "ALTER TABLE shop_product DROP COLUMN IF EXISTS search_vector",
+]
+
+
+def add_search_vector(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for statement in SEARCH_VECTOR_SQL:
+            schema_editor.execute(statement)
+
+
+def drop_search_vector(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for statement in DROP_SEARCH_VECTOR_SQL:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0003_product_catalog_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_search_vector, drop_search_vector),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.1.6 on 2026-10-17 15:36
+
+from django.db import migrations, models
+
+PATH_STEP = 8
+
+
+def populate_paths(apps, schema_editor):
+    Category = apps.get_model('shop', 'Category')
+    rows = list(Category.objects.values_list('id', 'parent_id'))
+    children = {}
+    for pk, parent_id in rows:
+        children.setdefault(parent_id, []).append(pk)
+
+    updated = []
+    level = [(pk, '') for pk in children.get(None, [])]
+    depth = 0
+    while level:
+        next_level = []
+        for pk, parent_path in level:
+            path = parent_path + str(pk).zfill(PATH_STEP)
+            updated.append(Category(id=pk, path=path, depth=depth))
+            next_level.extend((child, path) for child in children.get(pk, []))
+        level = next_level
+        depth += 1
+    Category.objects.bulk_update(updated, ['path', 'depth'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0004_product_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='path',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(populate_paths, migrations.RunPython.noop),
+    ]
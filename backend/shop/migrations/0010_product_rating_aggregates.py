@@ -0,0 +1,75 @@
+# Generated by Django 5.1.6 on 2026-10-17 17:37
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+STARS = range(1, 6)
+
+
+def populate_ratings(apps, schema_editor):
+    Product = apps.get_model('shop', 'Product')
+    ProductReview = apps.get_model('shop', 'ProductReview')
+    rows = (
+        ProductReview.objects.filter(is_approved=True)
+        .values('product_id')
+        .annotate(**{f'rating_{star}': Count('id', filter=Q(rating=star)) for star in STARS})
+        .order_by()
+    )
+    updated = []
+    for row in rows:
+        histogram = [row[f'rating_{star}'] for star in STARS]
+        count = sum(histogram)
+        updated.append(Product(
+            id=row['product_id'],
+            rating_avg=sum(star * n for star, n in zip(STARS, histogram)) / count,
+            rating_count=count,
+            **{f'rating_{star}': n for star, n in zip(STARS, histogram)},
+        ))
+    fields = ['rating_avg', 'rating_count', *(f'rating_{star}' for star in STARS)]
+    Product.objects.bulk_update(updated, fields, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0009_order_created_status_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_1',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_2',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_3',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_4',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_5',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_avg',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_ratings, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,10 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Q, Sum, Value
+from django.db.models.functions import Coalesce, Concat, Substr
 from django.contrib.auth import get_user_model
-from django.utils.text import slugify
 from django.core.validators import MinValueValidator, MaxValueValidator
 from decimal import Decimal
+from .services.slugs import save_with_unique_slug
 
 User = get_user_model()
 
@@ -18,20 +20,73 @@ class Category(models.Model):
     image = models.ImageField(upload_to='categories/', blank=True, null=True)
     parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='children')
     is_active = models.BooleanField(default=True)
+    
+    # Materialized path: the zero-padded ids of every ancestor and this node
+    path = models.CharField(max_length=255, db_index=True, editable=False, default='')
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
+    
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    PATH_STEP = 8  # digits per path segment
+    
     class Meta:
         verbose_name_plural = "Categories"
         ordering = ['name']
     
     def save(self, *args, **kwargs):
-        if not self.slug:
-            self.slug = slugify(self.name)
-        super().save(*args, **kwargs)
-    
+        # Read paths from the database; in-memory copies may predate a move
+        parent_path = ''
+        if self.parent_id:
+            parent_path = Category.objects.values_list('path', flat=True).get(pk=self.parent_id)
+        old_path = ''
+        if self.pk:
+            old_path = Category.objects.filter(pk=self.pk).values_list('path', flat=True).first() or ''
+        if old_path and parent_path.startswith(old_path):
+            raise ValueError("A category cannot be moved under itself or its descendants")
+        
+        self.path = old_path
+        self.depth = len(old_path) // self.PATH_STEP - 1 if old_path else 0
+        if self.slug:
+            super().save(*args, **kwargs)
+        else:
+            save_with_unique_slug(self, self.name, super().save, *args, **kwargs)
+        
+        new_path = parent_path + str(self.pk).zfill(self.PATH_STEP)
+        if new_path != old_path:
+            new_depth = len(new_path) // self.PATH_STEP - 1
+            if old_path:
+                # Re-root the whole subtree in one UPDATE
+                old_depth = len(old_path) // self.PATH_STEP - 1
+                lower, upper = self.subtree_bounds(old_path)
+                Category.objects.filter(path__gte=lower, path__lt=upper).update(
+                    path=Concat(Value(new_path), Substr('path', len(old_path) + 1)),
+                    depth=F('depth') + (new_depth - old_depth),
+                )
+            else:
+                Category.objects.filter(pk=self.pk).update(path=new_path, depth=new_depth)
+            self.path = new_path
+            self.depth = new_depth
+        
     def __str__(self):
         return self.name
+    
+    @staticmethod
+    def subtree_bounds(path):
+        """Half-open [lower, upper) range of paths in the subtree rooted at path.
+        
+        Paths are digit-only and fixed-width per segment, so incrementing the
+        path as a number gives the first path outside the subtree. A range
+        scan stays index-friendly on every backend and collation.
+        """
+        return path, str(int(path) + 1).zfill(len(path))
+    
+    def get_descendants(self, include_self=True):
+        lower, upper = self.subtree_bounds(self.path)
+        queryset = Category.objects.filter(path__gte=lower, path__lt=upper)
+        if not include_self:
+            queryset = queryset.exclude(pk=self.pk)
+        return queryset
 
 # ============================================
 # Product Model
@@ -86,6 +141,15 @@ class Product(models.Model):
     views_count = models.IntegerField(default=0, editable=False)
     sales_count = models.IntegerField(default=0, editable=False)
     
+    # Approved review ratings, kept in step by services.ratings
+    rating_avg = models.FloatField(default=0, editable=False)
+    rating_count = models.IntegerField(default=0, editable=False)
+    rating_1 = models.IntegerField(default=0, editable=False)
+    rating_2 = models.IntegerField(default=0, editable=False)
+    rating_3 = models.IntegerField(default=0, editable=False)
+    rating_4 = models.IntegerField(default=0, editable=False)
+    rating_5 = models.IntegerField(default=0, editable=False)
+    
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -96,17 +160,36 @@ class Product(models.Model):
             models.Index(fields=['slug']),
             models.Index(fields=['is_active', 'is_featured']),
             models.Index(fields=['category', 'is_active']),
+            # Keyset pagination over the active catalog (see shop.pagination)
+            models.Index(fields=['-created_at', '-id'], condition=Q(is_active=True), name='product_active_recent_idx'),
+            # Catalog filter/sort access paths (see shop.filters.ProductFilterSet)
+            models.Index(fields=['price', 'id'], condition=Q(is_active=True), name='product_active_price_idx'),
+            models.Index(fields=['-sales_count', '-id'], condition=Q(is_active=True), name='product_active_sales_idx'),
+            models.Index(fields=['-views_count', '-id'], condition=Q(is_active=True), name='product_active_views_idx'),
+            models.Index(fields=['category', '-created_at'], condition=Q(is_active=True), name='product_active_category_idx'),
+            models.Index(fields=['brand', 'price'], condition=Q(is_active=True), name='product_active_brand_idx'),
+            models.Index(fields=['color', 'price'], condition=Q(is_active=True), name='product_active_color_idx'),
+            models.Index(fields=['size', 'price'], condition=Q(is_active=True), name='product_active_size_idx'),
+            models.Index(fields=['is_featured', '-created_at'], condition=Q(is_active=True), name='product_active_featured_idx'),
+            models.Index(fields=['is_new', '-created_at'], condition=Q(is_active=True), name='product_active_new_idx'),
+            models.Index(fields=['quantity'], condition=Q(is_active=True), name='product_active_stock_idx'),
         ]
     
+    # Only ever changed with F() updates (view_counter, checkout,
+    # services.ratings); an ordinary save would write back stale values
+    COUNTER_FIELDS = frozenset({
+        'views_count', 'sales_count', 'rating_avg', 'rating_count',
+        'rating_1', 'rating_2', 'rating_3', 'rating_4', 'rating_5',
+    })
+    
     def save(self, *args, **kwargs):
+        if not self._state.adding and not args and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COUNTER_FIELDS
+            ]
         if not self.slug:
-            base_slug = slugify(self.name)
-            slug = base_slug
-            counter = 1
-            while Product.objects.filter(slug=slug).exists():
-                slug = f"{base_slug}-{counter}"
-                counter += 1
-            self.slug = slug
+            return save_with_unique_slug(self, self.name, super().save, *args, **kwargs)
         super().save(*args, **kwargs)
     
     def __str__(self):
@@ -120,6 +203,11 @@ class Product(models.Model):
     def is_low_stock(self):
         return self.quantity <= self.low_stock_threshold
     
+    @property
+    def rating_histogram(self):
+        """Approved reviews per star, {1: n, ..., 5: n}"""
+        return {star: getattr(self, f'rating_{star}') for star in range(1, 6)}
+    
     @property
     def discount_percentage(self):
         if self.compare_at_price and self.compare_at_price > self.price:
@@ -165,6 +253,36 @@ class ProductReview(models.Model):
         ordering = ['-created_at']
         unique_together = ['product', 'user']  # One review per user per product
     
+    def _lock_rated(self):
+        """Lock the stored row and record what the rating aggregates count for it.
+
+        The aggregates move by the difference between the stored row and the
+        save or delete (see services.ratings); an in-memory copy may predate
+        an approval or a concurrent edit.
+        """
+        stored = (
+            ProductReview.objects.select_for_update().filter(pk=self.pk)
+            .values_list('product_id', 'rating', 'is_approved').first()
+        )
+        self._rated = stored[:2] if stored and stored[2] else None
+    
+    def save(self, *args, **kwargs):
+        # The review and its product's aggregates are written together
+        with transaction.atomic():
+            if self.pk is not None:
+                self._lock_rated()
+            super().save(*args, **kwargs)
+    
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            self._lock_rated()
+            return super().delete(*args, **kwargs)
+    
+    @property
+    def rated(self):
+        """(product_id, rating) this review adds to its product's ratings, if approved"""
+        return (self.product_id, self.rating) if self.is_approved else None
+    
     def __str__(self):
         return f"{self.user.username} - {self.product.name} - {self.rating}★"
 
@@ -172,6 +290,20 @@ class ProductReview(models.Model):
 # Cart Models
 # ============================================
 
+CART_AMOUNT_FIELD = models.DecimalField(max_digits=12, decimal_places=2)
+
+class CartQuerySet(models.QuerySet):
+    def with_totals(self):
+        """Annotate item_count and subtotal_amount in the same query"""
+        return self.annotate(
+            item_count=Coalesce(Sum('items__quantity'), 0),
+            subtotal_amount=Coalesce(
+                Sum(F('items__quantity') * F('items__product__price'), output_field=CART_AMOUNT_FIELD),
+                Value(Decimal('0.00')),
+                output_field=CART_AMOUNT_FIELD,
+            ),
+        )
+
 class Cart(models.Model):
     """Shopping cart"""
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='carts')
@@ -179,6 +311,8 @@ class Cart(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = CartQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-created_at']
     
@@ -187,13 +321,23 @@ class Cart(models.Model):
             return f"Cart - {self.user.email}"
         return f"Cart - {self.session_id}"
     
+    # Both totals use the with_totals() annotations when present and fall
+    # back to one aggregate query, never one query per item
+    
     @property
     def total_items(self):
-        return sum(item.quantity for item in self.items.all())
+        if hasattr(self, 'item_count'):
+            return self.item_count
+        return self.items.aggregate(total=Coalesce(Sum('quantity'), 0))['total']
     
     @property
     def subtotal(self):
-        return sum(item.total for item in self.items.all())
+        if hasattr(self, 'subtotal_amount'):
+            return self.subtotal_amount
+        total = self.items.aggregate(
+            total=Sum(F('quantity') * F('product__price'), output_field=CART_AMOUNT_FIELD)
+        )['total']
+        return total or Decimal('0.00')
 
 class CartItem(models.Model):
     """Items in cart"""
@@ -289,19 +433,16 @@ class Order(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Date-range scans for the sales reports
+            models.Index(fields=['created_at', 'status'], name='order_created_status_idx'),
+        ]
     
     def save(self, *args, **kwargs):
         if not self.order_number:
             # Generate order number: INV-YYYYMMDD-XXXX
-            from datetime import datetime
-            date_str = datetime.now().strftime('%Y%m%d')
-            last_order = Order.objects.filter(order_number__startswith=f'INV-{date_str}').order_by('-order_number').first()
-            if last_order:
-                last_num = int(last_order.order_number.split('-')[-1])
-                new_num = last_num + 1
-            else:
-                new_num = 1
-            self.order_number = f"INV-{date_str}-{new_num:04d}"
+            from .services.order_numbers import next_order_number
+            self.order_number = next_order_number()
         super().save(*args, **kwargs)
     
     def __str__(self):
@@ -322,6 +463,14 @@ class Order(models.Model):
         address += f", {self.postal_code}, {self.country}"
         return address
 
+class OrderNumberSequence(models.Model):
+    """Per-day counter behind INV-YYYYMMDD-XXXX order numbers"""
+    date = models.DateField(unique=True)
+    last_value = models.PositiveIntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.date:%Y%m%d} → {self.last_value}"
+
 class OrderItem(models.Model):
     """Items in an order"""
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
@@ -355,4 +504,46 @@ class Wishlist(models.Model):
         ordering = ['-created_at']
     
     def __str__(self):
-        return f"{self.user.username} - {self.name}"
\ No newline at end of file
+        return f"{self.user.username} - {self.name}"
+
+# ============================================
+# AliExpress Models
+# ============================================
+
+class AffiliateLink(models.Model):
+    """Generated AliExpress promotion link for a product URL (never changes)"""
+    url_hash = models.CharField(max_length=40, unique=True)  # sha1 of the normalized source URL
+    source_url = models.TextField()
+    promotion_link = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return self.source_url
+
+
+class AliExpressProduct(models.Model):
+    """Links a Product to the AliExpress item it was imported from"""
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, related_name='aliexpress')
+    aliexpress_id = models.CharField(max_length=32, unique=True)
+    content_hash = models.CharField(max_length=40, blank=True)  # sha1 of the synced fields as last seen
+    last_synced_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.aliexpress_id} -> {self.product_id}"
+
+
+class AliExpressSyncRun(models.Model):
+    """Counters for one pass of the AliExpress product sync"""
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    fetched = models.PositiveIntegerField(default=0)
+    changed = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    duration = models.FloatField(default=0)  # seconds
+    
+    class Meta:
+        ordering = ['-started_at']
+    
+    def __str__(self):
+        return f"Sync {self.started_at:%Y-%m-%d %H:%M}: {self.changed}/{self.fetched} changed"
@@ -0,0 +1,85 @@
+# backend/shop/pagination.py
+import base64
+import json
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+
+
+class KeysetPagination:
+    """Cursor pagination over a deterministic ordering.
+
+    The default ordering is (created_at, id), matching Product.Meta.ordering.
+    The cursor carries the ordering values of the last row, so each page is a
+    single indexed range scan and the cost of fetching page N does not grow
+    with N the way OFFSET pagination does.
+    """
+
+    default_page_size = 24
+    max_page_size = 100
+
+    def __init__(self, request, ordering=('-created_at', '-id')):
+        self.request = request
+        self.ordering = tuple(ordering)
+        self.page_size = self._get_page_size()
+
+    def _get_page_size(self):
+        try:
+            size = int(self.request.query_params.get('page_size', self.default_page_size))
+        except (TypeError, ValueError):
+            return self.default_page_size
+        return max(1, min(size, self.max_page_size))
+
+    @staticmethod
+    def _field_name(order):
+        return order.lstrip('-')
+
+    def encode_cursor(self, row):
+        values = [str(getattr(row, self._field_name(order))) for order in self.ordering]
+        raw = json.dumps(values, separators=(',', ':')).encode('utf-8')
+        return base64.urlsafe_b64encode(raw).decode('ascii')
+
+    def decode_cursor(self, cursor, model):
+        """Return the ordering values stored in the cursor, or None if malformed"""
+        try:
+            raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+            values = json.loads(raw)
+            if not isinstance(values, list) or len(values) != len(self.ordering):
+                return None
+            return [
+                model._meta.get_field(self._field_name(order)).to_python(value)
+                for order, value in zip(self.ordering, values)
+            ]
+        except (ValueError, TypeError, UnicodeError, DjangoValidationError):
+            return None
+
+    def _after(self, values):
+        """Build the "comes after this row" condition for the ordering"""
+        condition = Q()
+        equal = {}
+        for order, value in zip(self.ordering, values):
+            name = self._field_name(order)
+            lookup = 'lt' if order.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+    def paginate_queryset(self, queryset):
+        """Return (rows, next_cursor) for the requested page"""
+        queryset = queryset.order_by(*self.ordering)
+
+        cursor = self.request.query_params.get('cursor')
+        if cursor:
+            values = self.decode_cursor(cursor, queryset.model)
+            if values is None:
+                raise ValidationError({'cursor': 'Invalid cursor'})
+            queryset = queryset.filter(self._after(values))
+
+        # Fetch one extra row to know whether another page exists
+        rows = list(queryset[:self.page_size + 1])
+        next_cursor = None
+        if len(rows) > self.page_size:
+            rows = rows[:self.page_size]
+            next_cursor = self.encode_cursor(rows[-1])
+        return rows, next_cursor
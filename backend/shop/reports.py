@@ -0,0 +1,234 @@
+# backend/shop/reports.py
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, DateField, DecimalField, ExpressionWrapper, F, Q, Sum, Value
+from django.db.models.functions import Coalesce, TruncDay, TruncMonth, TruncWeek
+from django.utils import timezone
+
+from .cache import bump_version, cache_timeout, versioned_key
+from .models import Order, OrderItem
+
+REPORTS_NAMESPACE = 'reports'
+# Orders in these states earned nothing; their lines count as lost revenue
+LOST_STATUSES = ('cancelled', 'refunded')
+# Fulfilment stages after an order is placed, in order
+FUNNEL = ('processing', 'confirmed', 'shipped', 'delivered')
+PERIODS = {'day': TruncDay, 'week': TruncWeek, 'month': TruncMonth}
+TOP_PRODUCT_ORDERINGS = {'revenue': '-revenue', 'units': '-units', 'margin': '-margin'}
+
+AMOUNT = DecimalField(max_digits=14, decimal_places=2)
+ZERO = Value(Decimal('0.00'), output_field=AMOUNT)
+
+
+def invalidate_reports():
+    bump_version(REPORTS_NAMESPACE)
+
+
+def closed_before():
+    """First day whose reports may still change; everything earlier is cached"""
+    return timezone.localdate() - timedelta(days=settings.REPORTS_CLOSED_AFTER_DAYS)
+
+
+def invalidate_for_order(order):
+    """Drop cached reports when an order inside a closed period changes"""
+    if order.created_at and timezone.localdate(order.created_at) < closed_before():
+        invalidate_reports()
+
+
+def period_start(day, period):
+    if period == 'week':
+        return day - timedelta(days=day.weekday())
+    if period == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def next_period(day, period):
+    if period == 'week':
+        return day + timedelta(days=7)
+    if period == 'month':
+        return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return day + timedelta(days=1)
+
+
+def _bounds(first_day, end_day):
+    """Aware [start, end) datetimes from ``first_day`` up to ``end_day``"""
+    tz = timezone.get_current_timezone()
+    return (
+        timezone.make_aware(datetime.combine(first_day, time.min), tz),
+        timezone.make_aware(datetime.combine(end_day, time.min), tz),
+    )
+
+
+def _items(first_day, end_day):
+    since, until = _bounds(first_day, end_day)
+    return OrderItem.objects.filter(order__created_at__gte=since, order__created_at__lt=until)
+
+
+def _cached(last_day, parts, compute):
+    """``compute()``, kept in the cache when the range ends before closed_before()"""
+    if last_day >= closed_before():
+        return compute()
+    key = versioned_key(REPORTS_NAMESPACE, *parts)
+    value = cache.get(key)
+    if value is None:
+        value = compute()
+        cache.set(key, value, timeout=cache_timeout(settings.REPORTS_CACHE_TIMEOUT))
+    return value
+
+
+# ============================================
+# Sales totals
+# ============================================
+
+def _sales_totals():
+    """Aggregates for a group of order lines, evaluated in the database.
+
+    Margin only covers lines whose product has a cost_price (the current
+    one: order lines do not record cost), so ``costed_revenue`` says how
+    much of the revenue it is measured against.
+    """
+    line = ExpressionWrapper(F('price') * F('quantity'), output_field=AMOUNT)
+    cost = ExpressionWrapper(F('product__cost_price') * F('quantity'), output_field=AMOUNT)
+    sold = ~Q(order__status__in=LOST_STATUSES)
+    costed = sold & Q(product__cost_price__isnull=False)
+    return {
+        'orders': Count('order', distinct=True, filter=sold),
+        'units': Coalesce(Sum('quantity', filter=sold), 0),
+        'revenue': Coalesce(Sum(line, filter=sold), ZERO),
+        'costed_revenue': Coalesce(Sum(line, filter=costed), ZERO),
+        'cost': Coalesce(Sum(cost, filter=costed), ZERO),
+        'lost_revenue': Coalesce(Sum(line, filter=Q(order__status__in=LOST_STATUSES)), ZERO),
+    }
+
+
+SALES_FIELDS = ('orders', 'units', 'revenue', 'costed_revenue', 'cost', 'lost_revenue')
+
+
+def _with_margin(row):
+    row['margin'] = row['costed_revenue'] - row['cost']
+    row['margin_pct'] = round(row['margin'] * 100 / row['costed_revenue'], 2) if row['costed_revenue'] else None
+    return row
+
+
+def _empty_sales():
+    return _with_margin({
+        'orders': 0, 'units': 0, 'revenue': Decimal('0.00'), 'costed_revenue': Decimal('0.00'),
+        'cost': Decimal('0.00'), 'lost_revenue': Decimal('0.00'),
+    })
+
+
+def sales_by_period(start, end, period='day'):
+    """Sales per day, week or month for the whole periods covering start..end.
+
+    One GROUP BY over the order lines computes every period at once.
+    Periods that closed (see closed_before) are cached one entry each and
+    only the remaining ones are queried, so a year of months costs a
+    single query for the current month once the rest are cached.
+    Returns ``(rows, totals)``.
+    """
+    buckets = []
+    day = period_start(start, period)
+    while day <= end:
+        buckets.append(day)
+        day = next_period(day, period)
+
+    cutoff = closed_before()
+    keys = {
+        bucket: versioned_key(REPORTS_NAMESPACE, 'sales', period, bucket.isoformat())
+        for bucket in buckets if next_period(bucket, period) <= cutoff
+    }
+    cached = cache.get_many(keys.values()) if keys else {}
+    rows = {bucket: cached[key] for bucket, key in keys.items() if key in cached}
+
+    missing = [bucket for bucket in buckets if bucket not in rows]
+    if missing:
+        groups = (
+            _items(missing[0], next_period(missing[-1], period))
+            .annotate(bucket=PERIODS[period]('order__created_at', output_field=DateField()))
+            .values('bucket')
+            .annotate(**_sales_totals())
+            .order_by()
+        )
+        computed = {group.pop('bucket'): _with_margin(group) for group in groups}
+        for bucket in missing:
+            rows[bucket] = computed.get(bucket) or _empty_sales()
+        closed = {keys[bucket]: rows[bucket] for bucket in missing if bucket in keys}
+        if closed:
+            cache.set_many(closed, timeout=cache_timeout(settings.REPORTS_CACHE_TIMEOUT))
+
+    totals = _with_margin({field: sum(rows[bucket][field] for bucket in buckets) for field in SALES_FIELDS})
+    return [{'period': bucket, **rows[bucket]} for bucket in buckets], totals
+
+
+def top_products(start, end, limit=10, order_by='revenue'):
+    """Best selling products between two dates (inclusive) by revenue, units or margin"""
+    def compute():
+        rows = (
+            _items(start, end + timedelta(days=1))
+            .values('product_id', 'product__name', 'product__sku')
+            .annotate(**_sales_totals())
+            .annotate(margin=F('costed_revenue') - F('cost'))
+            .order_by(TOP_PRODUCT_ORDERINGS[order_by], 'product_id')[:limit]
+        )
+        return [
+            _with_margin({
+                'product_id': row.pop('product_id'),
+                'name': row.pop('product__name'),
+                'sku': row.pop('product__sku'),
+                **row,
+            })
+            for row in rows
+        ]
+
+    return _cached(end, ('top_products', start, end, limit, order_by), compute)
+
+
+# ============================================
+# Order statuses
+# ============================================
+
+def order_statuses(start, end):
+    """Orders placed between two dates (inclusive) by status and payment status.
+
+    Every count and total comes from one conditional aggregate query. The
+    funnel starts from every order placed and counts, for each fulfilment
+    stage, the orders now at that stage or past it.
+    """
+    def compute():
+        since, until = _bounds(start, end + timedelta(days=1))
+        aggregates = {}
+        for status, _ in Order.ORDER_STATUS:
+            aggregates[f'status_{status}'] = Count('id', filter=Q(status=status))
+            aggregates[f'total_{status}'] = Coalesce(Sum('total', filter=Q(status=status)), ZERO)
+        for status, _ in Order.PAYMENT_STATUS:
+            aggregates[f'payment_{status}'] = Count('id', filter=Q(payment_status=status))
+        totals = Order.objects.filter(created_at__gte=since, created_at__lt=until).aggregate(
+            orders=Count('id'), **aggregates,
+        )
+
+        placed = totals['orders']
+        funnel = [('placed', placed)] + [
+            (stage, sum(totals[f'status_{status}'] for status in FUNNEL[index:]))
+            for index, stage in enumerate(FUNNEL)
+        ]
+        return {
+            'orders': placed,
+            'statuses': [
+                {'status': status, 'label': label, 'orders': totals[f'status_{status}'], 'total': totals[f'total_{status}']}
+                for status, label in Order.ORDER_STATUS
+            ],
+            'payment_statuses': [
+                {'status': status, 'label': label, 'orders': totals[f'payment_{status}']}
+                for status, label in Order.PAYMENT_STATUS
+            ],
+            'funnel': [
+                {'stage': stage, 'orders': reached, 'rate': round(reached / placed, 4) if placed else 0.0}
+                for stage, reached in funnel
+            ],
+        }
+
+    return _cached(end, ('order_statuses', start, end), compute)
@@ -0,0 +1,124 @@
+# backend/shop/response_cache.py
+import hashlib
+import json
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, parse_http_date_safe
+from rest_framework.response import Response
+
+from .cache import bump_version, cache_timeout, get_version
+
+CATALOG_NAMESPACE = 'catalog'
+STATS_KEYS = {
+    'hits': 'catalog:stats:hits',
+    'misses': 'catalog:stats:misses',
+    'not_modified': 'catalog:stats:not_modified',
+}
+
+
+def get_cache():
+    return caches[settings.CATALOG_CACHE_ALIAS]
+
+
+def invalidate_catalog():
+    """Drop every cached catalog response by moving to a new version"""
+    bump_version(CATALOG_NAMESPACE)
+
+
+def _count(stat):
+    cache = get_cache()
+    key = STATS_KEYS[stat]
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+def get_stats():
+    values = get_cache().get_many(STATS_KEYS.values())
+    stats = {name: values.get(key, 0) for name, key in STATS_KEYS.items()}
+    served = stats['hits'] + stats['not_modified']
+    total = served + stats['misses']
+    stats['hit_ratio'] = round(served / total, 4) if total else 0.0
+    stats['version'] = get_version(CATALOG_NAMESPACE)
+    return stats
+
+
+def reset_stats():
+    get_cache().delete_many(STATS_KEYS.values())
+
+
+def _cache_key(request):
+    fmt = request.accepted_renderer.format if getattr(request, 'accepted_renderer', None) else ''
+    digest = hashlib.sha1(f'{fmt}|{request.get_full_path()}'.encode('utf-8')).hexdigest()
+    return f'{CATALOG_NAMESPACE}:v{get_version(CATALOG_NAMESPACE)}:response:{digest}'
+
+
+def _etag_matches(header, etag):
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    return etag in (tag.strip() for tag in header.split(','))
+
+
+def _not_modified(request, entry):
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match:
+        return _etag_matches(if_none_match, entry['etag'])
+    since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+    return since is not None and int(entry['last_modified']) <= since
+
+
+def _finalize(response, entry, cache_status):
+    response['ETag'] = entry['etag']
+    response['Last-Modified'] = http_date(entry['last_modified'])
+    response['X-Cache'] = cache_status
+    patch_cache_control(response, public=True, max_age=0, must_revalidate=True)
+    patch_vary_headers(response, ['Accept'])
+    return response
+
+
+def cache_catalog_response(view):
+    """Cache a GET catalog view's data under the catalog version.
+
+    Entries are keyed on the catalog version and full URL, carry a strong
+    ETag over the serialized data, and conditional requests are answered
+    with 304 before the view (and the ORM) is reached.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        cache = get_cache()
+        key = _cache_key(request)
+        entry = cache.get(key)
+
+        if entry is not None:
+            if _not_modified(request, entry):
+                _count('not_modified')
+                return _finalize(Response(status=304), entry, 'HIT')
+            _count('hits')
+            return _finalize(Response(entry['data']), entry, 'HIT')
+
+        _count('misses')
+        response = view(request, *args, **kwargs)
+        if response.status_code != 200:
+            return response
+
+        body = json.dumps(response.data, cls=DjangoJSONEncoder, sort_keys=True)
+        entry = {
+            'data': response.data,
+            'etag': '"%s"' % hashlib.sha1(body.encode('utf-8')).hexdigest(),
+            'last_modified': time.time(),
+        }
+        # Keyed on the catalog version, which lives in the default cache
+        cache.set(key, entry, cache_timeout(settings.CATALOG_CACHE_TIMEOUT))
+        if _not_modified(request, entry):
+            return _finalize(Response(status=304), entry, 'MISS')
+        return _finalize(response, entry, 'MISS')
+    return wrapper
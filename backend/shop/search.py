@@ -0,0 +1,371 @@
+# backend/shop/search.py
+import logging
+import math
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+from .cache import bump_version, get_version, is_shared
+from .models import Product
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# Field weights shared by both backends (PostgreSQL setweight A/B/C/D)
+FIELD_WEIGHTS = {
+    'name': 3,
+    'sku': 3,
+    'brand': 2,
+    'short_description': 1,
+    'description': 1,
+}
+
+# Prefix expansion is capped so a one-letter query stays cheap
+MAX_PREFIX_EXPANSIONS = 50
+
+# Cache namespace whose version every process's index is built at; each
+# version has a change log entry naming the products it re-indexes
+INDEX_NAMESPACE = 'search_index'
+CHANGE_LOG_TIMEOUT = 60 * 60
+# Further behind than this, an index is rebuilt instead of replayed
+MAX_REPLAY = 1000
+
+logger = logging.getLogger(__name__)
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower()) if text else []
+
+
+# ============================================
+# In-process inverted index (SQLite / fallback)
+# ============================================
+
+class InvertedIndex:
+    """BM25-ranked inverted index of products, held in process memory.
+
+    Built from the database on first use. Every product change after that
+    bumps the index version in the cache and logs the changed product ids
+    under the new version (see ``log_change``). Before a search, an index
+    that is behind replays the log entries it missed, re-reading only the
+    products they name. When entries are missing (expired, or a bulk
+    ``invalidate_index``), or the cache is per process and the index is
+    LOCAL_CACHE_TIMEOUT seconds old, a full rebuild runs in a background
+    thread and the old index keeps serving until the new one is swapped
+    in. On PostgreSQL the tsvector backend is used instead.
+    """
+
+    k1 = 1.2
+    b = 0.75
+    STATE = (
+        'postings', 'doc_tokens', 'doc_lengths', 'active', 'total_length', '_sorted_tokens',
+        '_impacts', '_impact_stats', '_loaded', '_version', '_built_at',
+    )
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._generation = 0
+        self._rebuild = None
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.postings = defaultdict(dict)    # token -> {product_id: weighted tf}
+            self.doc_tokens = {}                 # product_id -> set of tokens
+            self.doc_lengths = {}                # product_id -> weighted length
+            self.active = set()                  # ids of active products
+            self.total_length = 0
+            self._sorted_tokens = None
+            self._impacts = {}                   # token -> [(product_id, score)] best first
+            self._impact_stats = None
+            self._loaded = False
+            self._version = None
+            self._built_at = 0
+            # A rebuild started before the reset must not be swapped in
+            self._generation += 1
+
+    def _load(self):
+        self._version = get_version(INDEX_NAMESPACE)
+        fields = ['id', 'is_active', *FIELD_WEIGHTS]
+        for row in Product.objects.values(*fields).iterator(chunk_size=2000):
+            self._add(row['id'], row, row['is_active'])
+        self._loaded = True
+        self._built_at = time.monotonic()
+
+    def _expired(self):
+        return not is_shared() and time.monotonic() - self._built_at >= settings.LOCAL_CACHE_TIMEOUT
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    # Nothing to serve yet: the first build runs inline
+                    self._load()
+            return
+        version = get_version(INDEX_NAMESPACE)
+        if version == self._version and not self._expired():
+            return
+        with self._lock:
+            if version != self._version and self._replay(version) and not self._expired():
+                return
+            self._start_rebuild()
+
+    def _replay(self, version):
+        """Apply the logged changes up to ``version``; False when they are not all logged"""
+        if self._rebuild is not None or not self._version or not 0 < version - self._version <= MAX_REPLAY:
+            return False
+        keys = [change_key(v) for v in range(self._version + 1, version + 1)]
+        entries = cache.get_many(keys)
+        if len(entries) < len(keys):
+            return False
+        self.refresh(set().union(*entries.values()))
+        self._version = version
+        return True
+
+    def refresh(self, product_ids):
+        """Re-index ``product_ids`` from the database; missing ones are removed"""
+        product_ids = list(product_ids)
+        fields = ['id', 'is_active', *FIELD_WEIGHTS]
+        with self._lock:
+            for start in range(0, len(product_ids), 500):
+                chunk = product_ids[start:start + 500]
+                rows = {row['id']: row for row in Product.objects.filter(pk__in=chunk).values(*fields)}
+                for product_id in chunk:
+                    self._remove(product_id)
+                    if product_id in rows:
+                        self._add(product_id, rows[product_id], rows[product_id]['is_active'])
+
+    def _start_rebuild(self):
+        """Rebuild in a background thread; caller holds the lock"""
+        if self._rebuild is None:
+            self._rebuild = threading.Thread(
+                target=self._run_rebuild, args=(self._generation,), name='search-index-rebuild', daemon=True,
+            )
+            self._rebuild.start()
+
+    def _run_rebuild(self, generation):
+        try:
+            fresh = InvertedIndex()
+            fresh._load()
+            with self._lock:
+                if generation == self._generation:
+                    for name in self.STATE:
+                        setattr(self, name, getattr(fresh, name))
+        except Exception:
+            logger.exception("Failed to rebuild the search index")
+        finally:
+            with self._lock:
+                self._rebuild = None
+            # This thread's connection is not closed by any request cycle
+            connection.close()
+
+    def wait_for_rebuild(self, timeout=None):
+        """Block until a background rebuild finishes (tests, warm-up)"""
+        rebuild = self._rebuild
+        if rebuild is not None:
+            rebuild.join(timeout)
+
+    def _add(self, product_id, values, is_active):
+        frequencies = defaultdict(int)
+        for field, weight in FIELD_WEIGHTS.items():
+            for token in tokenize(values.get(field)):
+                frequencies[token] += weight
+        for token, tf in frequencies.items():
+            if token not in self.postings:
+                self._sorted_tokens = None
+            self.postings[token][product_id] = tf
+            self._impacts.pop(token, None)
+        length = sum(frequencies.values())
+        self.doc_tokens[product_id] = set(frequencies)
+        self.doc_lengths[product_id] = length
+        self.total_length += length
+        if is_active:
+            self.active.add(product_id)
+
+    def _remove(self, product_id):
+        for token in self.doc_tokens.pop(product_id, ()):
+            docs = self.postings.get(token)
+            if docs is None:
+                continue
+            docs.pop(product_id, None)
+            self._impacts.pop(token, None)
+            if not docs:
+                del self.postings[token]
+                self._sorted_tokens = None
+        self.total_length -= self.doc_lengths.pop(product_id, 0)
+        self.active.discard(product_id)
+
+    def _expand_prefix(self, prefix):
+        if self._sorted_tokens is None:
+            self._sorted_tokens = sorted(self.postings)
+        tokens = self._sorted_tokens
+        matches = []
+        i = bisect_left(tokens, prefix)
+        while i < len(tokens) and tokens[i].startswith(prefix) and len(matches) < MAX_PREFIX_EXPANSIONS:
+            matches.append(tokens[i])
+            i += 1
+        return matches
+
+    def _stats(self):
+        doc_count = len(self.doc_lengths)
+        return doc_count, (self.total_length / doc_count if doc_count else 0)
+
+    def _idf(self, docs, doc_count):
+        return math.log(1 + (doc_count - len(docs) + 0.5) / (len(docs) + 0.5))
+
+    def _bm25(self, tf, product_id, idf, avg_length):
+        norm = tf + self.k1 * (1 - self.b + self.b * self.doc_lengths[product_id] / avg_length)
+        return idf * tf * (self.k1 + 1) / norm
+
+    def _score_term(self, token, candidates, doc_count, avg_length):
+        """Score ``token`` over all its documents, or only over ``candidates``"""
+        docs = self.postings.get(token)
+        if not docs:
+            return {}
+        idf = self._idf(docs, doc_count)
+        if candidates is None:
+            pairs = docs.items()
+        else:
+            pairs = ((pid, docs[pid]) for pid in candidates if pid in docs)
+        return {pid: self._bm25(tf, pid, idf, avg_length) for pid, tf in pairs}
+
+    def _impact_list(self, token, doc_count, avg_length):
+        """Documents for ``token`` ordered by score, cached until they change"""
+        if self._impact_stats is not None:
+            cached_count, cached_avg = self._impact_stats
+            # Scores drift with corpus statistics; rebuild once they move >10%
+            if abs(doc_count - cached_count) > 0.1 * cached_count or abs(avg_length - cached_avg) > 0.1 * cached_avg:
+                self._impacts.clear()
+                self._impact_stats = None
+        if self._impact_stats is None:
+            self._impact_stats = (doc_count, avg_length)
+        ranked = self._impacts.get(token)
+        if ranked is None:
+            scores = self._score_term(token, None, doc_count, avg_length)
+            ranked = sorted(scores.items(), key=lambda item: (-item[1], -item[0]))
+            self._impacts[token] = ranked
+        return ranked
+
+    def search(self, query, limit=20, prefix=False, active_only=True):
+        """Return [(product_id, score)] best first; every query term must match"""
+        terms = tokenize(query)
+        if not terms:
+            return []
+        self._ensure_loaded()
+        with self._lock:
+            doc_count, avg_length = self._stats()
+            if not doc_count:
+                return []
+            last = terms.pop() if prefix else None
+
+            # Exact terms, rarest first, so each one narrows the candidates
+            scores = None
+            for term in sorted(set(terms), key=lambda t: len(self.postings.get(t, ()))):
+                term_scores = self._score_term(term, scores, doc_count, avg_length)
+                scores = term_scores if scores is None else {pid: scores[pid] + s for pid, s in term_scores.items()}
+                if not scores:
+                    return []
+
+            if last is not None:
+                expansions = self._expand_prefix(last)
+                if scores is None:
+                    # Autocomplete: merge the best documents of each completion
+                    return self._merge_impacts(expansions, limit, active_only, doc_count, avg_length)
+                prefix_scores = defaultdict(float)
+                for token in expansions:
+                    for pid, score in self._score_term(token, scores, doc_count, avg_length).items():
+                        prefix_scores[pid] += score
+                scores = {pid: scores[pid] + s for pid, s in prefix_scores.items()}
+
+            if active_only:
+                scores = {pid: s for pid, s in scores.items() if pid in self.active}
+            ranked = sorted(scores.items(), key=lambda item: (-item[1], -item[0]))
+            return ranked[:limit]
+
+    def _merge_impacts(self, tokens, limit, active_only, doc_count, avg_length):
+        merged = defaultdict(float)
+        for token in tokens:
+            taken = 0
+            for pid, score in self._impact_list(token, doc_count, avg_length):
+                if active_only and pid not in self.active:
+                    continue
+                merged[pid] += score
+                taken += 1
+                if taken >= limit:
+                    break
+        ranked = sorted(merged.items(), key=lambda item: (-item[1], -item[0]))
+        return ranked[:limit]
+
+
+index = InvertedIndex()
+
+
+def change_key(version):
+    return f'{INDEX_NAMESPACE}:changes:{version}'
+
+
+def log_change(product_ids):
+    """Record that ``product_ids`` changed, so every index re-reads just them"""
+    version = bump_version(INDEX_NAMESPACE)
+    cache.set(change_key(version), list(product_ids), CHANGE_LOG_TIMEOUT)
+
+
+def invalidate_index():
+    """Make every process rebuild its index in the background, e.g. after a bulk import"""
+    bump_version(INDEX_NAMESPACE)
+
+
+def product_saved(product):
+    log_change([product.pk])
+
+
+def product_deleted(product_id):
+    log_change([product_id])
+
+
+# ============================================
+# PostgreSQL tsvector backend
+# ============================================
+
+def _build_tsquery(query, prefix):
+    terms = tokenize(query)
+    if not terms:
+        return None
+    if prefix:
+        terms[-1] = f'{terms[-1]}:*'
+    return ' & '.join(terms)
+
+
+def _postgres_search(query, limit, prefix, active_only):
+    tsquery = _build_tsquery(query, prefix)
+    if tsquery is None:
+        return []
+    # ts_rank_cd with flag 1 divides by 1 + log(document length), which is
+    # the closest built-in analogue of BM25's length normalisation
+    sql = (
+        "SELECT id, ts_rank_cd(search_vector, query, 1) AS rank "
+        "FROM shop_product, to_tsquery('simple', %s) query "
+        "WHERE search_vector @@ query"
+    )
+    if active_only:
+        sql += " AND is_active"
+    sql += " ORDER BY rank DESC, id DESC LIMIT %s"
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [tsquery, limit])
+        return cursor.fetchall()
+
+
+# ============================================
+# Public API
+# ============================================
+
+def search(query, limit=20, prefix=False, active_only=True):
+    """Return [(product_id, score)] for ``query`` using the best backend"""
+    if connection.vendor == 'postgresql':
+        return _postgres_search(query, limit, prefix, active_only)
+    return index.search(query, limit=limit, prefix=prefix, active_only=active_only)
@@ -1,7 +1,59 @@
 from rest_framework import serializers
-from .models import Product
+from .models import Cart, CartItem, Product
 
 class ProductSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
+
+
+class ProductListSerializer(serializers.ModelSerializer):
+    """Compact product representation for catalog listings.
+
+    Leaves out the description, SEO fields and cost price. Pass ``fields`` to
+    restrict the output further (see ``product_list``'s ``fields=`` param).
+    """
+
+    class Meta:
+        model = Product
+        fields = [
+            'id', 'name', 'slug', 'sku', 'short_description', 'category',
+            'price', 'compare_at_price', 'quantity', 'brand', 'color', 'size',
+            'image', 'is_featured', 'is_new', 'rating_avg', 'rating_count', 'created_at',
+        ]
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class CartProductSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Product
+        fields = ['id', 'name', 'slug', 'price', 'image', 'quantity', 'track_inventory']
+
+
+class CartItemSerializer(serializers.ModelSerializer):
+    product = CartProductSerializer(read_only=True)
+    total = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
+
+    class Meta:
+        model = CartItem
+        fields = ['id', 'product', 'quantity', 'total']
+
+
+class CartSerializer(serializers.ModelSerializer):
+    """Cart with its lines; expects ``Cart.objects.with_totals()`` instances"""
+    items = serializers.SerializerMethodField()
+    total_items = serializers.IntegerField(read_only=True)
+    subtotal = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
+
+    class Meta:
+        model = Cart
+        fields = ['id', 'items', 'total_items', 'subtotal', 'updated_at']
+
+    def get_items(self, cart):
+        items = cart.items.select_related('product').order_by('created_at', 'id')
+        return CartItemSerializer(items, many=True, context=self.context).data
@@ -2,11 +2,21 @@
 from aliexpress_api import AliexpressApi, models
 from django.conf import settings
 import logging
+import threading
+
+from .aliexpress_batching import get_batcher
+from .aliexpress_cache import CachedAliExpress
+from .aliexpress_client import parse_details
+from .aliexpress_governor import get_governor
 
 logger = logging.getLogger(__name__)
 
-class AliExpressService:
-    """Service for interacting with AliExpress API"""
+class SDKBackend:
+    """The three cached operations on top of the aliexpress_api SDK.
+
+    Results have the same shapes as ``ClientBackend``'s, so both backends
+    can share the cache tiers.
+    """
     
     def __init__(self):
         self.client = AliexpressApi(
@@ -16,6 +26,8 @@ class AliExpressService:
             models.Currency.USD,
             settings.ALIEXPRESS_TRACKING_ID
         )
+        # Rate limit and circuit-break the SDK's calls like the client's
+        self.governor = get_governor()
     
     def search_products(self, keywords, max_price=None, min_price=None, limit=20):
         """Search for products by keywords"""
@@ -30,7 +42,7 @@ class AliExpressService:
             if min_price:
                 params['min_sale_price'] = min_price * 100
             
-            response = self.client.get_products(**params)
+            response = self.governor.call(self.client.get_products, **params)
             
             products = []
             for product in response.products:
@@ -54,39 +66,25 @@ class AliExpressService:
             return []
     
     def get_product_details(self, product_id):
-        """Get detailed information for a specific product"""
+        """Get detailed information for a specific product.
+
+        Goes through the worker-wide batcher rather than the SDK, so it is
+        coalesced with every other detail lookup into one governed call.
+        """
         try:
-            products = self.client.get_products_details([str(product_id)])
-            if products:
-                product = products[0]
-                return {
-                    'aliexpress_id': product.product_id,
-                    'title': product.product_title,
-                    'description': product.product_description,
-                    'price': float(product.target_sale_price) / 100,
-                    'images': product.product_image_urls.split(',') if product.product_image_urls else [],
-                    'specs': self._parse_specs(product.product_attributes),
-                    'seller': {
-                        'id': product.seller_id,
-                        'name': product.store_name,
-                        'rating': product.store_rating
-                    }
-                }
-            return None
+            return parse_details(get_batcher().get(product_id))
         except Exception as e:
             logger.error(f"Failed to get product details: {e}")
             return None
     
-    def generate_affiliate_link(self, product_url):
-        """Generate affiliate link for tracking"""
+    def generate_affiliate_links(self, product_urls):
+        """{url: promotion link} for the URLs the API could link"""
         try:
-            links = self.client.get_affiliate_links(product_url)
-            if links:
-                return links[0].promotion_link
-            return product_url
+            links = self.governor.call(self.client.get_affiliate_links, ','.join(product_urls))
+            return {link.source_value: link.promotion_link for link in links or []}
         except Exception as e:
-            logger.error(f"Failed to generate affiliate link: {e}")
-            return product_url
+            logger.error(f"Failed to generate affiliate links: {e}")
+            return {}
     
     def _parse_shipping(self, shipping_data):
         """Parse shipping information"""
@@ -97,11 +95,44 @@ class AliExpressService:
             'cost': float(shipping_data.get('cost', 0)) / 100 if shipping_data.get('cost') else None,
             'days': shipping_data.get('delivery_time')
         }
-    
-    def _parse_specs(self, attributes):
-        """Parse product attributes into specs"""
-        specs = {}
-        if attributes:
-            for attr in attributes:
-                specs[attr.get('name')] = attr.get('value')
-        return specs
\ No newline at end of file
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def _get_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = CachedAliExpress(SDKBackend())
+    return _cache
+
+
+class AliExpressService:
+    """Service for interacting with AliExpress API.
+
+    Every call is served through the worker-wide cache (see
+    CachedAliExpress), so repeated searches, detail lookups and affiliate
+    links do not reach the API again.
+    """
+
+    def __init__(self, cache=None):
+        self.cache = cache or _get_cache()
+
+    def search_products(self, keywords, max_price=None, min_price=None, limit=20):
+        """Search for products by keywords"""
+        return self.cache.search_products(keywords, max_price=max_price, min_price=min_price, limit=limit) or []
+
+    def get_product_details(self, product_id):
+        """Get detailed information for a specific product"""
+        return self.cache.get_product_details(product_id)
+
+    def generate_affiliate_link(self, product_url):
+        """Generate affiliate link for tracking"""
+        return self.cache.generate_affiliate_link(product_url)
+
+    def generate_affiliate_links(self, product_urls):
+        """{url: promotion link} for the URLs the API could link"""
+        return self.cache.generate_affiliate_links(product_urls)
@@ -0,0 +1,125 @@
+# backend/shop/services/aliexpress_batching.py
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from django.conf import settings
+
+from .aliexpress_client import AliExpressClient
+
+
+class ProductDetailBatcher:
+    """Coalesces single-product detail lookups into batched API calls.
+
+    Lookups arriving within ``window`` seconds of the first queued one are
+    sent together as one ``product.detail.get`` call of up to ``max_batch``
+    ids; a full batch goes out immediately. A lookup for an id that is
+    already queued or in flight shares that request's future instead of
+    adding another. Results (or None for ids the API did not return) are
+    fanned back out per id. Thread-safe: sync callers block on ``get()``,
+    coroutines await ``aget()``.
+    """
+
+    def __init__(self, client=None, window=None, max_batch=None):
+        self.client = client or AliExpressClient()
+        self.window = settings.ALIEXPRESS_BATCH_WINDOW if window is None else window
+        self.max_batch = max_batch or settings.ALIEXPRESS_DETAIL_BATCH_SIZE
+        self._queued = {}     # id -> Future, waiting for the window to close
+        self._in_flight = {}  # id -> Future, sent and awaiting the response
+        self._lock = threading.Lock()
+        self._timer = None
+        self._executor = ThreadPoolExecutor(
+            max_workers=settings.ALIEXPRESS_MAX_CONNECTIONS, thread_name_prefix='aliexpress-batch',
+        )
+        self.stats = {'lookups': 0, 'coalesced': 0, 'calls': 0}
+
+    def submit(self, product_id):
+        """Queue a lookup; returns a concurrent.futures.Future of the product"""
+        key = str(product_id)
+        with self._lock:
+            self.stats['lookups'] += 1
+            future = self._queued.get(key) or self._in_flight.get(key)
+            if future is not None:
+                self.stats['coalesced'] += 1
+                return future
+            future = self._queued[key] = Future()
+            if len(self._queued) >= self.max_batch:
+                self._dispatch()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.window, self._window_closed)
+                self._timer.daemon = True
+                self._timer.start()
+        return future
+
+    def get(self, product_id, timeout=None):
+        return self.submit(product_id).result(timeout)
+
+    async def aget(self, product_id):
+        return await asyncio.wrap_future(self.submit(product_id))
+
+    def get_many(self, product_ids, timeout=None):
+        futures = [self.submit(product_id) for product_id in product_ids]
+        return [future.result(timeout) for future in futures]
+
+    async def aget_many(self, product_ids):
+        return await asyncio.gather(*(self.aget(product_id) for product_id in product_ids))
+
+    def _window_closed(self):
+        with self._lock:
+            self._timer = None
+            while self._queued:
+                self._dispatch()
+
+    def _dispatch(self):
+        """Send up to max_batch queued ids; caller holds the lock"""
+        keys = list(self._queued)[:self.max_batch]
+        batch = {key: self._queued.pop(key) for key in keys}
+        self._in_flight.update(batch)
+        if not self._queued and self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self.stats['calls'] += 1
+        self._executor.submit(self._send, batch)
+
+    def _send(self, batch):
+        try:
+            products = self.client.get_product_details(list(batch))
+        except Exception as e:
+            for future in batch.values():
+                future.set_exception(e)
+        else:
+            by_id = {str(product.get('product_id')): product for product in products}
+            for key, future in batch.items():
+                future.set_result(by_id.get(key))
+        finally:
+            with self._lock:
+                for key in batch:
+                    self._in_flight.pop(key, None)
+
+    def close(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            while self._queued:
+                self._dispatch()
+        self._executor.shutdown(wait=True)
+
+
+_batcher = None
+_batcher_lock = threading.Lock()
+
+
+def get_batcher():
+    """The worker-wide batcher, so lookups from every thread coalesce"""
+    global _batcher
+    if _batcher is None:
+        with _batcher_lock:
+            if _batcher is None:
+                _batcher = ProductDetailBatcher()
+    return _batcher
+
+
+def get_product_detail(product_id, timeout=None):
+    """Details for one AliExpress product, batched with concurrent lookups"""
+    return get_batcher().get(product_id, timeout)
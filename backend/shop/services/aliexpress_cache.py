@@ -0,0 +1,275 @@
+# backend/shop/services/aliexpress_cache.py
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal, InvalidOperation
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from django.conf import settings
+from django.core.cache import caches
+
+from ..models import AffiliateLink
+from .aliexpress_batching import get_batcher
+from .aliexpress_client import AliExpressClient, parse_details
+
+logger = logging.getLogger(__name__)
+
+FRESH, STALE, MISS = 'fresh', 'stale', 'miss'
+
+
+# ============================================
+# Key normalization
+# ============================================
+
+def normalize_keywords(keywords):
+    return ' '.join(str(keywords or '').lower().split())
+
+
+def normalize_price(price):
+    if price in (None, ''):
+        return ''
+    try:
+        return str(Decimal(str(price)).quantize(Decimal('0.01')))
+    except InvalidOperation:
+        return str(price)
+
+
+# Query parameters that only track the visit; every other one can pick
+# the product, SKU or landing page and is kept
+TRACKING_PARAMS = {
+    'spm', 'scm', 'scm_id', 'scm-url', 'pvid', 'sk', 'dp', 'algo_pvid', 'algo_exp_id', 'btsid', 'ws_ab_test',
+    'gatewayadapt', 'terminal_id', 'aftraceinfo', 'srcsns', 'businesstype', 'gclid', 'fbclid',
+}
+TRACKING_PREFIXES = ('utm_', 'aff_', 'pdp_')
+
+
+def _is_tracking(name):
+    name = name.lower()
+    return name in TRACKING_PARAMS or name.startswith(TRACKING_PREFIXES)
+
+
+def normalize_url(url):
+    """Scheme/host lower-cased, fragment and tracking parameters dropped, the rest sorted"""
+    parts = urlsplit(str(url).strip())
+    query = sorted(
+        (name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True) if not _is_tracking(name)
+    )
+    return urlunsplit((
+        parts.scheme.lower() or 'https', parts.netloc.lower(), parts.path.rstrip('/'), urlencode(query), '',
+    ))
+
+
+def url_hash(url):
+    return hashlib.sha1(normalize_url(url).encode('utf-8')).hexdigest()
+
+
+# ============================================
+# In-process tier
+# ============================================
+
+class LRUCache:
+    """Bounded, thread-safe LRU of ``key -> (value, fetched_at)``"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                self._data.move_to_end(key)
+            return entry
+
+    def set(self, key, value, fetched_at):
+        with self._lock:
+            self._data[key] = (value, fetched_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+# ============================================
+# Backends
+# ============================================
+
+class ClientBackend:
+    """The three cached operations on top of AliExpressClient.
+
+    Results have the same shapes as ``aliexpress.SDKBackend``'s, so both
+    backends can share the cache tiers.
+    """
+
+    def __init__(self, client=None, batcher=None):
+        self.client = client or AliExpressClient()
+        self.batcher = batcher
+
+    def search_products(self, keywords, max_price=None, min_price=None, limit=20):
+        return self.client.search_products(keywords, max_price=max_price, min_price=min_price, limit=limit)
+
+    def get_product_details(self, product_id):
+        return parse_details((self.batcher or get_batcher()).get(product_id))
+
+    def generate_affiliate_links(self, product_urls):
+        links = self.client.get_affiliate_links(list(product_urls))
+        return {link['source_value']: link['promotion_link'] for link in links if link.get('promotion_link')}
+
+
+# ============================================
+# Cache
+# ============================================
+
+class CachedAliExpress:
+    """Caches AliExpress search results, product details and affiliate links.
+
+    Search results and details live in a per-process LRU and, when
+    ``ALIEXPRESS_CACHE_ALIAS`` names a Django cache, in that shared tier
+    too. Each operation has a TTL after which its entries turn stale; a
+    stale entry is still returned (within the operation's stale window)
+    while one background refresh replaces it. Empty results are treated
+    as failures and never cached. Affiliate links do not change, so they
+    are stored in the AffiliateLink table and generated at most once.
+    """
+
+    def __init__(self, backend=None, maxsize=None, ttls=None, stale=None, alias=None):
+        self.backend = backend or ClientBackend()
+        self.local = LRUCache(maxsize or settings.ALIEXPRESS_CACHE_SIZE)
+        self.ttls = ttls or settings.ALIEXPRESS_CACHE_TTLS
+        self.stale = stale or settings.ALIEXPRESS_CACHE_STALE
+        alias = settings.ALIEXPRESS_CACHE_ALIAS if alias is None else alias
+        self.shared = caches[alias] if alias else None
+        self._refreshing = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='aliexpress-refresh')
+        self.stats = {FRESH: 0, STALE: 0, MISS: 0, 'refreshes': 0}
+
+    # ============ Tiers ============
+
+    def _lookup(self, op, key):
+        entry = self.local.get(key)
+        if entry is None and self.shared is not None:
+            entry = self.shared.get(key)
+            if entry is not None:
+                self.local.set(key, *entry)
+        if entry is None:
+            return None, MISS
+        value, fetched_at = entry
+        age = time.time() - fetched_at
+        if age < self.ttls[op]:
+            return value, FRESH
+        if age < self.ttls[op] + self.stale.get(op, 0):
+            return value, STALE
+        return None, MISS
+
+    def _store(self, op, key, value):
+        fetched_at = time.time()
+        self.local.set(key, value, fetched_at)
+        if self.shared is not None:
+            self.shared.set(key, (value, fetched_at), self.ttls[op] + self.stale.get(op, 0))
+
+    def _fetch(self, op, key, fetch):
+        value = fetch()
+        if value:
+            self._store(op, key, value)
+        return value
+
+    def _revalidate(self, op, key, fetch):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self.stats['refreshes'] += 1
+            self._refreshing[key] = self._executor.submit(self._refresh, op, key, fetch)
+
+    def _refresh(self, op, key, fetch):
+        try:
+            self._fetch(op, key, fetch)
+        except Exception:
+            logger.exception("Failed to refresh cached AliExpress %s", op)
+        finally:
+            with self._lock:
+                self._refreshing.pop(key, None)
+
+    def _cached(self, op, key, fetch):
+        value, state = self._lookup(op, key)
+        with self._lock:
+            self.stats[state] += 1
+        if state == MISS:
+            return self._fetch(op, key, fetch)
+        if state == STALE:
+            self._revalidate(op, key, fetch)
+        return value
+
+    def wait_for_refreshes(self):
+        """Block until background refreshes finish (tests, shutdown)"""
+        with self._lock:
+            pending = list(self._refreshing.values())
+        for future in pending:
+            future.result()
+
+    # ============ Operations ============
+
+    def search_products(self, keywords, max_price=None, min_price=None, limit=20):
+        # Hashed: keywords may hold spaces and characters memcached rejects
+        parts = [normalize_keywords(keywords), normalize_price(min_price), normalize_price(max_price), str(int(limit))]
+        key = 'aliexpress:search:' + hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()
+        return self._cached('search', key, lambda: self.backend.search_products(
+            normalize_keywords(keywords), max_price=max_price, min_price=min_price, limit=limit,
+        ))
+
+    def get_product_details(self, product_id):
+        key = f'aliexpress:details:{product_id}'
+        return self._cached('details', key, lambda: self.backend.get_product_details(product_id))
+
+    def generate_affiliate_links(self, product_urls):
+        """{url: promotion link} for every URL the API could link"""
+        by_hash = {url_hash(url): url for url in product_urls}
+        links = {}
+        for digest in list(by_hash):
+            cached = self.local.get(f'aliexpress:link:{digest}')
+            if cached is not None:
+                links[by_hash.pop(digest)] = cached[0]
+        if by_hash:
+            stored = AffiliateLink.objects.filter(url_hash__in=by_hash).values_list('url_hash', 'promotion_link')
+            for digest, link in stored:
+                self.local.set(f'aliexpress:link:{digest}', link, time.time())
+                links[by_hash.pop(digest)] = link
+        if by_hash:
+            generated = self.backend.generate_affiliate_links(by_hash.values())
+            created = []
+            for digest, url in by_hash.items():
+                link = generated.get(url)
+                if link:
+                    links[url] = link
+                    self.local.set(f'aliexpress:link:{digest}', link, time.time())
+                    created.append(AffiliateLink(url_hash=digest, source_url=normalize_url(url), promotion_link=link))
+            AffiliateLink.objects.bulk_create(created, ignore_conflicts=True)
+        return links
+
+    def generate_affiliate_link(self, product_url):
+        """Affiliate link for one URL, falling back to the URL itself"""
+        return self.generate_affiliate_links([product_url]).get(product_url, product_url)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_aliexpress():
+    """The worker-wide cached AliExpress service"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = CachedAliExpress()
+    return _cache
@@ -1,135 +1,410 @@
 # backend/shop/services/aliexpress_client.py
-import requests
+import asyncio
 import hashlib
+import logging
+import random
+import threading
 import time
-import hmac
-from urllib.parse import urlencode
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
 from django.conf import settings
-import logging
+
+from .aliexpress_governor import CallRejected, get_governor
 
 logger = logging.getLogger(__name__)
 
+# Responses worth another attempt: throttling and server-side failures
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# error_response codes AliExpress uses when a caller is rate limited
+THROTTLE_CODES = {'ApiCallLimit', 'AppCallLimit', 'SessionCallLimit', 'isp.frequency-limited'}
+
+
+class AliExpressError(Exception):
+    """An API call that failed for good (after any retries)"""
+
+    def __init__(self, message, status=None, code=None):
+        super().__init__(message)
+        self.status = status
+        self.code = code
+
+
+class _Retryable(AliExpressError):
+    def __init__(self, message, status=None, code=None, retry_after=None):
+        super().__init__(message, status, code)
+        self.retry_after = retry_after
+
+
+# ============================================
+# Transport
+# ============================================
+
+class AliExpressTransport:
+    """Pooled keep-alive HTTP with per-host limits, timeouts and retries.
+
+    One ``requests.Session`` holds up to ``max_connections`` persistent
+    connections per host and a semaphore per host caps the calls in flight
+    across threads. Coroutines run the blocking calls on a dedicated thread
+    pool of the same size, so ``apost()`` never blocks the event loop.
+    Throttling and 5xx responses are retried with exponential backoff and
+    full jitter, honouring ``Retry-After`` when the server sends one.
+    With a ``governor`` every attempt is rate limited and fed to its
+    circuit breaker; a rejected attempt raises CallRejected and is not
+    retried.
+    """
+
+    def __init__(self, max_connections=10, timeout=10, max_retries=3, backoff_base=0.5, backoff_max=8.0,
+                 governor=None):
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.governor = governor
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max_connections, pool_block=True)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._executor = ThreadPoolExecutor(max_workers=max_connections, thread_name_prefix='aliexpress')
+        self._host_limits = {}
+        self._lock = threading.Lock()
+        self.stats = {'requests': 0, 'retries': 0, 'failures': 0}
+
+    def _host_limit(self, url):
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._host_limits:
+                self._host_limits[host] = threading.BoundedSemaphore(self.max_connections)
+            return self._host_limits[host]
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _attempt(self, url, data):
+        """One HTTP round trip; raises _Retryable for transient failures"""
+        self._count('requests')
+        try:
+            with self._host_limit(url):
+                if self.governor is None:
+                    response = self.session.post(url, data=data, timeout=self.timeout)
+                else:
+                    response = self.governor.call(
+                        self.session.post, url, data=data, timeout=self.timeout,
+                        failed=lambda response: response.status_code >= 500,
+                    )
+        except (requests.ConnectionError, requests.Timeout) as e:
+            raise _Retryable(f'{type(e).__name__}: {e}')
+
+        if response.status_code in RETRY_STATUSES:
+            raise _Retryable(f'HTTP {response.status_code}', status=response.status_code,
+                             retry_after=_retry_after(response))
+        if response.status_code != 200:
+            raise AliExpressError(f'HTTP {response.status_code}', status=response.status_code)
+        try:
+            payload = response.json()
+        except ValueError:
+            raise AliExpressError('Response is not JSON', status=response.status_code)
+
+        error = payload.get('error_response')
+        if error:
+            code = str(error.get('code', ''))
+            message = f"{code}: {error.get('msg', '')}"
+            if code in THROTTLE_CODES:
+                raise _Retryable(message, status=200, code=code, retry_after=_retry_after(response))
+            raise AliExpressError(message, status=200, code=code)
+        return payload
+
+    def _delay(self, attempt, error):
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        if error.retry_after is not None:
+            delay = max(delay, min(error.retry_after, self.backoff_max))
+        return delay
+
+    def _give_up(self, url, error):
+        self._count('failures')
+        logger.warning("AliExpress call to %s failed after %d attempts: %s", url, self.max_retries + 1, error)
+        raise AliExpressError(str(error), status=error.status, code=error.code)
+
+    def post(self, url, data):
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self._attempt(url, data)
+            except _Retryable as error:
+                if attempt == self.max_retries:
+                    self._give_up(url, error)
+                self._count('retries')
+                time.sleep(self._delay(attempt, error))
+
+    async def apost(self, url, data):
+        loop = asyncio.get_running_loop()
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await loop.run_in_executor(self._executor, self._attempt, url, data)
+            except _Retryable as error:
+                if attempt == self.max_retries:
+                    self._give_up(url, error)
+                self._count('retries')
+                await asyncio.sleep(self._delay(attempt, error))
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self.session.close()
+
+
+def _retry_after(response):
+    try:
+        return float(response.headers['Retry-After'])
+    except (KeyError, ValueError):
+        return None
+
+
+_transport = None
+_transport_lock = threading.Lock()
+
+
+def get_transport():
+    """The worker-wide transport, so every client shares one connection pool"""
+    global _transport
+    if _transport is None:
+        with _transport_lock:
+            if _transport is None:
+                _transport = AliExpressTransport(
+                    max_connections=settings.ALIEXPRESS_MAX_CONNECTIONS,
+                    timeout=settings.ALIEXPRESS_TIMEOUT,
+                    max_retries=settings.ALIEXPRESS_MAX_RETRIES,
+                    governor=get_governor(),
+                )
+    return _transport
+
+
+# ============================================
+# Client
+# ============================================
+
+def sign(params, secret):
+    """SHA-256 over the secret-wrapped, key-sorted parameters"""
+    # Sort parameters alphabetically
+    sorted_params = sorted(params.items())
+
+    # Create string to sign
+    string_to_sign = secret
+    for key, value in sorted_params:
+        string_to_sign += key + value
+    string_to_sign += secret
+
+    return hashlib.sha256(string_to_sign.encode('utf-8')).hexdigest().upper()
+
+
+class RequestSigner:
+    """Builds signed form data on top of a fixed set of static parameters.
+
+    The static parameters are sorted and joined once per set of dynamic
+    keys (a template): the string to sign becomes fixed chunks with the
+    dynamic ``key + value`` pairs slotted in between. A call only looks its
+    template up and feeds the pieces to ``hashlib.update``, instead of
+    sorting and concatenating every parameter. Produces the same signature
+    as ``sign()``; dynamic keys override static ones of the same name. The
+    caller's dict is never modified.
+    """
+
+    def __init__(self, secret, static):
+        self.secret = secret
+        self.static = {key: str(value) for key, value in static.items()}
+        self._templates = {}  # dynamic key tuple -> ([(chunk, key), ...], tail)
+
+    def _template(self, keys):
+        static = sorted((key, key + value) for key, value in self.static.items() if key not in keys)
+        slots, chunk, i = [], self.secret, 0
+        for key in sorted(keys):
+            while i < len(static) and static[i][0] < key:
+                chunk += static[i][1]
+                i += 1
+            slots.append((chunk.encode('utf-8'), key))
+            chunk = ''
+        tail = chunk + ''.join(pair for _, pair in static[i:]) + self.secret
+        return slots, tail.encode('utf-8')
+
+    def sign(self, params):
+        """Signature for the static parameters plus ``params`` (all strings)"""
+        keys = tuple(params)
+        template = self._templates.get(keys)
+        if template is None:
+            template = self._templates[keys] = self._template(keys)
+        slots, tail = template
+        digest = hashlib.sha256()
+        for chunk, key in slots:
+            digest.update(chunk)
+            digest.update((key + params[key]).encode('utf-8'))
+        digest.update(tail)
+        return digest.hexdigest().upper()
+
+    def build(self, params):
+        """Form data: static and dynamic parameters plus the signature"""
+        params = {key: str(value) for key, value in params.items() if value is not None}
+        return {**self.static, **params, 'sign': self.sign(params)}
+
+
+def _result(response, key):
+    """Unwrap ``<key>.resp_result.result`` (or ``<key>`` for older payloads)"""
+    data = (response or {}).get(key) or {}
+    return (data.get('resp_result') or {}).get('result') or data
+
+
+def parse_details(product):
+    """Product detail payload (prices in cents) in the shape the services return"""
+    if not product:
+        return None
+    price = product.get('target_sale_price') or product.get('sale_price') or 0
+    return {
+        'aliexpress_id': product.get('product_id'),
+        'title': product.get('product_title'),
+        'description': product.get('product_description'),
+        'price': float(price) / 100,
+        'images': product['product_image_urls'].split(',') if product.get('product_image_urls') else [],
+        'specs': {attr.get('name'): attr.get('value') for attr in product.get('product_attributes') or []},
+        'seller': {
+            'id': product.get('seller_id'),
+            'name': product.get('store_name'),
+            'rating': product.get('store_rating')
+        }
+    }
+
+
 class AliExpressClient:
-    """Custom AliExpress API client"""
-    
-    def __init__(self):
+    """Custom AliExpress API client.
+
+    Every call has a coroutine form (``aget_product_details`` ...) for code
+    that fans out many requests with ``asyncio.gather``, and a blocking
+    form with the original name for existing callers. Failed calls are
+    logged and return empty results, as before.
+    """
+
+    def __init__(self, transport=None, base_url=None):
         self.app_key = settings.ALIEXPRESS_API_KEY
         self.app_secret = settings.ALIEXPRESS_API_SECRET
         self.tracking_id = settings.ALIEXPRESS_TRACKING_ID
-        self.base_url = "https://api.aliexpress.com/rest"
+        self.base_url = base_url or settings.ALIEXPRESS_API_URL
         self.format = "json"
         self.sign_method = "sha256"
-    
-    def _generate_signature(self, params):
-        """Generate API signature"""
-        # Sort parameters alphabetically
-        sorted_params = sorted(params.items())
-        
-        # Create string to sign
-        string_to_sign = self.app_secret
-        for key, value in sorted_params:
-            string_to_sign += key + value
-        string_to_sign += self.app_secret
-        
-        # Generate signature
-        signature = hashlib.sha256(string_to_sign.encode('utf-8')).hexdigest().upper()
-        return signature
-    
-    def _request(self, method, params):
-        """Make API request"""
-        # Add common parameters
-        params.update({
+        self.transport = transport or get_transport()
+        self.signer = RequestSigner(self.app_secret, {
             'app_key': self.app_key,
             'format': self.format,
             'sign_method': self.sign_method,
-            'timestamp': str(int(time.time() * 1000)),
+            'tracking_id': self.tracking_id,
             'v': '2.0',
         })
-        
-        # Generate signature
-        params['sign'] = self._generate_signature(params)
-        
-        # Make request
-        url = f"{self.base_url}/{method}"
-        response = requests.post(url, data=params)
-        
-        if response.status_code == 200:
-            return response.json()
-        else:
-            logger.error(f"API request failed: {response.status_code}")
+
+    def _prepare(self, method, params):
+        """Add the common parameters and signature; returns (url, form data)"""
+        data = self.signer.build({**params, 'timestamp': int(time.time() * 1000)})
+        return f"{self.base_url}/{method}", data
+
+    def _request(self, method, params):
+        """Make API request"""
+        try:
+            return self.transport.post(*self._prepare(method, params))
+        except CallRejected as e:
+            logger.warning(f"API request skipped: {e}")
+            return None
+        except AliExpressError as e:
+            logger.error(f"API request failed: {e}")
+            return None
+
+    async def _arequest(self, method, params):
+        try:
+            return await self.transport.apost(*self._prepare(method, params))
+        except CallRejected as e:
+            logger.warning(f"API request skipped: {e}")
+            return None
+        except AliExpressError as e:
+            logger.error(f"API request failed: {e}")
             return None
-    
+
+    # ============ PRODUCT SEARCH ============
+
+    def _search_params(self, keywords, max_price, min_price, limit):
+        return {
+            'method': 'aliexpress.affiliate.product.query',
+            'keywords': keywords,
+            'min_sale_price': int(min_price * 100) if min_price else None,  # API expects cents
+            'max_sale_price': int(max_price * 100) if max_price else None,
+            'page_size': limit,
+        }
+
+    def _parse_search(self, response):
+        products = _result(response, 'aliexpress_affiliate_product_query_response').get('products') or {}
+        results = []
+        for product in products.get('product', []):
+            results.append({
+                'aliexpress_id': product.get('product_id'),
+                'title': product.get('product_title'),
+                'price': float(product.get('sale_price', 0)) / 100,
+                'original_price': float(product.get('original_price', 0)) / 100 if product.get('original_price') else None,
+                'image_url': product.get('product_main_image_url'),
+                'detail_url': product.get('product_detail_url'),
+                'seller_id': product.get('seller_id'),
+                'seller_name': product.get('store_name'),
+                'orders': product.get('orders', 0),
+                'rating': product.get('evaluate_rate'),
+                'shipping': {
+                    'cost': float(product.get('shipping_cost', 0)) / 100,
+                    'days': product.get('shipping_days'),
+                    'method': product.get('shipping_method')
+                }
+            })
+        return results
+
     def search_products(self, keywords, max_price=None, min_price=None, limit=20):
         """Search for products by keywords"""
-        try:
-            products = self.client.search_products(
-                keywords=keywords,
-                min_price=min_price,
-                max_price=max_price,
-                page_size=limit
-            )
-            
-            results = []
-            for product in products:
-                results.append({
-                    'aliexpress_id': product.get('product_id'),
-                    'title': product.get('product_title'),
-                    'price': float(product.get('sale_price', 0)) / 100,
-                    'original_price': float(product.get('original_price', 0)) / 100 if product.get('original_price') else None,
-                    'image_url': product.get('product_main_image_url'),
-                    'detail_url': product.get('product_detail_url'),
-                    'seller_id': product.get('seller_id'),
-                    'seller_name': product.get('store_name'),
-                    'orders': product.get('orders', 0),
-                    'rating': product.get('evaluate_rate'),
-                    'shipping': {
-                        'cost': float(product.get('shipping_cost', 0)) / 100,
-                        'days': product.get('shipping_days'),
-                        'method': product.get('shipping_method')
-                    }
-                })
-            
-            return results
-        except Exception as e:
-            logger.error(f"AliExpress search failed: {e}")
-            return []
-    
-    def get_product_details(self, product_ids):
-        """Get product details"""
-        if isinstance(product_ids, list):
+        params = self._search_params(keywords, max_price, min_price, limit)
+        return self._parse_search(self._request('api', params))
+
+    async def asearch_products(self, keywords, max_price=None, min_price=None, limit=20):
+        params = self._search_params(keywords, max_price, min_price, limit)
+        return self._parse_search(await self._arequest('api', params))
+
+    # ============ PRODUCT DETAILS ============
+
+    def _details_params(self, product_ids):
+        if isinstance(product_ids, (list, tuple)):
             product_ids = ','.join(str(id) for id in product_ids)
-        
-        params = {
+        return {
             'method': 'aliexpress.affiliate.product.detail.get',
             'product_ids': product_ids,
-            'tracking_id': self.tracking_id,
         }
-        
-        response = self._request('api', params)
-        
-        if response and 'aliexpress_affiliate_product_detail_get_response' in response:
-            data = response['aliexpress_affiliate_product_detail_get_response']
-            if 'products' in data:
-                return data['products'].get('product', [])
-        
-        return []
-    
-    def get_affiliate_links(self, product_urls):
-        """Generate affiliate links"""
-        if isinstance(product_urls, list):
+
+    def _parse_details(self, response):
+        products = _result(response, 'aliexpress_affiliate_product_detail_get_response').get('products') or {}
+        return products.get('product', [])
+
+    def get_product_details(self, product_ids):
+        """Get product details"""
+        return self._parse_details(self._request('api', self._details_params(product_ids)))
+
+    async def aget_product_details(self, product_ids):
+        return self._parse_details(await self._arequest('api', self._details_params(product_ids)))
+
+    # ============ AFFILIATE LINKS ============
+
+    def _links_params(self, product_urls):
+        if isinstance(product_urls, (list, tuple)):
             product_urls = ','.join(product_urls)
-        
-        params = {
+        return {
             'method': 'aliexpress.affiliate.link.generate',
             'source_values': product_urls,
-            'tracking_id': self.tracking_id,
         }
-        
-        response = self._request('api', params)
-        
-        if response and 'aliexpress_affiliate_link_generate_response' in response:
-            data = response['aliexpress_affiliate_link_generate_response']
-            if 'promotion_links' in data:
-                return data['promotion_links'].get('promotion_link', [])
-        
-        return []
\ No newline at end of file
+
+    def _parse_links(self, response):
+        links = _result(response, 'aliexpress_affiliate_link_generate_response').get('promotion_links') or {}
+        return links.get('promotion_link', [])
+
+    def get_affiliate_links(self, product_urls):
+        """Generate affiliate links"""
+        return self._parse_links(self._request('api', self._links_params(product_urls)))
+
+    async def aget_affiliate_links(self, product_urls):
+        return self._parse_links(await self._arequest('api', self._links_params(product_urls)))
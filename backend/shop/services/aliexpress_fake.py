@@ -0,0 +1,168 @@
+# backend/shop/services/aliexpress_fake.py
+import json
+import threading
+import time
+import zlib
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+from .aliexpress_client import sign
+
+
+def fake_product(product_id):
+    """Deterministic product payload in the shape the affiliate API returns"""
+    product_id = int(product_id)
+    return {
+        'product_id': product_id,
+        'product_title': f'Fake product {product_id}',
+        'sale_price': str(1000 + product_id % 9000),
+        'original_price': str(2000 + product_id % 9000),
+        'product_main_image_url': f'https://img.example.com/{product_id}.jpg',
+        'product_detail_url': f'https://www.aliexpress.com/item/{product_id}.html',
+        'seller_id': product_id % 1000,
+        'store_name': f'Store {product_id % 1000}',
+        'orders': product_id % 500,
+        'evaluate_rate': '96.5%',
+    }
+
+
+def _wrap(method, result):
+    key = method.replace('.', '_') + '_response'
+    return {key: {'resp_result': {'resp_code': 200, 'resp_msg': 'Call succeeds', 'result': result}}}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep connections alive between calls
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self.server.fake.record_connection()
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        fake = self.server.fake
+        length = int(self.headers.get('Content-Length', 0))
+        params = dict(parse_qsl(self.rfile.read(length).decode('utf-8')))
+        fake.record_request(params)
+        if fake.latency:
+            time.sleep(fake.latency)
+
+        failure = fake.next_failure()
+        if failure is not None:
+            status, body, headers = failure
+        elif fake.secret is not None and not fake.signature_ok(params):
+            status, body, headers = 200, {'error_response': {'code': 'IncompleteSignature', 'msg': 'Bad sign'}}, {}
+        else:
+            status, body, headers = 200, fake.respond(params), {}
+        self._send(status, body, headers)
+
+    def _send(self, status, body, headers):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class FakeAliExpressServer:
+    """Local stand-in for the AliExpress affiliate API.
+
+    Serves product detail, search and link-generation calls with
+    deterministic data over keep-alive HTTP/1.1, checks signatures when
+    given the app secret, and can be scripted to throttle or fail the next
+    requests so retry behaviour can be exercised offline::
+
+        with FakeAliExpressServer(secret='s') as server:
+            server.fail_next(2, status=503)
+            client = AliExpressClient(base_url=server.url)
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, secret=None):
+        self.latency = latency
+        self.secret = secret
+        self.requests = []
+        self.connections = 0
+        self.missing = set()  # product ids the detail call leaves out
+        self._failures = deque()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.fake = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}/rest'
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # ============ Scripting ============
+
+    def fail_next(self, count, status=503, retry_after=None):
+        headers = {'Retry-After': str(retry_after)} if retry_after is not None else {}
+        with self._lock:
+            self._failures.extend([(status, {'error': 'fake failure'}, headers)] * count)
+
+    def throttle_next(self, count, code='ApiCallLimit'):
+        body = {'error_response': {'code': code, 'msg': 'App call limited'}}
+        with self._lock:
+            self._failures.extend([(200, body, {})] * count)
+
+    def next_failure(self):
+        with self._lock:
+            return self._failures.popleft() if self._failures else None
+
+    def record_request(self, params):
+        with self._lock:
+            self.requests.append(params)
+
+    def record_connection(self):
+        with self._lock:
+            self.connections += 1
+
+    # ============ API ============
+
+    def signature_ok(self, params):
+        unsigned = {key: value for key, value in params.items() if key != 'sign'}
+        return params.get('sign') == sign(unsigned, self.secret)
+
+    def respond(self, params):
+        method = params.get('method', '')
+        if method == 'aliexpress.affiliate.product.detail.get':
+            ids = [pid for pid in params.get('product_ids', '').split(',') if pid and pid not in self.missing]
+            products = [fake_product(pid) for pid in ids]
+            return _wrap(method, {'current_record_count': len(products), 'products': {'product': products}})
+        if method == 'aliexpress.affiliate.product.query':
+            size = int(params.get('page_size', 20))
+            seed = sum(map(ord, params.get('keywords', '')))
+            products = [fake_product(seed * 1000 + i) for i in range(size)]
+            return _wrap(method, {'current_record_count': size, 'products': {'product': products}})
+        if method == 'aliexpress.affiliate.link.generate':
+            urls = [url for url in params.get('source_values', '').split(',') if url]
+            links = [
+                {'source_value': url, 'promotion_link': f'https://s.click.aliexpress.com/e/{zlib.crc32(url.encode())}'}
+                for url in urls
+            ]
+            return _wrap(method, {'total_result_count': len(links), 'promotion_links': {'promotion_link': links}})
+        return {'error_response': {'code': 'InvalidMethod', 'msg': f'Unknown method {method}'}}
@@ -0,0 +1,277 @@
+# backend/shop/services/aliexpress_governor.py
+import logging
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.core.cache import caches
+
+from ..cache import is_shared
+
+logger = logging.getLogger(__name__)
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+
+class CallRejected(Exception):
+    """An outbound call refused locally, without touching the network"""
+
+
+class CircuitOpen(CallRejected):
+    pass
+
+
+class RateLimited(CallRejected):
+    pass
+
+
+# ============================================
+# Rate limiter
+# ============================================
+
+class RateLimiter:
+    """Token bucket shared by every worker through the cache.
+
+    The bucket holds ``burst`` tokens and gains one every ``1 / rate``
+    seconds. It is kept as the generic cell rate algorithm: one cache key
+    holds the theoretical arrival time (TAT), in microseconds, at which
+    the bucket would be full again, and each call reserves a token by
+    moving it forward with an atomic ``incr``. A call whose reservation
+    lies more than ``burst`` tokens ahead of now waits for it when that
+    is within ``max_wait`` seconds; otherwise it hands the token back and
+    is rejected. Unlike a fixed window, which lets ``2 * burst`` calls
+    through around a window edge, at most ``burst`` calls (plus one per
+    worker racing to restart an idle bucket) go out at once.
+    """
+
+    def __init__(self, cache, prefix, rate, burst, max_wait):
+        self.cache = cache
+        self.key = f'{prefix}:tat'
+        self.burst = burst
+        self.interval = max(int(1_000_000 / rate), 1)
+        self.tolerance = burst * self.interval
+        self.max_wait = max_wait
+
+    def _reserve(self, now):
+        try:
+            return self.cache.incr(self.key, self.interval)
+        except ValueError:  # first call, or evicted
+            self.cache.add(self.key, now, timeout=None)
+            try:
+                return self.cache.incr(self.key, self.interval)
+            except ValueError:
+                return now + self.interval
+
+    def acquire(self):
+        now = int(time.time() * 1_000_000)
+        tat = self._reserve(now)
+        if tat - self.interval < now:
+            # Idle long enough for the bucket to be full: restart from now
+            tat = now + self.interval
+            self.cache.set(self.key, tat, timeout=None)
+        wait = (tat - self.tolerance - now) / 1_000_000
+        if wait <= 0:
+            return
+        if wait > self.max_wait:
+            try:
+                self.cache.decr(self.key, self.interval)
+            except ValueError:
+                pass
+            raise RateLimited(f'{self.burst} calls per {self.tolerance / 1_000_000:g}s exhausted')
+        time.sleep(wait)
+
+
+# ============================================
+# Circuit breaker
+# ============================================
+
+class CircuitBreaker:
+    """Error-rate circuit breaker with its state in the cache.
+
+    Calls and failures are counted per ``window`` seconds. Once a window
+    has seen ``min_calls`` calls and the failure ratio reaches
+    ``threshold`` the breaker opens: every worker then fails fast for
+    ``reset_timeout`` seconds. After that a single probe call is let
+    through (half-open); its success closes the breaker and its failure
+    opens it again.
+    """
+
+    def __init__(self, cache, prefix, threshold, min_calls, window, reset_timeout, probe_timeout):
+        self.cache = cache
+        self.prefix = prefix
+        self.threshold = threshold
+        self.min_calls = min_calls
+        self.window = window
+        self.reset_timeout = reset_timeout
+        self.probe_timeout = probe_timeout
+        self.open_key = f'{prefix}:open'
+        self.tripped_key = f'{prefix}:tripped'
+        self.probe_key = f'{prefix}:probe'
+
+    def _window_keys(self):
+        window = int(time.time() // self.window)
+        return f'{self.prefix}:calls:{window}', f'{self.prefix}:failures:{window}'
+
+    def _incr(self, key):
+        self.cache.add(key, 0, timeout=int(self.window) * 2)
+        try:
+            return self.cache.incr(key)
+        except ValueError:
+            return 1
+
+    @property
+    def state(self):
+        flags = self.cache.get_many([self.open_key, self.tripped_key])
+        if self.open_key in flags:
+            return OPEN
+        return HALF_OPEN if self.tripped_key in flags else CLOSED
+
+    def admit(self):
+        """Raise CircuitOpen or return whether the call is the half-open probe"""
+        state = self.state
+        if state == CLOSED:
+            return False
+        if state == HALF_OPEN and self.cache.add(self.probe_key, 1, timeout=self.probe_timeout):
+            return True
+        raise CircuitOpen(f'Circuit {self.prefix} is {state}')
+
+    def record(self, ok, probe=False):
+        if probe:
+            if ok:
+                self.reset()
+            else:
+                self.trip('probe failed')
+            return
+        calls_key, failures_key = self._window_keys()
+        calls = self._incr(calls_key)
+        if ok:
+            return
+        failures = self._incr(failures_key)
+        if calls >= self.min_calls and failures / calls >= self.threshold:
+            self.trip(f'{failures}/{calls} calls failed')
+
+    def trip(self, reason):
+        self.cache.set(self.open_key, time.time(), timeout=self.reset_timeout)
+        self.cache.set(self.tripped_key, 1, timeout=None)
+        self.cache.delete(self.probe_key)
+        logger.warning("Circuit %s opened for %ss: %s", self.prefix, self.reset_timeout, reason)
+
+    def reset(self):
+        self.cache.delete_many([self.open_key, self.tripped_key, self.probe_key, *self._window_keys()])
+        logger.info("Circuit %s closed", self.prefix)
+
+    def error_rate(self):
+        calls_key, failures_key = self._window_keys()
+        counts = self.cache.get_many([calls_key, failures_key])
+        calls = counts.get(calls_key, 0)
+        return {
+            'calls': calls,
+            'failures': counts.get(failures_key, 0),
+            'error_rate': round(counts.get(failures_key, 0) / calls, 4) if calls else 0.0,
+        }
+
+
+# ============================================
+# Governor
+# ============================================
+
+class Governor:
+    """Rate limiter and circuit breaker in front of one partner API.
+
+    ``call(fn, ...)`` checks the breaker, takes a token, then runs ``fn``
+    and records whether it failed: an exception, or a result that
+    ``failed(result)`` flags. Rejected calls raise a CallRejected subclass
+    immediately, so an outage costs a cache round trip per call instead of
+    a worker blocked on timeouts. Latency samples and counters are kept
+    per worker; breaker state and error rate come from the shared cache.
+    When the alias is local to each process, every worker gets its own
+    token bucket, so the rate and burst are divided by WEB_CONCURRENCY.
+    """
+
+    def __init__(self, name='aliexpress', rate=None, burst=None, max_wait=None, threshold=None,
+                 min_calls=None, window=None, reset_timeout=None, probe_timeout=None, alias=None,
+                 samples=1000):
+        cache = caches[settings.ALIEXPRESS_GOVERNOR_ALIAS if alias is None else alias]
+        prefix = f'governor:{name}'
+        workers = 1 if is_shared(cache) else max(settings.WEB_CONCURRENCY, 1)
+        self.limiter = RateLimiter(
+            cache, prefix,
+            rate=(rate or settings.ALIEXPRESS_RATE_LIMIT) / workers,
+            burst=max((burst or settings.ALIEXPRESS_RATE_BURST) // workers, 1),
+            max_wait=settings.ALIEXPRESS_RATE_MAX_WAIT if max_wait is None else max_wait,
+        )
+        self.breaker = CircuitBreaker(
+            cache, prefix,
+            threshold=threshold or settings.ALIEXPRESS_BREAKER_THRESHOLD,
+            min_calls=min_calls or settings.ALIEXPRESS_BREAKER_MIN_CALLS,
+            window=window or settings.ALIEXPRESS_BREAKER_WINDOW,
+            reset_timeout=reset_timeout or settings.ALIEXPRESS_BREAKER_RESET,
+            probe_timeout=probe_timeout or settings.ALIEXPRESS_TIMEOUT,
+        )
+        self._latencies = deque(maxlen=samples)
+        self._lock = threading.Lock()
+        self.stats = {'calls': 0, 'failures': 0, 'rejected': 0, 'rate_limited': 0}
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def call(self, fn, *args, failed=None, **kwargs):
+        try:
+            probe = self.breaker.admit()
+            self.limiter.acquire()
+        except CircuitOpen:
+            self._count('rejected')
+            raise
+        except RateLimited:
+            self._count('rate_limited')
+            raise
+
+        started = time.perf_counter()
+        ok = False
+        try:
+            result = fn(*args, **kwargs)
+            ok = not (failed and failed(result))
+            return result
+        finally:
+            with self._lock:
+                self._latencies.append(time.perf_counter() - started)
+                self.stats['calls'] += 1
+                self.stats['failures'] += not ok
+            self.breaker.record(ok, probe)
+
+    def metrics(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            stats = dict(self.stats)
+
+        def percentile(p):
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))], 4) if latencies else None
+
+        return {
+            **stats,
+            'state': self.breaker.state,
+            'window': self.breaker.error_rate(),
+            'latency': {
+                'samples': len(latencies),
+                'mean': round(sum(latencies) / len(latencies), 4) if latencies else None,
+                'p50': percentile(0.5),
+                'p95': percentile(0.95),
+                'max': round(latencies[-1], 4) if latencies else None,
+            },
+        }
+
+
+_governor = None
+_governor_lock = threading.Lock()
+
+
+def get_governor():
+    """The worker-wide AliExpress governor"""
+    global _governor
+    if _governor is None:
+        with _governor_lock:
+            if _governor is None:
+                _governor = Governor()
+    return _governor
@@ -0,0 +1,146 @@
+# backend/shop/services/aliexpress_sync.py
+import hashlib
+import json
+import time
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .. import search
+from ..models import AliExpressProduct, AliExpressSyncRun, Product
+from ..response_cache import invalidate_catalog
+from .aliexpress_batching import get_batcher
+
+# Product fields the sync owns; everything else is left to the shop staff
+SYNC_FIELDS = ['name', 'price', 'compare_at_price']
+
+CENTS = Decimal('0.01')
+MAX_PRICE = Decimal('99999999.99')  # Product.price is max_digits=10
+
+
+def _money(cents):
+    try:
+        return (Decimal(str(cents)) / 100).quantize(CENTS)
+    except (InvalidOperation, TypeError):
+        return None
+
+
+def product_fields(payload):
+    """Product field values for an AliExpress detail payload (prices in cents).
+
+    Returns None when the payload lacks a usable title or sale price, so a
+    bad item is skipped instead of blanking the product or writing NULL
+    into its price.
+    """
+    name = str(payload.get('product_title') or '').strip()[:200]
+    price = _money(payload.get('sale_price'))
+    if not name or price is None or not CENTS <= price <= MAX_PRICE:
+        return None
+    original = _money(payload.get('original_price'))
+    return {
+        'name': name,
+        'price': price,
+        'compare_at_price': original if original and price < original <= MAX_PRICE else None,
+    }
+
+
+def content_hash(fields):
+    data = json.dumps(fields, sort_keys=True, default=str)
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+class AliExpressSync:
+    """Refresh mapped products from AliExpress in batches.
+
+    Each batch costs a fixed number of queries whatever its size: one read
+    of the mappings with their products, one ``bulk_update`` per distinct
+    set of changed fields, one for the new content hashes and one stamping
+    ``last_synced_at``. Payloads whose hash matches the stored one skip the
+    field comparison entirely. Details come from the worker-wide batcher,
+    so lookups go out as multi-id calls. Products the API does not return
+    or returns without a valid title and price count as failed and are
+    retried on the next run.
+    """
+
+    def __init__(self, batcher=None, batch_size=500):
+        self.batcher = batcher or get_batcher()
+        self.batch_size = batch_size
+
+    def pending(self, stale_after=None):
+        """Mappings never synced, or last synced before ``stale_after`` ago"""
+        mappings = AliExpressProduct.objects.all()
+        if stale_after is not None:
+            cutoff = timezone.now() - stale_after
+            mappings = mappings.filter(Q(last_synced_at__isnull=True) | Q(last_synced_at__lt=cutoff))
+        return mappings
+
+    def run(self, mappings=None):
+        mappings = self.pending() if mappings is None else mappings
+        started = time.perf_counter()
+        run = AliExpressSyncRun.objects.create()
+        last_pk = 0
+        while True:
+            batch = list(
+                mappings.filter(pk__gt=last_pk).order_by('pk').select_related('product')
+                .only('aliexpress_id', 'content_hash', *(f'product__{name}' for name in SYNC_FIELDS))
+                [:self.batch_size]
+            )
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+            self.sync_batch(batch, run)
+
+        run.finished_at = timezone.now()
+        run.duration = time.perf_counter() - started
+        run.save(update_fields=['fetched', 'changed', 'failed', 'finished_at', 'duration'])
+        if run.changed:
+            # bulk_update skips post_save; the versions live in the shared cache
+            invalidate_catalog()
+        return run
+
+    def sync_batch(self, batch, run):
+        payloads = self.batcher.get_many([mapping.aliexpress_id for mapping in batch])
+        now = timezone.now()
+        synced, rehashed, groups = [], [], {}
+        for mapping, payload in zip(batch, payloads):
+            fields = product_fields(payload) if payload else None
+            if fields is None:
+                run.failed += 1
+                continue
+            run.fetched += 1
+            synced.append(mapping.pk)
+            digest = content_hash(fields)
+            if digest == mapping.content_hash:
+                continue
+            mapping.content_hash = digest
+            rehashed.append(mapping)
+
+            product = mapping.product
+            changed = tuple(name for name in SYNC_FIELDS if getattr(product, name) != fields[name])
+            if changed:
+                for name in changed:
+                    setattr(product, name, fields[name])
+                product.updated_at = now
+                groups.setdefault(changed, []).append(product)
+                run.changed += 1
+
+        with transaction.atomic():
+            # Grouped by changed fields so a row only rewrites what moved
+            for changed, products in groups.items():
+                Product.objects.bulk_update(products, [*changed, 'updated_at'])
+            if rehashed:
+                AliExpressProduct.objects.bulk_update(rehashed, ['content_hash'])
+            if synced:
+                AliExpressProduct.objects.filter(pk__in=synced).update(last_synced_at=now)
+        renamed = [product.pk for changed, products in groups.items() if 'name' in changed for product in products]
+        if renamed:
+            search.log_change(renamed)
+
+
+def sync_products(stale_after=timedelta(hours=6), batch_size=500, batcher=None):
+    """Sync the mappings not refreshed within ``stale_after`` (all when None)"""
+    sync = AliExpressSync(batcher=batcher, batch_size=batch_size)
+    return sync.run(sync.pending(stale_after))
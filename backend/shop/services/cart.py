@@ -0,0 +1,127 @@
+# backend/shop/services/cart.py
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from ..models import Cart, CartItem, Product
+
+# Session key holding an anonymous visitor's cart id. Session data survives
+# the key rotation on login, so the cart can still be found and merged.
+CART_SESSION_KEY = 'cart_id'
+
+
+class CartError(Exception):
+    """A cart change that cannot be applied (unknown product, no stock)"""
+
+
+def _session_key(request):
+    if not request.session.session_key:
+        request.session.save()
+    return request.session.session_key
+
+
+def get_cart(request, create=False):
+    """Return the request's cart with totals annotated, or None"""
+    carts = Cart.objects.with_totals()
+    if request.user.is_authenticated:
+        cart = carts.filter(user=request.user).order_by('-created_at').first()
+        if cart is None and create:
+            Cart.objects.create(user=request.user)
+            cart = carts.filter(user=request.user).order_by('-created_at').first()
+        return cart
+
+    cart_id = request.session.get(CART_SESSION_KEY)
+    cart = carts.filter(pk=cart_id, user__isnull=True).first() if cart_id else None
+    if cart is None and create:
+        created, _ = Cart.objects.get_or_create(session_id=_session_key(request))
+        request.session[CART_SESSION_KEY] = created.pk
+        cart = carts.get(pk=created.pk)
+    return cart
+
+
+def _check_stock(product, quantity):
+    if quantity < 1:
+        raise CartError('Quantity must be at least 1')
+    if product.track_inventory and quantity > product.quantity:
+        raise CartError(f'Only {product.quantity} of {product.name} in stock')
+
+
+def _get_product(product_id):
+    try:
+        return Product.objects.only('id', 'name', 'quantity', 'track_inventory').get(pk=product_id, is_active=True)
+    except (Product.DoesNotExist, ValueError, TypeError):
+        raise CartError('Product not found')
+
+
+def add_item(cart, product_id, quantity=1):
+    """Add ``quantity`` of a product, increasing an existing line. Returns the product"""
+    product = _get_product(product_id)
+    existing = cart.items.filter(product=product).values_list('quantity', flat=True).first() or 0
+    _check_stock(product, existing + quantity)
+    if existing:
+        cart.items.filter(product=product).update(quantity=F('quantity') + quantity)
+        return product
+    try:
+        with transaction.atomic():
+            CartItem.objects.create(cart=cart, product=product, quantity=quantity)
+    except IntegrityError:
+        # A parallel request created the line first
+        cart.items.filter(product=product).update(quantity=F('quantity') + quantity)
+    return product
+
+
+def set_quantity(cart, product_id, quantity):
+    """Set a line's quantity; zero removes it"""
+    if quantity == 0:
+        return remove_item(cart, product_id)
+    product = _get_product(product_id)
+    _check_stock(product, quantity)
+    if not cart.items.filter(product=product).update(quantity=quantity):
+        raise CartError('Product is not in the cart')
+
+
+def remove_item(cart, product_id):
+    deleted, _ = cart.items.filter(product_id=product_id).delete()
+    if not deleted:
+        raise CartError('Product is not in the cart')
+
+
+def merge_carts(source, target):
+    """Move every line of ``source`` into ``target`` and delete ``source``.
+
+    Lines for products already in ``target`` are summed with one bulk
+    update; the rest are re-parented with a single UPDATE.
+    """
+    if source.pk == target.pk:
+        return target
+    with transaction.atomic():
+        existing = {item.product_id: item for item in target.items.all()}
+        incoming = list(source.items.all())
+        overlapping = []
+        for item in incoming:
+            if item.product_id in existing:
+                line = existing[item.product_id]
+                line.quantity += item.quantity
+                overlapping.append(line)
+        if overlapping:
+            CartItem.objects.bulk_update(overlapping, ['quantity'])
+        source.items.exclude(product_id__in=existing).update(cart=target)
+        source.delete()
+    return target
+
+
+def merge_session_cart(request, user):
+    """Fold the anonymous session cart into the user's cart after login"""
+    cart_id = request.session.pop(CART_SESSION_KEY, None)
+    if not cart_id:
+        return None
+    anonymous = Cart.objects.filter(pk=cart_id, user__isnull=True).first()
+    if anonymous is None:
+        return None
+    target = Cart.objects.filter(user=user).order_by('-created_at').first()
+    if target is None:
+        # Adopt the anonymous cart instead of copying it
+        anonymous.user = user
+        anonymous.session_id = None
+        anonymous.save(update_fields=['user', 'session_id', 'updated_at'])
+        return anonymous
+    return merge_carts(anonymous, target)
@@ -0,0 +1,230 @@
+# backend/shop/services/catalog_io.py
+import csv
+import json
+import os
+from dataclasses import dataclass, field
+
+from django.db import transaction
+from django.db.models import F
+
+from .. import search
+from ..categories import invalidate_tree
+from ..filters import parse_bool, parse_decimal
+from ..models import Category, Product
+from ..response_cache import invalidate_catalog
+from .slugs import SlugAllocator, base_slug
+
+# Columns read and written by the catalog pipeline, besides sku/slug/category
+TEXT_FIELDS = [
+    'name', 'description', 'short_description', 'brand', 'material', 'color', 'size',
+    'dimensions', 'meta_title', 'meta_description', 'meta_keywords',
+]
+DECIMAL_FIELDS = ['price', 'compare_at_price', 'cost_price', 'weight']
+INT_FIELDS = ['quantity', 'low_stock_threshold']
+BOOL_FIELDS = ['track_inventory', 'is_featured', 'is_active', 'is_new']
+NULLABLE_FIELDS = {'compare_at_price', 'cost_price', 'weight'}
+
+COLUMNS = ['sku', 'slug', 'category', *TEXT_FIELDS, *DECIMAL_FIELDS, *INT_FIELDS, *BOOL_FIELDS]
+REQUIRED = ['sku', 'name', 'category', 'price']
+
+
+def detect_format(path, fmt=None):
+    if fmt:
+        return fmt
+    return 'jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+# ============================================
+# Export
+# ============================================
+
+def export_rows(queryset=None, chunk_size=2000):
+    """Yield one dict per product without loading the catalog into memory"""
+    queryset = Product.objects.all() if queryset is None else queryset
+    fields = [name for name in COLUMNS if name != 'category']
+    rows = queryset.order_by('pk').values(*fields, category_name=F('category__name'))
+    for row in rows.iterator(chunk_size=chunk_size):
+        row['category'] = row.pop('category_name')
+        yield {name: row[name] for name in COLUMNS}
+
+
+def write_rows(rows, stream, fmt):
+    count = 0
+    if fmt == 'jsonl':
+        for row in rows:
+            stream.write(json.dumps(row, default=str) + '\n')
+            count += 1
+        return count
+    writer = csv.DictWriter(stream, fieldnames=COLUMNS)
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+    return count
+
+
+# ============================================
+# Import
+# ============================================
+
+class RowError(ValueError):
+    pass
+
+
+def read_rows(stream, fmt):
+    """Yield raw dicts from a CSV or JSONL stream, one at a time.
+
+    A JSONL line that does not parse is yielded as a RowError, so the
+    importer reports it against its row number like any other bad row.
+    """
+    if fmt == 'jsonl':
+        for line in stream:
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError as e:
+                    yield RowError(f'invalid JSON: {e}')
+        return
+    yield from csv.DictReader(stream)
+
+
+def _clean(raw, name, parser):
+    value = raw[name]
+    if value is None or value == '':
+        return None
+    try:
+        return parser(str(value))
+    except (ValueError, ArithmeticError):
+        raise RowError(f"{name}: invalid value '{value}'")
+
+
+@dataclass
+class ImportResult:
+    rows: int = 0
+    created: int = 0
+    updated: int = 0
+    errors: list = field(default_factory=list)  # [(row number, message)]
+
+
+class CatalogImporter:
+    """Upsert products on ``sku`` in batches with ``bulk_create``.
+
+    Categories are resolved by name from one lookup loaded up front, slugs
+    for new products come from a SlugAllocator, and each batch commits in
+    its own transaction. ``checkpoint(rows_done)`` is called after every
+    committed batch so an interrupted import can resume with ``start=``.
+    """
+
+    def __init__(self, batch_size=1000, create_categories=False, checkpoint=None):
+        self.batch_size = batch_size
+        self.create_categories = create_categories
+        self.checkpoint = checkpoint
+        self.categories = dict(Category.objects.order_by().values_list('name', 'pk'))
+        self.slugs = SlugAllocator(Product)
+
+    def category_id(self, name):
+        name = str(name).strip()
+        if name not in self.categories:
+            if not self.create_categories:
+                raise RowError(f"category: unknown category '{name}'")
+            self.categories[name] = Category.objects.create(name=name).pk
+        return self.categories[name]
+
+    def convert(self, raw):
+        """Turn a raw row into model field values for the columns it has"""
+        if isinstance(raw, RowError):
+            raise raw
+        if not isinstance(raw, dict):
+            raise RowError('expected an object')
+        missing = [name for name in REQUIRED if raw.get(name) in (None, '')]
+        if missing:
+            raise RowError(f"missing {', '.join(missing)}")
+        values = {'sku': str(raw['sku']).strip()}
+        if raw.get('slug'):
+            values['slug'] = str(raw['slug'])
+        for name in TEXT_FIELDS:
+            if name in raw:
+                values[name] = '' if raw[name] is None else str(raw[name])
+        for names, parser in ((DECIMAL_FIELDS, parse_decimal), (INT_FIELDS, int), (BOOL_FIELDS, parse_bool)):
+            for name in names:
+                if name in raw:
+                    value = _clean(raw, name, parser)
+                    if value is not None or name in NULLABLE_FIELDS:
+                        values[name] = value
+        # Last, so a row rejected above never creates its category
+        values['category_id'] = self.category_id(raw['category'])
+        return values
+
+    def run(self, rows, start=0):
+        result = ImportResult(rows=start)
+        batch = []
+        for number, raw in enumerate(rows, 1):
+            if number <= start:
+                continue
+            try:
+                batch.append(self.convert(raw))
+            except RowError as e:
+                result.errors.append((number, str(e)))
+            result.rows = number
+            if len(batch) >= self.batch_size:
+                self.flush(batch, result)
+                batch = []
+                if self.checkpoint:
+                    self.checkpoint(number)
+        if batch:
+            self.flush(batch, result)
+        if self.checkpoint:
+            self.checkpoint(result.rows)
+        # bulk_create skips post_save; refresh derived state once
+        invalidate_tree()
+        invalidate_catalog()
+        search.invalidate_index()
+        return result
+
+    def flush(self, batch, result):
+        # Later rows for the same sku win
+        by_sku = {values['sku']: values for values in batch}
+        existing = dict(Product.objects.filter(sku__in=by_sku).order_by().values_list('sku', 'slug'))
+        new = [values for sku, values in by_sku.items() if sku not in existing]
+        self.slugs.reserve(base_slug(values.get('slug') or values['name'], 'product') for values in new)
+        for values in new:
+            values['slug'] = self.slugs.allocate(base_slug(values.get('slug') or values['name'], 'product'))
+        for sku, values in by_sku.items():
+            if sku in existing:
+                values['slug'] = existing[sku]
+
+        # Rows are grouped by the columns they carry so an update never
+        # resets a column the file left out
+        groups = {}
+        for values in by_sku.values():
+            groups.setdefault(frozenset(values), []).append(values)
+        with transaction.atomic():
+            for columns, group in groups.items():
+                Product.objects.bulk_create(
+                    [Product(**values) for values in group],
+                    update_conflicts=True,
+                    unique_fields=['sku'],
+                    update_fields=sorted(columns - {'sku', 'slug'}) + ['updated_at'],
+                )
+        result.created += len(new)
+        result.updated += len(by_sku) - len(new)
+
+
+def import_file(path, fmt=None, batch_size=1000, create_categories=False, resume=False, state_path=None):
+    """Import ``path``, recording progress in ``state_path`` after every batch"""
+    fmt = detect_format(path, fmt)
+    state_path = state_path or f'{path}.progress'
+    start = 0
+    if resume and os.path.exists(state_path):
+        with open(state_path) as f:
+            start = json.load(f)['rows']
+
+    def checkpoint(rows_done):
+        with open(state_path, 'w') as f:
+            json.dump({'path': os.path.abspath(path), 'rows': rows_done}, f)
+
+    importer = CatalogImporter(batch_size, create_categories, checkpoint)
+    with open(path, newline='', encoding='utf-8') as stream:
+        result = importer.run(read_rows(stream, fmt), start=start)
+    os.remove(state_path)
+    return result
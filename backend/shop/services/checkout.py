@@ -0,0 +1,121 @@
+# backend/shop/services/checkout.py
+from dataclasses import dataclass, field
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, F, Q, When
+
+from users.activity import log_activity
+
+from ..models import Order, OrderItem, Product
+from ..response_cache import invalidate_catalog
+
+# Order fields the caller supplies about the customer and delivery
+CUSTOMER_FIELDS = [
+    'first_name', 'last_name', 'email', 'phone',
+    'address_line1', 'address_line2', 'city', 'state', 'postal_code', 'country',
+    'shipping_method', 'notes', 'ip_address',
+]
+
+
+@dataclass
+class CheckoutResult:
+    success: bool
+    order: Order = None
+    error: str = ''
+    out_of_stock: list = field(default_factory=list)
+
+
+class _StockShortage(Exception):
+    def __init__(self, product_ids):
+        self.product_ids = product_ids
+
+
+def reserve_stock(product_id, quantity):
+    """Decrement stock and count the sale in one conditional UPDATE.
+
+    Products that do not track inventory only get their sales counted. The
+    WHERE clause makes the decrement a no-op when stock is short, so two
+    buyers can never both take the last unit. Returns True on success.
+    """
+    updated = (
+        Product.objects
+        .filter(pk=product_id, is_active=True)
+        .filter(Q(track_inventory=False) | Q(quantity__gte=quantity))
+        .update(
+            quantity=Case(
+                When(track_inventory=True, then=F('quantity') - quantity),
+                default=F('quantity'),
+            ),
+            sales_count=F('sales_count') + quantity,
+        )
+    )
+    return updated == 1
+
+
+def checkout(cart, user, payment_method, customer, shipping_cost=Decimal('0')):
+    """Convert ``cart`` into an Order in a single transaction.
+
+    ``customer`` holds the contact and address fields for the order. Either
+    every line is reserved and the order is created, or nothing changes and
+    the result lists the products that could not be supplied.
+    """
+    items = list(cart.items.select_related('product').order_by('product_id'))
+    if not items:
+        return CheckoutResult(success=False, error='Cart is empty')
+
+    try:
+        with transaction.atomic():
+            # Reserve in product id order so concurrent checkouts lock rows
+            # in the same sequence and cannot deadlock each other
+            short = [item.product_id for item in items if not reserve_stock(item.product_id, item.quantity)]
+            if short:
+                raise _StockShortage(short)
+
+            subtotal = sum((item.product.price * item.quantity for item in items), Decimal('0'))
+            order = Order.objects.create(
+                user=user,
+                payment_method=payment_method,
+                subtotal=subtotal,
+                shipping_cost=shipping_cost,
+                total=subtotal + shipping_cost,
+                **{name: customer[name] for name in CUSTOMER_FIELDS if name in customer},
+            )
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product_id=item.product_id, quantity=item.quantity, price=item.product.price)
+                for item in items
+            ])
+            cart.items.all().delete()
+
+            # Cached listings show stock; refresh them once something sells out
+            sold_out = Product.objects.filter(
+                pk__in=[item.product_id for item in items], track_inventory=True, quantity=0,
+            )
+            if sold_out.exists():
+                transaction.on_commit(invalidate_catalog)
+    except _StockShortage as shortage:
+        return CheckoutResult(success=False, error='Out of stock', out_of_stock=_shortages(items, shortage.product_ids))
+
+    # Guest orders have no user to attribute the activity to
+    for item in items if order.user_id is not None else ():
+        log_activity(
+            user, 'place_order', f'Ordered {order.order_number}',
+            product_id=item.product_id, quantity=item.quantity, order_id=order.pk,
+        )
+    return CheckoutResult(success=True, order=order)
+
+
+def _shortages(items, product_ids):
+    available = dict(
+        Product.objects.filter(pk__in=product_ids, is_active=True).values_list('pk', 'quantity')
+    )
+    requested = {item.product_id: item for item in items}
+    return [
+        {
+            'product_id': product_id,
+            'name': requested[product_id].product.name,
+            'requested': requested[product_id].quantity,
+            'available': max(available.get(product_id, 0), 0),
+        }
+        for product_id in product_ids
+    ]
@@ -0,0 +1,82 @@
+# backend/shop/services/order_numbers.py
+import threading
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from ..models import OrderNumberSequence
+
+ORDER_NUMBER_FORMAT = "INV-{date:%Y%m%d}-{number:04d}"
+
+
+def allocate(day, count=1):
+    """Reserve ``count`` consecutive numbers for ``day``; returns a range.
+
+    The counter row is incremented before it is read, so the row lock taken
+    by the UPDATE (or SQLite's write lock) is held until commit and no two
+    transactions can read the same value.
+    """
+    with transaction.atomic():
+        updated = OrderNumberSequence.objects.filter(date=day).update(last_value=F('last_value') + count)
+        if not updated:
+            try:
+                with transaction.atomic():
+                    OrderNumberSequence.objects.create(date=day, last_value=count)
+            except IntegrityError:
+                # Another transaction created today's row first
+                OrderNumberSequence.objects.filter(date=day).update(last_value=F('last_value') + count)
+        last = OrderNumberSequence.objects.filter(date=day).values_list('last_value', flat=True).get()
+    return range(last - count + 1, last + 1)
+
+
+class OrderNumberAllocator:
+    """Hands out order numbers, reserving them from the database in blocks.
+
+    With a block size above 1 each process takes numbers from its own
+    reserved block, so most orders need no allocation query at all. Numbers
+    stay unique but may be out of creation order across workers, and unused
+    numbers in a block are skipped when a worker exits. Blocks are only
+    reserved outside transactions, where the reservation commits at once.
+    """
+
+    def __init__(self, block_size=1):
+        self.block_size = max(1, block_size)
+        self._lock = threading.Lock()
+        self._day = None
+        self._numbers = iter(())
+
+    def next_number(self, day=None):
+        day = day or timezone.localdate()
+        with self._lock:
+            if day != self._day:
+                self._day = day
+                self._numbers = iter(())
+            number = next(self._numbers, None)
+            if number is None:
+                if connection.in_atomic_block:
+                    # A block reserved here would be undone by a rollback of
+                    # the caller's transaction, so take a single number
+                    number = allocate(day)[0]
+                else:
+                    self._numbers = iter(allocate(day, self.block_size))
+                    number = next(self._numbers)
+        return ORDER_NUMBER_FORMAT.format(date=day, number=number)
+
+
+_allocator = None
+_allocator_lock = threading.Lock()
+
+
+def get_allocator():
+    global _allocator
+    if _allocator is None:
+        with _allocator_lock:
+            if _allocator is None:
+                _allocator = OrderNumberAllocator(settings.ORDER_NUMBER_BLOCK_SIZE)
+    return _allocator
+
+
+def next_order_number():
+    return get_allocator().next_number()
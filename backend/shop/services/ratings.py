@@ -0,0 +1,161 @@
+# backend/shop/services/ratings.py
+from collections import defaultdict
+from contextlib import nullcontext
+from functools import reduce
+from operator import add
+
+from django.db import transaction
+from django.db.models import Count, F, FloatField, Q, Value
+from django.db.models.functions import Cast, Coalesce, NullIf
+
+from ..models import Product, ProductReview
+from ..response_cache import invalidate_catalog
+
+STARS = range(1, 6)
+HISTOGRAM_FIELDS = [f'rating_{star}' for star in STARS]
+RATING_FIELDS = ['rating_avg', 'rating_count', *HISTOGRAM_FIELDS]
+
+
+def _increments(deltas):
+    """UPDATE expressions adding {star: delta} to a product's histogram.
+
+    Count and average are recomputed from the updated histogram columns in
+    the same statement, so they can never disagree with it.
+    """
+    counts = {star: F(f'rating_{star}') + deltas[star] if deltas.get(star) else F(f'rating_{star}') for star in STARS}
+    count = reduce(add, counts.values())
+    total = reduce(add, (counts[star] * star for star in STARS))
+    return {
+        **{f'rating_{star}': counts[star] for star in STARS if deltas.get(star)},
+        'rating_count': count,
+        'rating_avg': Coalesce(Cast(total, FloatField()) / NullIf(count, 0), Value(0.0)),
+    }
+
+
+def apply(changes):
+    """Apply {product_id: {star: delta}} with F() updates of the rating columns.
+
+    Products sharing the same deltas (typically a single +1 or -1) are
+    updated together, so the statement count is bounded by the number of
+    distinct deltas rather than products.
+    """
+    by_deltas = defaultdict(list)
+    for product_id, deltas in changes.items():
+        deltas = tuple(sorted((star, delta) for star, delta in deltas.items() if delta))
+        if deltas:
+            by_deltas[deltas].append(product_id)
+    if not by_deltas:
+        return
+    # A single UPDATE is atomic on its own; several go in one transaction
+    with transaction.atomic() if len(by_deltas) > 1 else nullcontext():
+        for deltas, product_ids in by_deltas.items():
+            Product.objects.filter(pk__in=product_ids).update(**_increments(dict(deltas)))
+    transaction.on_commit(invalidate_catalog)
+
+
+def _move(changes, before, after):
+    """Record a review going from ``before`` to ``after`` (its ``rated`` values)"""
+    if before == after:
+        return
+    if before:
+        changes[before[0]][before[1]] -= 1
+    if after:
+        changes[after[0]][after[1]] += 1
+
+
+def review_saved(review, created):
+    """Count a saved review's change of approval, rating or product.
+
+    ``review._rated`` is what the stored row counted before the save, read
+    under a row lock by ProductReview.save() in the same transaction.
+    """
+    after = review.rated
+    if created:
+        before = None
+    elif hasattr(review, '_rated'):
+        before = review._rated
+    else:
+        # Saved without ProductReview.save() (e.g. a raw fixture load); recount instead
+        recompute(Product.objects.filter(pk=review.product_id))
+        return
+    changes = defaultdict(lambda: defaultdict(int))
+    _move(changes, before, after)
+    apply(changes)
+    review.__dict__.pop('_rated', None)
+
+
+def review_deleted(review):
+    changes = defaultdict(lambda: defaultdict(int))
+    # Reviews deleted through a queryset or a cascade were just read from the database
+    _move(changes, review.__dict__.pop('_rated', review.rated), None)
+    apply(changes)
+
+
+def set_approved(queryset, approved):
+    """``queryset.update(is_approved=approved)`` keeping product ratings in step.
+
+    Only reviews whose approval actually changes are updated. Their rows
+    are locked while the per-product deltas are applied, so a concurrent
+    edit cannot count the same review twice. Returns the number changed.
+    """
+    with transaction.atomic():
+        rows = list(
+            ProductReview.objects.filter(pk__in=queryset.values('pk'), is_approved=not approved)
+            .select_for_update().values_list('pk', 'product_id', 'rating')
+        )
+        if not rows:
+            return 0
+        ProductReview.objects.filter(pk__in=[pk for pk, _, _ in rows]).update(is_approved=approved)
+        changes = defaultdict(lambda: defaultdict(int))
+        for _, product_id, rating in rows:
+            changes[product_id][rating] += 1 if approved else -1
+        apply(changes)
+    return len(rows)
+
+
+# ============================================
+# Repair
+# ============================================
+
+def _values(histogram):
+    """RATING_FIELDS values for a [1-star, ..., 5-star] histogram"""
+    count = sum(histogram)
+    total = sum(star * n for star, n in zip(STARS, histogram))
+    return [total / count if count else 0.0, count, *histogram]
+
+
+def recompute(products=None, batch_size=1000):
+    """Recount the ratings of ``products`` (all by default) from their approved reviews.
+
+    Walks the products in primary key batches: one GROUP BY over each
+    batch's approved reviews, then a bulk_update of the products whose
+    stored values differ. Returns the number of products corrected.
+    """
+    products = Product.objects.all() if products is None else products
+    fixed = last_id = 0
+    while True:
+        batch = list(
+            products.filter(pk__gt=last_id).order_by('pk').values_list('pk', *RATING_FIELDS)[:batch_size]
+        )
+        if not batch:
+            break
+        last_id = batch[-1][0]
+        counted = {
+            row.pop('product_id'): row
+            for row in ProductReview.objects
+            .filter(is_approved=True, product_id__in=[row[0] for row in batch])
+            .values('product_id')
+            .annotate(**{f'rating_{star}': Count('id', filter=Q(rating=star)) for star in STARS})
+            .order_by()
+        }
+        stale = []
+        for product_id, avg, *stored in batch:
+            histogram = counted.get(product_id, {})
+            values = _values([histogram.get(field, 0) for field in HISTOGRAM_FIELDS])
+            if values[1:] != stored or abs(values[0] - avg) > 1e-9:
+                stale.append(Product(pk=product_id, **dict(zip(RATING_FIELDS, values))))
+        Product.objects.bulk_update(stale, RATING_FIELDS, batch_size=batch_size)
+        fixed += len(stale)
+    if fixed:
+        transaction.on_commit(invalidate_catalog)
+    return fixed
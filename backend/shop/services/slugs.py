@@ -0,0 +1,132 @@
+# backend/shop/services/slugs.py
+import re
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q
+from django.db.models.functions import Length
+from django.utils.text import slugify
+
+# Bases scanned per query; keeps the OR-ed ranges under SQLite's
+# bound-parameter limit
+SCAN_CHUNK = 200
+
+# Longest family slugs read by next_free_slug before falling back to a regex
+PROBE_SIZE = 20
+
+
+def base_slug(value, fallback='item'):
+    return slugify(value) or fallback
+
+
+def _suffix(slug, base):
+    """Numeric suffix of ``slug`` relative to ``base`` (0 for the base itself), or None"""
+    if slug == base:
+        return 0
+    match = re.fullmatch(re.escape(base) + r'-(\d+)', slug)
+    return int(match.group(1)) if match else None
+
+
+def family_condition(base, field='slug'):
+    """Match ``base`` itself and every ``base-...`` slug with one index range.
+
+    SQLite cannot use an index for LIKE, but under its binary collation
+    ``[base, base + '.')`` holds exactly the base and the slugs continuing
+    with '-'. Other databases use the prefix (pattern_ops) index.
+    """
+    if connection.vendor == 'sqlite':
+        return Q(**{f'{field}__gte': base, f'{field}__lt': base + '.'})
+    return Q(**{field: base}) | Q(**{f'{field}__startswith': base + '-'})
+
+
+def next_free_slug(model, base, field='slug'):
+    """The next unused ``base`` / ``base-<n>`` slug, normally in one query.
+
+    Reads the longest (then greatest) slugs of the base's family and takes
+    the first with a numeric suffix, so the cost does not grow with the
+    number of products sharing a name. Only when the probe is crowded out
+    by longer ``base-word`` slugs does a second, regex-filtered query run.
+    """
+    family = model._default_manager.filter(family_condition(base, field)).order_by(Length(field).desc(), f'-{field}')
+    probe = list(family.values_list(field, flat=True)[:PROBE_SIZE])
+    suffixes = [suffix for suffix in (_suffix(slug, base) for slug in probe) if suffix is not None]
+    if not suffixes and len(probe) == PROBE_SIZE:
+        pattern = '^' + re.escape(base) + r'(-[0-9]+)?$'
+        suffixes = [_suffix(slug, base) for slug in family.filter(**{f'{field}__regex': pattern}).values_list(field, flat=True)[:1]]
+    if not suffixes:
+        return base
+    return f'{base}-{suffixes[0] + 1}'
+
+
+def save_with_unique_slug(instance, source, save, *args, field='slug', attempts=5, **kwargs):
+    """Give ``instance`` a free slug derived from ``source`` and ``save()`` it.
+
+    There is no existence pre-check to race against: if a concurrent save
+    takes the slug first, the unique index rejects ours and we pick the
+    next one. Other integrity errors propagate unchanged.
+    """
+    model = type(instance)
+    base = base_slug(source, model._meta.model_name)
+    for attempt in range(attempts):
+        setattr(instance, field, next_free_slug(model, base, field))
+        try:
+            with transaction.atomic():
+                return save(*args, **kwargs)
+        except IntegrityError:
+            lost_race = model._default_manager.filter(**{field: getattr(instance, field)}).exists()
+            if not lost_race or attempt == attempts - 1:
+                raise
+
+
+class SlugAllocator:
+    """Batch counterpart of next_free_slug for imports and bulk_create.
+
+    Hands out unique slugs for many rows with one family scan per batch.
+
+    ``reserve()`` loads the highest taken suffix of every new base in a
+    single query; ``allocate()`` then works purely in memory, so an import
+    of any size never checks candidates one at a time. A base is free until
+    taken, after which its suffixes continue from the highest one in use.
+    """
+
+    def __init__(self, model, field='slug'):
+        self.model = model
+        self.field = field
+        self._next = {}  # base -> next suffix to hand out (0 = bare base)
+        self._issued = set()
+
+    def reserve(self, bases):
+        missing = sorted({base for base in bases if base not in self._next})
+        for start in range(0, len(missing), SCAN_CHUNK):
+            chunk = set(missing[start:start + SCAN_CHUNK])
+            for base in chunk:
+                self._next[base] = 0
+            condition = Q()
+            for base in chunk:
+                condition |= family_condition(base, self.field)
+            taken = self.model._default_manager.filter(condition).order_by().values_list(self.field, flat=True)
+            for slug in taken.iterator():
+                for base in self._bases_of(slug, chunk):
+                    suffix = _suffix(slug, base)
+                    if suffix is not None and suffix >= self._next[base]:
+                        self._next[base] = suffix + 1
+
+    @staticmethod
+    def _bases_of(slug, chunk):
+        # The base itself, or everything before a trailing "-<n>"
+        candidates = {slug}
+        head, sep, tail = slug.rpartition('-')
+        if sep and tail.isdigit():
+            candidates.add(head)
+        return [base for base in candidates if base in chunk]
+
+    def allocate(self, base):
+        if base not in self._next:
+            self.reserve([base])
+        while True:
+            suffix = self._next[base]
+            self._next[base] = suffix + 1
+            slug = base if suffix == 0 else f'{base}-{suffix}'
+            # Another base may already have produced this slug ("a" -> "a-1")
+            if slug not in self._issued:
+                self._issued.add(slug)
+                return slug
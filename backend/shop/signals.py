@@ -0,0 +1,60 @@
+# backend/shop/signals.py
+from django.contrib.auth.signals import user_logged_in
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import search
+from .categories import invalidate_tree
+from .models import Category, Order, Product, ProductReview
+from .reports import invalidate_for_order
+from .response_cache import invalidate_catalog
+from .services import ratings
+from .services.cart import merge_session_cart
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, **kwargs):
+    """Keep the search indexes in step with saved products"""
+    transaction.on_commit(lambda: search.product_saved(instance))
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    product_id = instance.pk
+    transaction.on_commit(lambda: search.product_deleted(product_id))
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_catalog_caches(sender, **kwargs):
+    """Any category or product change can alter cached catalog data"""
+    transaction.on_commit(invalidate_tree)
+    transaction.on_commit(invalidate_catalog)
+
+
+@receiver(post_save, sender=ProductReview)
+def count_review_rating(sender, instance, created, **kwargs):
+    """Keep the product's rating aggregates in step with its approved reviews"""
+    ratings.review_saved(instance, created)
+
+
+@receiver(post_delete, sender=ProductReview)
+def uncount_review_rating(sender, instance, **kwargs):
+    ratings.review_deleted(instance)
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+def invalidate_closed_reports(sender, instance, **kwargs):
+    """A late refund or edit of an old order changes its cached reports"""
+    transaction.on_commit(lambda: invalidate_for_order(instance))
+
+
+@receiver(user_logged_in)
+def merge_cart_on_login(sender, request, user, **kwargs):
+    """Carry an anonymous visitor's cart over to their account"""
+    if request is not None and hasattr(request, 'session'):
+        merge_session_cart(request, user)
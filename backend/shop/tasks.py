@@ -0,0 +1,12 @@
+# backend/shop/tasks.py
+from datetime import timedelta
+
+from jobs.queue import task
+
+from .services.aliexpress_sync import sync_products
+
+
+@task(priority=-10, max_attempts=1)
+def sync_aliexpress_products(stale_after_hours=6):
+    """Refresh AliExpress-mapped products off the request path"""
+    sync_products(stale_after=timedelta(hours=stale_after_hours) if stale_after_hours else None)
@@ -1,3 +1,1862 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, connection, connections
+from django.db.models import F
+from django.http import QueryDict
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from backend.profiling import QueryBudgetExceeded, profile_queries
+
+from . import reports, search, view_counter
+from .cache import cache_timeout
+from .categories import get_tree
+from .checks import check_governor_cache, check_shared_cache
+from .filters import ProductFilterSet
+from users import activity
+from users.models import Address, Notification, UserActivity
+
+from .models import (
+    AffiliateLink, AliExpressProduct, AliExpressSyncRun, Cart, CartItem, Category, Order, OrderItem, OrderNumberSequence, Product, ProductReview,
+    Wishlist,
+)
+from .response_cache import get_stats, invalidate_catalog
+from .services import order_numbers, ratings
+from .services.catalog_io import CatalogImporter, import_file
+from .services import slugs
+from .services.aliexpress_batching import ProductDetailBatcher
+from .services.aliexpress_cache import CachedAliExpress, ClientBackend, normalize_url, url_hash
+from .services.aliexpress_client import AliExpressClient, AliExpressTransport, RequestSigner, sign
+from .services.aliexpress_fake import FakeAliExpressServer, fake_product
+from .services.aliexpress_governor import CircuitOpen, Governor, RateLimited, RateLimiter
+from .services.aliexpress_sync import AliExpressSync, sync_products
+from .services.checkout import checkout
+
+
+def make_product(category, index, **kwargs):
+    defaults = {
+        'category': category,
+        'name': f'Product {index}',
+        'sku': f'SKU-{index:05d}',
+        'description': 'A long description that catalog listings leave out.',
+        'price': Decimal('10.00') + index,
+        'quantity': 5,
+    }
+    defaults.update(kwargs)
+    return Product.objects.create(**defaults)
+
+
+class ProductCatalogListTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Clothing')
+        cls.products = [make_product(cls.category, i) for i in range(30)]
+        make_product(cls.category, 99, is_active=False)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.url = reverse('product_list')
+
+    def test_legacy_list_returns_all_active_products(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 30)
+        self.assertIn('description', response.data[0])
+
+    def test_cursor_pages_cover_catalog_without_overlap(self):
+        seen = []
+        cursor = None
+        while True:
+            params = {'page_size': 7}
+            if cursor:
+                params['cursor'] = cursor
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(row['id'] for row in response.data['results'])
+            cursor = response.data['next_cursor']
+            if cursor is None:
+                break
+        expected = [p.id for p in sorted(self.products, key=lambda p: (p.created_at, p.id), reverse=True)]
+        self.assertEqual(seen, expected)
+
+    def test_compact_serializer_omits_heavy_fields(self):
+        row = self.client.get(self.url, {'page_size': 1}).data['results'][0]
+        for field in ('description', 'meta_title', 'meta_description', 'meta_keywords', 'cost_price'):
+            self.assertNotIn(field, row)
+
+    def test_fields_projection(self):
+        response = self.client.get(self.url, {'fields': 'id,name,price', 'page_size': 3})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.data['results'][0]), {'id', 'name', 'price'})
+
+    def test_unknown_field_is_rejected(self):
+        response = self.client.get(self.url, {'fields': 'name,cost_price'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get(self.url, {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_deep_page_runs_single_query(self):
+        first = self.client.get(self.url, {'page_size': 25})
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(self.url, {'page_size': 25, 'cursor': first.data['next_cursor']})
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+
+class ProductFilterTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.clothing = Category.objects.create(name='Clothing')
+        cls.shirts = Category.objects.create(name='Shirts', parent=cls.clothing)
+        cls.jewelry = Category.objects.create(name='Jewelry')
+        cls.red_shirt = make_product(cls.shirts, 1, brand='Acme', color='red', size='M', price=Decimal('20'))
+        cls.blue_coat = make_product(cls.clothing, 2, brand='Zed', color='blue', size='L', price=Decimal('80'), is_featured=True)
+        cls.ring = make_product(cls.jewelry, 3, brand='Acme', price=Decimal('300'), quantity=0, is_new=True)
+
+    def setUp(self):
+        # Category ids can be reused across test cases; drop cached trees
+        cache.clear()
+
+    def ids(self, **params):
+        response = self.client.get(reverse('product_list'), params)
+        self.assertEqual(response.status_code, 200)
+        return [row['id'] for row in response.data]
+
+    def test_category_includes_subtree(self):
+        self.assertCountEqual(self.ids(category=self.clothing.id), [self.red_shirt.id, self.blue_coat.id])
+        self.assertEqual(self.ids(category=self.shirts.id), [self.red_shirt.id])
+
+    def test_price_range_and_brand(self):
+        self.assertEqual(self.ids(min_price='50', max_price='100'), [self.blue_coat.id])
+        self.assertCountEqual(self.ids(brand='Acme'), [self.red_shirt.id, self.ring.id])
+        self.assertCountEqual(self.ids(color='red,blue'), [self.red_shirt.id, self.blue_coat.id])
+
+    def test_flags_and_stock(self):
+        self.assertEqual(self.ids(is_featured='true'), [self.blue_coat.id])
+        self.assertEqual(self.ids(is_new='1'), [self.ring.id])
+        self.assertEqual(self.ids(in_stock='false'), [self.ring.id])
+
+    def test_sorting(self):
+        self.assertEqual(self.ids(sort='price'), [self.red_shirt.id, self.blue_coat.id, self.ring.id])
+        self.assertEqual(self.ids(sort='-price'), [self.ring.id, self.blue_coat.id, self.red_shirt.id])
+
+    def test_sorted_cursor_pagination(self):
+        url = reverse('product_list')
+        first = self.client.get(url, {'sort': 'price', 'page_size': 2}).data
+        second = self.client.get(url, {'sort': 'price', 'page_size': 2, 'cursor': first['next_cursor']}).data
+        self.assertEqual([row['id'] for row in first['results']], [self.red_shirt.id, self.blue_coat.id])
+        self.assertEqual([row['id'] for row in second['results']], [self.ring.id])
+        self.assertIsNone(second['next_cursor'])
+
+    def test_invalid_values_are_rejected(self):
+        url = reverse('product_list')
+        self.assertEqual(self.client.get(url, {'min_price': 'cheap'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'sort': 'random'}).status_code, 400)
+
+
+class ProductFilterIndexTests(TestCase):
+    """Representative catalog filters and sorts must be served by an index.
+
+    The table gets enough rows, with selective values, for the planner to
+    prefer an index the way it would in production. PostgreSQL is given
+    fresh statistics; SQLite keeps its defaults, as its statistics cannot
+    tell a rare flag value from a common one.
+    """
+
+    # (filters, sort): each selective filter on its own, the usual pairings,
+    # and filters whose index differs from the one matching the sort.
+    # in_stock usually matches most of the catalog, so reading the sort's
+    # index is the better plan on its own; it is covered alongside others.
+    filter_cases = [
+        ({'category': 'shirts'}, 'newest'),
+        ({'min_price': '500', 'max_price': '520'}, 'price'),
+        ({'min_price': '990'}, '-price'),
+        ({'brand': 'Brand 3'}, 'price'),
+        ({'brand': 'Brand 3,Brand 4', 'max_price': '100'}, 'newest'),
+        ({'color': 'red'}, 'price'),
+        ({'size': 'XS'}, 'best_selling'),
+        ({'is_featured': 'true'}, 'newest'),
+        ({'is_new': 'true'}, 'most_viewed'),
+        ({'category': 'shirts', 'brand': 'Brand 3', 'in_stock': 'true'}, 'price'),
+    ]
+    page_size = 24
+
+    @classmethod
+    def setUpTestData(cls):
+        clothing = Category.objects.create(name='Clothing')
+        shirts = Category.objects.create(name='Shirts', parent=clothing)
+        others = [Category.objects.create(name=f'Other {i}') for i in range(20)]
+        cls.category_ids = {'shirts': str(shirts.id)}
+        colors = ['red'] + [f'color{i}' for i in range(39)]
+        sizes = ['XS'] + [f'size{i}' for i in range(29)]
+        Product.objects.bulk_create(
+            Product(
+                category=shirts if i % 50 == 0 else others[i % 20],
+                name=f'Product {i}', slug=f'product-{i}', sku=f'SKU-{i:05d}',
+                description='-', price=Decimal(i % 1000), quantity=0 if i % 97 == 0 else 5,
+                brand=f'Brand {i % 60}', color=colors[i % 40], size=sizes[i % 30],
+                is_featured=i % 101 == 0, is_new=i % 89 == 0, is_active=i % 10 != 0,
+                sales_count=i % 300, views_count=i % 700,
+            )
+            for i in range(3000)
+        )
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE shop_product')
+
+    def setUp(self):
+        cache.clear()
+
+    def plan(self, filters, sort):
+        params = QueryDict(mutable=True)
+        params.update({name: self.category_ids.get(value, value) for name, value in filters.items()})
+        params['sort'] = sort
+        queryset = ProductFilterSet(params).filter_queryset(Product.objects.filter(is_active=True))
+        return queryset[:self.page_size].explain()
+
+    def assertIndexSearch(self, plan):
+        """The product rows are found through an index condition, not a scan"""
+        if connection.vendor == 'postgresql':
+            self.assertNotIn('Seq Scan on shop_product', plan)
+            self.assertIn('Index Cond', plan)
+        else:
+            # Rows of "id parent notused detail"
+            details = [line.split(maxsplit=3)[-1] for line in plan.splitlines()]
+            self.assertTrue(any(detail.startswith('SEARCH shop_product USING') for detail in details), plan)
+
+    def test_every_filter_is_covered(self):
+        covered = {name for filters, _ in self.filter_cases for name in filters}
+        self.assertEqual(covered, set(ProductFilterSet.filters))
+        self.assertEqual({sort for _, sort in self.filter_cases}, set(ProductFilterSet.sorts))
+
+    def test_filters_search_an_index(self):
+        for filters, sort in self.filter_cases:
+            with self.subTest(filters=filters, sort=sort):
+                self.assertIndexSearch(self.plan(filters, sort))
+
+    def test_unfiltered_sorts_read_an_index_in_order(self):
+        for sort in ProductFilterSet.sorts:
+            plan = self.plan({}, sort)
+            with self.subTest(sort=sort):
+                if connection.vendor == 'postgresql':
+                    self.assertNotIn('Seq Scan on shop_product', plan)
+                    self.assertNotIn('Sort', plan)
+                else:
+                    self.assertNotIn('TEMP B-TREE', plan)
+
+
+class ProductSearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Watches')
+        cls.rolex = make_product(cls.category, 1, name='Rolex Submariner', brand='Rolex',
+                                 description='Vintage diving watch')
+        cls.omega = make_product(cls.category, 2, name='Omega Seamaster',
+                                 description='Diving watch, a Rolex Submariner rival')
+        cls.hidden = make_product(cls.category, 3, name='Rolex Datejust', is_active=False)
+
+    def setUp(self):
+        search.index.reset()
+
+    def result_ids(self, **params):
+        response = self.client.get(reverse('product_search'), params)
+        self.assertEqual(response.status_code, 200)
+        return [row['id'] for row in response.data['results']]
+
+    def test_name_matches_rank_above_description_matches(self):
+        self.assertEqual(self.result_ids(q='rolex submariner'), [self.rolex.id, self.omega.id])
+
+    def test_all_terms_must_match(self):
+        self.assertEqual(self.result_ids(q='omega diving'), [self.omega.id])
+        self.assertEqual(self.result_ids(q='omega datejust'), [])
+
+    def test_prefix_matching(self):
+        self.assertEqual(self.result_ids(q='seam'), [])
+        self.assertEqual(self.result_ids(q='seam', prefix='true'), [self.omega.id])
+
+    def test_inactive_products_are_excluded(self):
+        self.assertNotIn(self.hidden.id, self.result_ids(q='datejust'))
+        ranked = search.search('datejust', active_only=False)
+        self.assertEqual([product_id for product_id, _ in ranked], [self.hidden.id])
+
+    def test_index_tracks_saves_and_deletes(self):
+        self.result_ids(q='rolex')  # load the index
+        with self.captureOnCommitCallbacks(execute=True):
+            added = make_product(self.category, 4, name='Tudor Pelagos')
+        self.assertEqual(self.result_ids(q='pelagos'), [added.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            added.name = 'Tudor Black Bay'
+            added.save()
+        self.assertEqual(self.result_ids(q='pelagos'), [])
+        self.assertEqual(self.result_ids(q='black bay'), [added.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.omega.delete()
+        self.assertEqual(self.result_ids(q='seamaster'), [])
+
+    def test_changes_from_other_processes_are_replayed_per_product(self):
+        self.assertEqual(self.result_ids(q='seamaster'), [self.omega.id])
+        # Another worker saves a product: the row changes and the change is logged
+        Product.objects.filter(pk=self.omega.pk).update(name='Omega Speedmaster')
+        self.assertEqual(self.result_ids(q='speedmaster'), [])
+        search.product_saved(self.omega)
+        with self.assertNumQueries(1):  # the changed product only, no rebuild
+            ranked = search.search('speedmaster')
+        self.assertEqual([product_id for product_id, _ in ranked], [self.omega.id])
+        self.assertEqual(self.result_ids(q='seamaster'), [])
+
+        Product.objects.filter(pk=self.rolex.pk).delete()
+        search.product_deleted(self.rolex.pk)
+        self.assertEqual(self.result_ids(q='rolex'), [self.omega.id])
+
+
+class SearchIndexRebuildTests(TransactionTestCase):
+    """The background rebuild reads committed rows from its own connection"""
+
+    def setUp(self):
+        search.index.reset()
+        self.addCleanup(search.index.reset)
+        self.category = Category.objects.create(name='Watches')
+        self.omega = make_product(self.category, 1, name='Omega Seamaster')
+
+    def ids(self, query):
+        return [product_id for product_id, _ in search.search(query)]
+
+    def test_bulk_invalidation_rebuilds_off_the_request_path(self):
+        self.assertEqual(self.ids('seamaster'), [self.omega.id])
+        # A bulk import skips post_save and invalidates the whole index
+        Product.objects.filter(pk=self.omega.pk).update(name='Omega Speedmaster')
+        search.invalidate_index()
+        with self.assertNumQueries(0):  # the old index answers while the new one builds
+            self.assertEqual(self.ids('seamaster'), [self.omega.id])
+        search.index.wait_for_rebuild(5)
+        self.assertEqual(self.ids('speedmaster'), [self.omega.id])
+        self.assertEqual(self.ids('seamaster'), [])
+
+
+class CategoryTreeTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.clothing = Category.objects.create(name='Clothing')
+        self.shirts = Category.objects.create(name='Shirts', parent=self.clothing)
+        self.polos = Category.objects.create(name='Polos', parent=self.shirts)
+        self.jewelry = Category.objects.create(name='Jewelry')
+        make_product(self.polos, 1)
+        make_product(self.shirts, 2)
+        make_product(self.jewelry, 3)
+
+    def test_paths_follow_hierarchy(self):
+        self.polos.refresh_from_db()
+        self.assertEqual(self.polos.depth, 2)
+        self.assertTrue(self.polos.path.startswith(self.shirts.path))
+        self.assertCountEqual(
+            self.clothing.get_descendants(include_self=False),
+            [self.shirts, self.polos],
+        )
+
+    def test_moving_a_category_reroots_its_subtree(self):
+        self.shirts.parent = self.jewelry
+        self.shirts.save()
+        self.polos.refresh_from_db()
+        self.assertEqual(self.polos.depth, 2)
+        self.assertTrue(self.polos.path.startswith(self.jewelry.path))
+        self.assertCountEqual(self.jewelry.get_descendants(), [self.jewelry, self.shirts, self.polos])
+
+    def test_cannot_move_category_under_its_descendant(self):
+        self.clothing.parent = self.polos
+        with self.assertRaises(ValueError):
+            self.clothing.save()
+
+    def test_tree_endpoint_counts_and_caching(self):
+        url = reverse('category_tree')
+        tree = self.client.get(url).data
+        self.assertEqual([node['name'] for node in tree], ['Clothing', 'Jewelry'])
+        clothing = tree[0]
+        self.assertEqual(clothing['product_count'], 0)
+        self.assertEqual(clothing['total_product_count'], 2)
+        self.assertEqual(clothing['children'][0]['children'][0]['product_count'], 1)
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(url)
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+    def test_tree_is_invalidated_by_product_and_category_saves(self):
+        url = reverse('category_tree')
+        self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            make_product(self.jewelry, 4)
+        self.assertEqual(self.client.get(url).data[1]['product_count'], 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.shirts.is_active = False
+            self.shirts.save()
+        clothing = self.client.get(url).data[0]
+        self.assertEqual(clothing['children'], [])
+        self.assertEqual(clothing['total_product_count'], 0)
+
+    def test_subtree_filter_is_a_single_query(self):
+        url = reverse('product_list')
+        self.client.get(url, {'category': self.clothing.id})  # warm the tree cache
+        invalidate_catalog()  # but not the response cache
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, {'category': self.clothing.id})
+        self.assertEqual(len(response.data), 2)
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+
+class CatalogResponseCacheTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Watches')
+        cls.product = make_product(cls.category, 1)
+
+    def setUp(self):
+        cache.clear()
+        self.detail_url = reverse('product_detail', args=[self.product.pk])
+
+    def tearDown(self):
+        view_counter.reset_counter()
+
+    def test_repeat_requests_skip_the_database(self):
+        first = self.client.get(self.detail_url)
+        self.assertEqual(first['X-Cache'], 'MISS')
+        self.assertTrue(first['ETag'].startswith('"'))
+        self.assertIn('Last-Modified', first)
+
+        with CaptureQueriesContext(connection) as ctx:
+            second = self.client.get(self.detail_url)
+        self.assertEqual(len(ctx.captured_queries), 0)
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(second['ETag'], first['ETag'])
+        self.assertEqual(second.json(), first.json())
+
+    def test_if_none_match_returns_304_without_queries(self):
+        etag = self.client.get(self.detail_url)['ETag']
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+    def test_query_string_is_part_of_the_key(self):
+        url = reverse('product_list')
+        self.client.get(url, {'page_size': 1})
+        self.assertEqual(self.client.get(url, {'page_size': 2})['X-Cache'], 'MISS')
+
+    def test_product_save_invalidates_responses(self):
+        etag = self.client.get(self.detail_url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.price = Decimal('99.00')
+            self.product.save()
+        response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()['price'], '99.00')
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_errors_are_not_cached(self):
+        url = reverse('product_detail', args=[self.product.pk + 100])
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(get_stats()['misses'], 2)
+
+    def test_stats_endpoint(self):
+        self.client.get(self.detail_url)
+        self.client.get(self.detail_url)
+        stats = get_stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+        url = reverse('catalog_cache_stats')
+        self.assertEqual(self.client.get(url).status_code, 403)
+        admin = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'pw')
+        self.client.force_login(admin)
+        self.assertEqual(self.client.get(url).data['hit_ratio'], 0.5)
+
+
+    @override_settings(LOCAL_CACHE_TIMEOUT=5)
+    def test_per_process_cache_entries_expire_quickly(self):
+        # A version bump in a local memory cache never reaches the other
+        # workers, so their entries must age out on their own
+        with mock.patch.object(cache, 'set', wraps=cache.set) as cache_set:
+            self.client.get(self.detail_url)
+            get_tree()
+        self.assertEqual({call.args[2] for call in cache_set.call_args_list if len(call.args) > 2}, {5})
+        self.assertEqual(cache_timeout(3600, backend=mock.Mock()), 3600)
+        self.assertEqual([error.id for error in check_shared_cache(None)], ['shop.E001'])
+
+
+@override_settings(VIEW_COUNTER_FLUSH_INTERVAL=0, VIEW_COUNTER_DEDUP_WINDOW=0)
+class ProductViewCounterTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Watches')
+        cls.product = make_product(cls.category, 1)
+        cls.other = make_product(cls.category, 2)
+
+    def setUp(self):
+        cache.clear()
+        view_counter.reset_counter()
+        self.url = reverse('product_detail', args=[self.product.pk])
+
+    def tearDown(self):
+        view_counter.reset_counter()
+
+    def views_count(self, product):
+        product.refresh_from_db(fields=['views_count'])
+        return product.views_count
+
+    def test_detail_views_are_buffered_without_writes(self):
+        with CaptureQueriesContext(connection) as ctx:
+            for _ in range(3):
+                self.client.get(self.url)
+        self.assertFalse(any('UPDATE' in q['sql'] for q in ctx.captured_queries))
+        self.assertEqual(view_counter.get_counter().pending(), {self.product.pk: 3})
+        self.assertEqual(self.views_count(self.product), 0)
+
+        self.assertEqual(view_counter.flush(), 3)
+        self.assertEqual(self.views_count(self.product), 3)
+        self.assertEqual(view_counter.get_counter().pending(), {})
+
+
+    def test_timer_flush_closes_its_connection(self):
+        counter = view_counter.MemoryViewCounter(flush_interval=0)  # no real timer; call its callback
+        counter.incr(self.other.pk)
+        with mock.patch('shop.view_counter.connection') as conn:
+            counter._flush_from_timer()
+        conn.close.assert_called_once_with()
+        self.assertEqual(self.views_count(self.other), 1)
+    def test_missing_products_are_not_counted(self):
+        self.client.get(reverse('product_detail', args=[self.product.pk + 100]))
+        self.assertEqual(view_counter.get_counter().pending(), {})
+
+    def test_flush_batches_products_by_delta(self):
+        counter = view_counter.get_counter()
+        for product_id in (self.product.pk, self.other.pk):
+            counter.incr(product_id)
+        with CaptureQueriesContext(connection) as ctx:
+            view_counter.flush()
+        updates = [q for q in ctx.captured_queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual((self.views_count(self.product), self.views_count(self.other)), (1, 1))
+
+    def test_bots_are_ignored(self):
+        self.client.get(self.url, HTTP_USER_AGENT='Googlebot/2.1')
+        self.assertEqual(view_counter.get_counter().pending(), {})
+
+    @override_settings(VIEW_COUNTER_DEDUP_WINDOW=60)
+    def test_repeat_views_from_one_visitor_count_once(self):
+        for _ in range(3):
+            self.client.get(self.url, HTTP_USER_AGENT='Mozilla/5.0')
+        self.client.get(self.url, HTTP_USER_AGENT='Mozilla/5.0 (other device)')
+        self.assertEqual(view_counter.get_counter().pending(), {self.product.pk: 2})
+
+    @override_settings(VIEW_COUNTER_BACKEND='cache')
+    def test_cache_backend_flushes_settled_generations(self):
+        counter = view_counter.get_counter()
+        self.assertIsInstance(counter, view_counter.CacheViewCounter)
+        for _ in range(4):
+            counter.incr(self.product.pk)
+        counter.incr(self.other.pk)
+        self.assertEqual(counter.pending(), {self.product.pk: 4, self.other.pk: 1})
+
+        # The first flush only retires the live generation; writers may still
+        # hold it, so its counts are applied on the next flush
+        self.assertEqual(view_counter.flush(), 0)
+        counter.incr(self.product.pk)
+        self.assertEqual(view_counter.flush(), 5)
+        self.assertEqual((self.views_count(self.product), self.views_count(self.other)), (4, 1))
+
+        self.assertEqual(counter.flush(settle=False), 1)
+        self.assertEqual(self.views_count(self.product), 5)
+        self.assertEqual(counter.pending(), {})
+
+
+def make_order(user, **kwargs):
+    defaults = {
+        'user': user,
+        'first_name': 'Test',
+        'last_name': 'Buyer',
+        'email': 'buyer@example.com',
+        'phone': '+260971234567',
+        'address_line1': '1 Cairo Road',
+        'city': 'Lusaka',
+        'postal_code': '10101',
+        'payment_method': 'cash',
+        'subtotal': Decimal('10.00'),
+        'total': Decimal('10.00'),
+    }
+    defaults.update(kwargs)
+    return Order.objects.create(**defaults)
+
+
+class OrderNumberTests(TestCase):
+
+    def setUp(self):
+        order_numbers._allocator = None
+        self.user = get_user_model().objects.create_user('buyer', 'buyer@example.com', 'pw')
+
+    def tearDown(self):
+        order_numbers._allocator = None
+
+    def test_numbers_are_sequential_per_day(self):
+        today = timezone.localdate().strftime('%Y%m%d')
+        numbers = [make_order(self.user).order_number for _ in range(3)]
+        self.assertEqual(numbers, [f'INV-{today}-0001', f'INV-{today}-0002', f'INV-{today}-0003'])
+
+    def test_allocation_does_not_scan_orders(self):
+        make_order(self.user)
+        with CaptureQueriesContext(connection) as ctx:
+            make_order(self.user)
+        self.assertFalse(any('"shop_order"' in q['sql'] and q['sql'].startswith('SELECT') for q in ctx.captured_queries))
+
+    def test_new_day_restarts_the_sequence(self):
+        allocator = order_numbers.OrderNumberAllocator()
+        day = timezone.localdate()
+        allocator.next_number(day)
+        next_day = day + timezone.timedelta(days=1)
+        self.assertTrue(allocator.next_number(next_day).endswith('-0001'))
+
+    @override_settings(ORDER_NUMBER_BLOCK_SIZE=10)
+    def test_block_allocation_reserves_ahead(self):
+        allocator = order_numbers.OrderNumberAllocator(block_size=10)
+        day = timezone.localdate()
+        # Blocks are only reserved outside transactions; TestCase wraps one,
+        # so exercise allocate() directly for the reservation itself
+        self.assertEqual(list(order_numbers.allocate(day, 10)), list(range(1, 11)))
+        allocator._day, allocator._numbers = day, iter(range(1, 11))
+        with self.assertNumQueries(0):
+            allocator.next_number(day)
+        self.assertEqual(OrderNumberSequence.objects.get(date=day).last_value, 10)
+
+
+class OrderNumberConcurrencyTests(TransactionTestCase):
+    """Parallel checkouts must never receive the same order number"""
+
+    threads = 8
+    orders_per_thread = 250
+
+    def setUp(self):
+        order_numbers._allocator = None
+        self.user = get_user_model().objects.create_user('buyer', 'buyer@example.com', 'pw')
+
+    def tearDown(self):
+        order_numbers._allocator = None
+
+    def create_orders(self, count):
+        try:
+            return [make_order(self.user).order_number for _ in range(count)]
+        finally:
+            connections.close_all()
+
+    def run_parallel(self):
+        with ThreadPoolExecutor(max_workers=self.threads) as pool:
+            batches = pool.map(self.create_orders, [self.orders_per_thread] * self.threads)
+            return [number for batch in batches for number in batch]
+
+    def test_parallel_orders_get_unique_numbers(self):
+        numbers = self.run_parallel()
+        total = self.threads * self.orders_per_thread
+        self.assertEqual(len(numbers), total)
+        self.assertEqual(len(set(numbers)), total)
+        self.assertEqual(Order.objects.count(), total)
+
+    @override_settings(ORDER_NUMBER_BLOCK_SIZE=25)
+    def test_parallel_orders_with_block_allocation(self):
+        self.orders_per_thread = 100
+        numbers = self.run_parallel()
+        total = self.threads * self.orders_per_thread
+        self.assertEqual(len(set(numbers)), total)
+        self.assertEqual(OrderNumberSequence.objects.get().last_value, total)
+
+
+CUSTOMER = {
+    'first_name': 'Test', 'last_name': 'Buyer', 'email': 'buyer@example.com',
+    'phone': '+260971234567', 'address_line1': '1 Cairo Road', 'city': 'Lusaka',
+    'postal_code': '10101',
+}
+
+
+class CheckoutTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user('buyer', 'buyer@example.com', 'pw')
+        cls.category = Category.objects.create(name='Watches')
+        cls.watch = make_product(cls.category, 1, price=Decimal('100.00'), quantity=3)
+        cls.strap = make_product(cls.category, 2, price=Decimal('15.50'), quantity=0, track_inventory=False)
+
+    def setUp(self):
+        order_numbers._allocator = None
+        self.cart = Cart.objects.create(user=self.user)
+
+    def add(self, product, quantity):
+        CartItem.objects.create(cart=self.cart, product=product, quantity=quantity)
+
+    def test_checkout_creates_order_and_decrements_stock(self):
+        self.add(self.watch, 2)
+        self.add(self.strap, 4)
+        result = checkout(self.cart, self.user, 'cash', CUSTOMER, shipping_cost=Decimal('5.00'))
+
+        self.assertTrue(result.success)
+        order = result.order
+        self.assertEqual(order.subtotal, Decimal('262.00'))
+        self.assertEqual(order.total, Decimal('267.00'))
+        self.assertEqual(order.items.count(), 2)
+        self.assertFalse(self.cart.items.exists())
+
+        self.watch.refresh_from_db()
+        self.strap.refresh_from_db()
+        self.assertEqual((self.watch.quantity, self.watch.sales_count), (1, 2))
+        # Untracked inventory is not decremented, but sales are still counted
+        self.assertEqual((self.strap.quantity, self.strap.sales_count), (0, 4))
+
+    def test_out_of_stock_rolls_back_everything(self):
+        self.add(self.watch, 5)
+        self.add(self.strap, 1)
+        result = checkout(self.cart, self.user, 'cash', CUSTOMER)
+
+        self.assertFalse(result.success)
+        self.assertEqual(result.out_of_stock, [
+            {'product_id': self.watch.id, 'name': self.watch.name, 'requested': 5, 'available': 3},
+        ])
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(self.cart.items.count(), 2)
+        self.strap.refresh_from_db()
+        self.assertEqual(self.strap.sales_count, 0)
+
+    def test_empty_cart(self):
+        result = checkout(self.cart, self.user, 'cash', CUSTOMER)
+        self.assertFalse(result.success)
+        self.assertEqual(result.error, 'Cart is empty')
+
+
+class CheckoutConcurrencyTests(TransactionTestCase):
+    """Parallel buyers racing for the same limited stock"""
+
+    def setUp(self):
+        order_numbers._allocator = None
+
+    def test_parallel_buyers_never_oversell(self):
+        out = StringIO()
+        call_command('benchmark_checkout', buyers=60, stock=25, threads=8, stdout=out, stderr=StringIO())
+        self.assertIn('25 orders, 35 rejected, 0 left, sales_count 25', out.getvalue())
+        self.assertIn('No overselling detected.', out.getvalue())
+
+
+class CartApiTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Cart')
+        cls.products = [make_product(cls.category, i, quantity=10) for i in range(25)]
+        cls.user = get_user_model().objects.create_user(
+            username='shopper', email='shopper@example.com', password='pw'
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def add(self, product, quantity=1):
+        return self.client.post(reverse('cart_add_item'), {'product_id': product.id, 'quantity': quantity}, format='json')
+
+    def test_empty_cart(self):
+        response = self.client.get(reverse('cart_detail'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['items'], [])
+        self.assertEqual(response.data['total_items'], 0)
+
+    def test_add_update_remove(self):
+        product = self.products[0]
+        self.assertEqual(self.add(product, 2).status_code, 201)
+        response = self.add(product, 1)
+        self.assertEqual(response.data['total_items'], 3)
+        self.assertEqual(Decimal(response.data['subtotal']), product.price * 3)
+
+        url = reverse('cart_item', args=[product.id])
+        response = self.client.patch(url, {'quantity': 5}, format='json')
+        self.assertEqual(response.data['items'][0]['quantity'], 5)
+        self.assertEqual(Decimal(response.data['items'][0]['total']), product.price * 5)
+
+        response = self.client.delete(url)
+        self.assertEqual(response.data['items'], [])
+        self.assertEqual(self.client.delete(url).status_code, 400)
+
+    def test_stock_is_checked(self):
+        response = self.add(self.products[0], 11)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('in stock', response.data['error'])
+        self.assertEqual(self.add(self.products[0], 0).status_code, 400)
+        self.assertEqual(self.client.post(reverse('cart_add_item'), {'product_id': 0}).status_code, 400)
+
+    def test_add_logs_the_resolved_product_id(self):
+        self.client.force_authenticate(self.user)
+        product = self.products[0]
+        self.client.post(reverse('cart_add_item'), {'product_id': f' {product.id}', 'quantity': 2}, format='json')
+        activity.flush()
+        logged = UserActivity.objects.get(user=self.user, activity_type='add_to_cart')
+        self.assertEqual(logged.metadata, {'product_id': product.id, 'quantity': 2})
+
+    def test_reading_cart_takes_constant_queries(self):
+        self.client.force_authenticate(self.user)
+        self.add(self.products[0])
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(reverse('cart_detail'))
+        for product in self.products[1:]:
+            self.add(product, 2)
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get(reverse('cart_detail'))
+        self.assertEqual(len(response.data['items']), 25)
+        self.assertEqual(response.data['total_items'], 49)
+        self.assertEqual(len(large), len(small))
+        self.assertLessEqual(len(large), 2)
+
+    def test_totals_annotated_in_one_query(self):
+        cart = Cart.objects.create(user=self.user)
+        for product in self.products[:5]:
+            CartItem.objects.create(cart=cart, product=product, quantity=2)
+        with self.assertNumQueries(1):
+            cart = Cart.objects.with_totals().get(pk=cart.pk)
+            self.assertEqual(cart.total_items, 10)
+            self.assertEqual(cart.subtotal, sum(p.price * 2 for p in self.products[:5]))
+
+    def test_session_cart_merges_on_login(self):
+        self.add(self.products[0], 2)
+        self.add(self.products[1], 1)
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.products[0], quantity=3)
+
+        self.client.login(username='shopper', password='pw')
+        response = self.client.get(reverse('cart_detail'))
+        quantities = {item['product']['id']: item['quantity'] for item in response.data['items']}
+        self.assertEqual(quantities, {self.products[0].id: 5, self.products[1].id: 1})
+        self.assertEqual(Cart.objects.count(), 1)
+
+    def test_session_cart_adopted_when_user_has_none(self):
+        self.add(self.products[0], 2)
+        self.client.login(username='shopper', password='pw')
+        cart = Cart.objects.get()
+        self.assertEqual(cart.user, self.user)
+        self.assertIsNone(cart.session_id)
+
+
+class QueryProfilingTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Profiled')
+        make_product(cls.category, 1)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def test_server_timing_header(self):
+        response = self.client.get(reverse('product_list'))
+        header = response['Server-Timing']
+        self.assertRegex(header, r'db;dur=[\d.]+;desc="\d+ queries, \d+ duplicate"')
+        self.assertIn('db-slowest;dur=', header)
+        self.assertIn('app;dur=', header)
+
+    @override_settings(QUERY_BUDGETS={'product_list': 0})
+    def test_budget_enforced_for_app_views(self):
+        with self.assertLogs('backend.profiling', 'WARNING'):
+            with self.assertRaisesMessage(QueryBudgetExceeded, 'product_list ran'):
+                self.client.get(reverse('product_list'))
+
+    @override_settings(QUERY_BUDGETS={'product_list': 0}, QUERY_BUDGET_ENFORCE=False, QUERY_PROFILING_SAMPLE_RATE=1)
+    def test_budget_only_logged_when_not_enforced(self):
+        with self.assertLogs('backend.profiling', 'WARNING') as logs:
+            response = self.client.get(reverse('product_list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(logs.records[0].query_profile['budget'], 0)
+
+    @override_settings(QUERY_BUDGET_ENFORCE=False, QUERY_PROFILING_SAMPLE_RATE=0)
+    def test_unsampled_requests_are_not_profiled(self):
+        response = self.client.get(reverse('product_list'))
+        self.assertNotIn('Server-Timing', response)
+
+    def test_profile_counts_duplicates_and_repeats(self):
+        product = Product.objects.get()
+        with profile_queries() as profile:
+            Product.objects.get(pk=product.pk)
+            Product.objects.get(pk=product.pk)
+            Category.objects.filter(pk=product.category_id).first()
+            Category.objects.filter(pk=product.category_id + 1).first()
+        self.assertEqual(profile.count, 4)
+        self.assertEqual(profile.duplicates, 1)
+        self.assertEqual(profile.repeated, 2)
+        self.assertTrue(profile.slowest_sql)
+
+
+class AdminChangelistQueryTests(TestCase):
+    """Every shop/users changelist runs the same number of queries at 10 and 1000 rows"""
+
+    max_queries = 12
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = get_user_model().objects.create_superuser(
+            username='admin', email='admin@example.com', password='pw'
+        )
+
+    def setUp(self):
+        self.client.force_login(self.admin_user)
+
+    def seed(self, model, n):
+        User = get_user_model()
+        users = User.objects.bulk_create([
+            User(username=f'{model._meta.model_name}-{n}-{i}', email=f'{model._meta.model_name}{n}.{i}@example.com')
+            for i in range(n)
+        ])
+        if model is User:
+            return
+        if model in (Address, UserActivity, Notification):
+            model.objects.bulk_create([model(user=user, **self.user_row_fields(model, i)) for i, user in enumerate(users)])
+            return
+
+        root = Category.objects.create(name=f'Root {model._meta.model_name} {n}')
+        if model is Category:
+            for i in range(n):
+                Category.objects.create(name=f'Child {n}-{i}', parent=root)
+            return
+        products = Product.objects.bulk_create([
+            Product(category=root, name=f'P{n}-{i}', slug=f'p-{model._meta.model_name}-{n}-{i}',
+                    sku=f'{model._meta.model_name}-{n}-{i}', description='-', price=Decimal('5.00'), quantity=i)
+            for i in range(n)
+        ])
+        if model is ProductReview:
+            ProductReview.objects.bulk_create([
+                ProductReview(product=product, user=user, rating=1 + i % 5, comment='ok')
+                for i, (product, user) in enumerate(zip(products, users))
+            ])
+        elif model is Cart:
+            carts = Cart.objects.bulk_create([Cart(user=user) for user in users])
+            CartItem.objects.bulk_create([
+                CartItem(cart=cart, product=product, quantity=2) for cart, product in zip(carts, products)
+            ])
+        elif model is Order:
+            orders = Order.objects.bulk_create([
+                Order(user=user, order_number=f'T-{n}-{i}', subtotal=5, total=5, payment_method='cash', **CUSTOMER)
+                for i, user in enumerate(users)
+            ])
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product=product, quantity=1, price=5) for order, product in zip(orders, products)
+            ])
+        elif model is Wishlist:
+            wishlists = Wishlist.objects.bulk_create([Wishlist(user=user) for user in users])
+            Wishlist.products.through.objects.bulk_create([
+                Wishlist.products.through(wishlist=wishlist, product=product)
+                for wishlist, product in zip(wishlists, products)
+            ])
+
+    def user_row_fields(self, model, i):
+        if model is Address:
+            return {'first_name': 'A', 'last_name': str(i), 'address_line1': '1 Road', 'city': 'Lusaka',
+                    'postal_code': '10101', 'phone': '0970000000'}
+        if model is UserActivity:
+            return {'activity_type': 'login', 'description': f'Login {i}'}
+        return {'notification_type': 'system', 'title': f'Note {i}', 'message': '-'}
+
+    def changelist_queries(self, model):
+        url = reverse(f'admin:{model._meta.app_label}_{model._meta.model_name}_changelist')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_changelist_query_counts(self):
+        models = [model for model in admin.site._registry if model._meta.app_label in ('shop', 'users')]
+        self.assertGreaterEqual(len(models), 10)
+        for model in models:
+            with self.subTest(model=model.__name__):
+                self.seed(model, 10)
+                small = self.changelist_queries(model)
+                self.seed(model, 1000)
+                large = self.changelist_queries(model)
+                self.assertEqual(small, large)
+                self.assertLessEqual(large, self.max_queries)
+
+    def test_change_pages_use_annotations(self):
+        for model in (Category, Cart, Order, Wishlist):
+            with self.subTest(model=model.__name__):
+                self.seed(model, 3)
+                obj = model.objects.order_by('pk').last()
+                url = reverse(f'admin:shop_{model._meta.model_name}_change', args=[obj.pk])
+                self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(self.client.get(reverse('admin:shop_category_add')).status_code, 200)
+
+
+class CatalogImportExportTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Shirts')
+        make_product(cls.category, 1, name='Plain Shirt', slug='plain-shirt')
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def write(self, name, text):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        return path
+
+    def test_csv_import_creates_with_unique_slugs(self):
+        rows = ''.join(f'NEW-{i},Plain Shirt,Shirts,9.99,{i}\n' for i in range(5))
+        path = self.write('catalog.csv', 'sku,name,category,price,quantity\n' + rows)
+        # categories, existing skus, one slug prefix scan, savepoint + INSERT
+        with self.assertNumQueries(6):
+            result = import_file(path, batch_size=10)
+        self.assertEqual((result.created, result.updated, result.errors), (5, 0, []))
+        slugs = sorted(Product.objects.filter(sku__startswith='NEW-').values_list('slug', flat=True))
+        self.assertEqual(slugs, ['plain-shirt-1', 'plain-shirt-2', 'plain-shirt-3', 'plain-shirt-4', 'plain-shirt-5'])
+        self.assertFalse(os.path.exists(path + '.progress'))
+
+    def test_upsert_only_touches_given_columns(self):
+        path = self.write('update.jsonl', json.dumps({'sku': 'SKU-00001', 'name': 'Renamed', 'category': 'Shirts', 'price': '3.50'}) + '\n')
+        result = import_file(path)
+        self.assertEqual((result.created, result.updated), (0, 1))
+        product = Product.objects.get(sku='SKU-00001')
+        self.assertEqual((product.name, product.price, product.slug), ('Renamed', Decimal('3.50'), 'plain-shirt'))
+        self.assertEqual(product.quantity, 5)
+        self.assertEqual(product.description, 'A long description that catalog listings leave out.')
+
+    def test_bad_rows_are_reported_and_skipped(self):
+        path = self.write('bad.csv', 'sku,name,category,price\nA,Ok,Shirts,1\nB,Bad,Nope,1\nC,Bad,Shirts,abc\nD,,Shirts,1\n')
+        result = import_file(path)
+        self.assertEqual(result.created, 1)
+        self.assertEqual([number for number, _ in result.errors], [2, 3, 4])
+        self.assertIn('unknown category', result.errors[0][1])
+
+    def test_malformed_lines_are_row_errors(self):
+        good = json.dumps({'sku': 'J-1', 'name': 'Ok', 'category': 'Shirts', 'price': '1'})
+        bad_price = json.dumps({'sku': 'J-2', 'name': 'Bad', 'category': 'Hats', 'price': 'abc'})
+        path = self.write('bad.jsonl', f'{good}\n{{"sku": "J-3",\n[1, 2]\n{bad_price}\n')
+        result = import_file(path, create_categories=True)
+        self.assertEqual(result.created, 1)
+        self.assertEqual([number for number, _ in result.errors], [2, 3, 4])
+        self.assertIn('invalid JSON', result.errors[0][1])
+        # The rejected row's category was not created
+        self.assertFalse(Category.objects.filter(name='Hats').exists())
+
+    def test_resume_skips_committed_rows(self):
+        path = self.write('resume.csv', 'sku,name,category,price\n' + ''.join(f'R-{i},Resumed,Shirts,1\n' for i in range(6)))
+        with open(path + '.progress', 'w') as f:
+            json.dump({'path': path, 'rows': 4}, f)
+        result = import_file(path, resume=True)
+        self.assertEqual(result.created, 2)
+        self.assertEqual(set(Product.objects.filter(sku__startswith='R-').values_list('sku', flat=True)), {'R-4', 'R-5'})
+
+    def test_checkpoint_after_each_batch(self):
+        seen = []
+        importer = CatalogImporter(batch_size=2, checkpoint=seen.append)
+        rows = [{'sku': f'C-{i}', 'name': 'Batch', 'category': 'Shirts', 'price': '1'} for i in range(5)]
+        importer.run(iter(rows))
+        self.assertEqual(seen, [2, 4, 5])
+
+    def test_export_round_trip(self):
+        out = os.path.join(self.tmp.name, 'export.jsonl')
+        call_command('export_catalog', out, stdout=StringIO())
+        with open(out) as f:
+            rows = [json.loads(line) for line in f]
+        self.assertEqual(rows[0]['sku'], 'SKU-00001')
+        self.assertEqual(rows[0]['category'], 'Shirts')
+
+        csv_out = os.path.join(self.tmp.name, 'export.csv')
+        call_command('export_catalog', csv_out, stdout=StringIO())
+        Product.objects.update(quantity=0)
+        call_command('import_catalog', csv_out, stdout=StringIO())
+        self.assertEqual(Product.objects.get().quantity, 5)
+
+
+class SlugAllocationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Slugs')
+
+    def create(self, index, name='Linen Shirt', **kwargs):
+        return make_product(self.category, index, name=name, **kwargs)
+
+    def test_same_name_gets_next_suffix_in_constant_queries(self):
+        self.assertEqual(self.create(0).slug, 'linen-shirt')
+        for i in range(1, 30):
+            self.create(i)
+        with self.assertNumQueries(4):  # probe, savepoint, insert, release
+            product = self.create(30)
+        self.assertEqual(product.slug, 'linen-shirt-30')
+
+    def test_other_slugs_sharing_the_prefix_are_ignored(self):
+        self.create(0, name='Linen Shirt Long Sleeve')
+        self.create(1, slug='linen-shirt-xl')
+        self.create(2, slug='linen-shirtdress')
+        self.assertEqual(self.create(3).slug, 'linen-shirt')
+        self.assertEqual(self.create(4).slug, 'linen-shirt-1')
+
+    def test_probe_crowded_out_by_longer_slugs(self):
+        for i in range(slugs.PROBE_SIZE + 1):
+            self.create(i, slug=f'linen-shirt-extra-long-variant-{i}')
+        self.create(99, slug='linen-shirt-7')
+        self.assertEqual(self.create(100).slug, 'linen-shirt-8')
+
+    def test_retries_when_a_concurrent_save_takes_the_slug(self):
+        self.create(0)
+        stale = iter(['linen-shirt'])
+        real = slugs.next_free_slug
+        with mock.patch.object(slugs, 'next_free_slug', lambda *args: next(stale, None) or real(*args)):
+            product = self.create(1)
+        self.assertEqual(product.slug, 'linen-shirt-1')
+
+    def test_other_integrity_errors_propagate(self):
+        self.create(0)
+        with self.assertRaises(IntegrityError):
+            self.create(0, name='Another Name')
+
+    def test_category_slugs_are_unique(self):
+        Category.objects.create(name='Bags & Shoes')
+        self.assertEqual(Category.objects.create(name='Bags Shoes').slug, 'bags-shoes-1')
+
+    def test_allocator_batch(self):
+        self.create(0)
+        allocator = slugs.SlugAllocator(Product)
+        with self.assertNumQueries(1):
+            allocator.reserve(['linen-shirt', 'new-base'])
+        issued = [allocator.allocate('linen-shirt') for _ in range(3)] + [allocator.allocate('new-base')]
+        self.assertEqual(issued, ['linen-shirt-1', 'linen-shirt-2', 'linen-shirt-3', 'new-base'])
+
+    def test_benchmark_command(self):
+        out = StringIO()
+        call_command('benchmark_slugs', count=50, stdout=out, stderr=out)
+        self.assertIn('save(): 50 products', out.getvalue())
+        self.assertNotIn('Duplicate', out.getvalue())
+
+
+@override_settings(ALIEXPRESS_API_KEY='key', ALIEXPRESS_API_SECRET='secret', ALIEXPRESS_TRACKING_ID='track')
+class AliExpressClientTests(SimpleTestCase):
+
+    def setUp(self):
+        self.server = FakeAliExpressServer(secret='secret').start()
+        self.addCleanup(self.server.stop)
+        self.transport = AliExpressTransport(max_connections=5, max_retries=3, backoff_base=0.001, backoff_max=0.01)
+        self.addCleanup(self.transport.close)
+        self.client = AliExpressClient(transport=self.transport, base_url=self.server.url)
+
+    def test_signed_calls_reuse_one_connection(self):
+        for product_id in range(1, 21):
+            products = self.client.get_product_details([product_id])
+            self.assertEqual(products[0]['product_id'], product_id)
+        self.assertEqual(len(self.server.requests), 20)
+        self.assertEqual(self.server.connections, 1)
+
+    def test_search_and_links(self):
+        results = self.client.search_products('shirt', max_price=20, limit=3)
+        self.assertEqual(len(results), 3)
+        self.assertEqual(self.server.requests[0]['max_sale_price'], '2000')
+        links = self.client.get_affiliate_links(['https://www.aliexpress.com/item/1.html'])
+        self.assertTrue(links[0]['promotion_link'].startswith('https://s.click.aliexpress.com/'))
+
+    def test_retries_server_errors_and_throttling(self):
+        self.server.fail_next(2, status=503)
+        self.server.throttle_next(1)
+        self.assertEqual(len(self.client.get_product_details([7])), 1)
+        self.assertEqual(len(self.server.requests), 4)
+        self.assertEqual(self.transport.stats['retries'], 3)
+
+    def test_gives_up_after_max_retries(self):
+        self.server.fail_next(10, status=502)
+        with self.assertLogs('shop.services.aliexpress_client', 'ERROR'):
+            self.assertEqual(self.client.get_product_details([7]), [])
+        self.assertEqual(len(self.server.requests), 4)
+        self.assertEqual(self.transport.stats['failures'], 1)
+
+    def test_client_errors_are_not_retried(self):
+        self.server.fail_next(1, status=400)
+        with self.assertLogs('shop.services.aliexpress_client', 'ERROR'):
+            self.assertEqual(self.client.get_product_details([7]), [])
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_bad_signature_is_rejected(self):
+        self.server.secret = 'other'
+        with self.assertLogs('shop.services.aliexpress_client', 'ERROR') as logs:
+            self.assertEqual(self.client.get_product_details([7]), [])
+        self.assertIn('IncompleteSignature', logs.output[0])
+
+    def test_request_signer_matches_sign(self):
+        static = {'app_key': 'key', 'format': 'json', 'tracking_id': 'track', 'v': '2.0'}
+        signer = RequestSigner('secret', static)
+        for params in (
+            {'method': 'm', 'timestamp': '1'},
+            {'timestamp': '2', 'a': '', 'zz': 'last', 'method': 'm'},
+            {'tracking_id': 'other', 'product_ids': '1,2'},
+            {},
+        ):
+            original = dict(params)
+            data = signer.build(params)
+            self.assertEqual(params, original)
+            unsigned = {**static, **params}
+            self.assertEqual(data, {**unsigned, 'sign': sign(unsigned, 'secret')})
+        self.assertEqual(len(signer._templates), 4)
+        signer.build({'method': 'm', 'timestamp': 3, 'page_size': None})
+        self.assertEqual(len(signer._templates), 4)  # reuses the first template
+
+    def test_async_fan_out_is_bounded_by_the_pool(self):
+        self.server.latency = 0.05
+
+        async def fan_out():
+            return await asyncio.gather(*(self.client.aget_product_details([pid]) for pid in range(1, 31)))
+
+        started = time.perf_counter()
+        results = asyncio.run(fan_out())
+        elapsed = time.perf_counter() - started
+        self.assertEqual([r[0]['product_id'] for r in results], list(range(1, 31)))
+        # 30 calls x 50ms run 5 at a time: ~0.3s instead of 1.5s sequentially
+        self.assertLess(elapsed, 1.0)
+        self.assertLessEqual(self.server.connections, 5)
+
+
+@override_settings(ALIEXPRESS_API_KEY='key', ALIEXPRESS_API_SECRET='secret', ALIEXPRESS_TRACKING_ID='track')
+class ProductDetailBatcherTests(SimpleTestCase):
+
+    def setUp(self):
+        self.server = FakeAliExpressServer(secret='secret', latency=0.02).start()
+        self.addCleanup(self.server.stop)
+        transport = AliExpressTransport(max_connections=5, backoff_base=0.001, backoff_max=0.01)
+        self.addCleanup(transport.close)
+        client = AliExpressClient(transport=transport, base_url=self.server.url)
+        self.batcher = ProductDetailBatcher(client, window=0.02, max_batch=20)
+        self.addCleanup(self.batcher.close)
+
+    def detail_calls(self):
+        return [r['product_ids'].split(',') for r in self.server.requests]
+
+    def test_async_lookups_are_batched_and_deduplicated(self):
+        ids = [i % 50 + 1 for i in range(200)]
+        products = asyncio.run(self.batcher.aget_many(ids))
+        self.assertEqual([p['product_id'] for p in products], ids)
+        calls = self.detail_calls()
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(sorted(int(pid) for call in calls for pid in call), list(range(1, 51)))
+        self.assertEqual(self.batcher.stats['coalesced'], 150)
+
+    def test_threaded_lookups_share_calls(self):
+        with ThreadPoolExecutor(max_workers=30) as pool:
+            products = list(pool.map(self.batcher.get, range(1, 61)))
+        self.assertEqual([p['product_id'] for p in products], list(range(1, 61)))
+        self.assertLessEqual(len(self.server.requests), 6)
+
+    def test_lone_lookup_waits_only_for_the_window(self):
+        started = time.perf_counter()
+        self.assertEqual(self.batcher.get(5)['product_id'], 5)
+        self.assertLess(time.perf_counter() - started, 0.5)
+        self.assertEqual(self.detail_calls(), [['5']])
+
+    def test_missing_and_failed_ids_resolve_to_none(self):
+        self.server.missing = {'2'}
+        self.assertEqual([p and p['product_id'] for p in self.batcher.get_many([1, 2, 3])], [1, None, 3])
+        self.server.fail_next(10, status=400)
+        with self.assertLogs('shop.services.aliexpress_client', 'ERROR'):
+            self.assertEqual(self.batcher.get_many([4, 5]), [None, None])
+
+
+class CountingBackend:
+    """AliExpress backend double that records every call"""
+
+    def __init__(self):
+        self.calls = []
+
+    def search_products(self, keywords, max_price=None, min_price=None, limit=20):
+        self.calls.append(('search', keywords, min_price, max_price, limit))
+        return [{'aliexpress_id': len(self.calls), 'title': keywords}]
+
+    def get_product_details(self, product_id):
+        self.calls.append(('details', product_id))
+        return None if product_id == 'missing' else {'product_id': product_id, 'version': len(self.calls)}
+
+    def generate_affiliate_links(self, product_urls):
+        product_urls = list(product_urls)
+        self.calls.append(('links', product_urls))
+        return {url: f'https://s.click.aliexpress.com/e/{i}' for i, url in enumerate(product_urls)}
+
+
+@override_settings(
+    ALIEXPRESS_API_KEY='key', ALIEXPRESS_API_SECRET='secret', ALIEXPRESS_TRACKING_ID='track',
+    CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-default'},
+        'aliexpress': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-aliexpress'},
+    },
+)
+class AliExpressCacheTests(TestCase):
+
+    def setUp(self):
+        self.backend = CountingBackend()
+
+    def make_cache(self, **kwargs):
+        kwargs.setdefault('alias', '')
+        return CachedAliExpress(self.backend, **kwargs)
+
+    def test_normalized_search_keys_share_an_entry(self):
+        cached = self.make_cache()
+        first = cached.search_products('Phone  Case', min_price=5, max_price='20.0')
+        self.assertEqual(cached.search_products(' phone case ', min_price='5.00', max_price=20), first)
+        self.assertEqual(len(self.backend.calls), 1)
+        self.assertEqual(self.backend.calls[0][1], 'phone case')
+        cached.search_products('phone case', min_price=5, max_price=20, limit=50)
+        self.assertEqual(len(self.backend.calls), 2)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cached = self.make_cache(maxsize=2)
+        cached.get_product_details(1)
+        cached.get_product_details(2)
+        cached.get_product_details(1)
+        cached.get_product_details(3)  # evicts 2, the least recently used
+        cached.get_product_details(1)
+        cached.get_product_details(2)
+        self.assertEqual([call[1] for call in self.backend.calls], [1, 2, 3, 2])
+
+    def test_empty_results_are_not_cached(self):
+        cached = self.make_cache()
+        self.assertIsNone(cached.get_product_details('missing'))
+        self.assertIsNone(cached.get_product_details('missing'))
+        self.assertEqual(len(self.backend.calls), 2)
+
+    def test_expired_entries_are_fetched_again(self):
+        cached = self.make_cache(ttls={'search': 0, 'details': 0}, stale={'details': 0})
+        cached.get_product_details(1)
+        cached.get_product_details(1)
+        self.assertEqual(len(self.backend.calls), 2)
+        self.assertEqual(cached.stats['miss'], 2)
+
+    def test_stale_entry_is_served_while_it_refreshes(self):
+        cached = self.make_cache(ttls={'search': 60, 'details': 0}, stale={'details': 60})
+        self.assertEqual(cached.get_product_details(1)['version'], 1)
+        self.assertEqual(cached.get_product_details(1)['version'], 1)  # stale, refresh scheduled
+        cached.wait_for_refreshes()
+        self.assertEqual(len(self.backend.calls), 2)
+        self.assertEqual(cached.get_product_details(1)['version'], 2)
+        self.assertEqual(cached.stats['stale'], 2)
+
+    def test_shared_tier_serves_other_workers(self):
+        self.make_cache(alias='aliexpress').get_product_details(7)
+        other = self.make_cache(alias='aliexpress')
+        self.assertEqual(other.get_product_details(7)['product_id'], 7)
+        self.assertEqual(len(self.backend.calls), 1)
+
+    def test_affiliate_links_are_stored_once(self):
+        url = 'https://www.AliExpress.com/item/1.html?spm=abc#reviews'
+        link = self.make_cache().generate_affiliate_link(url)
+        self.assertEqual(AffiliateLink.objects.get().promotion_link, link)
+        # A fresh process with different tracking noise reads the stored link
+        fresh = self.make_cache()
+        with self.assertNumQueries(2):  # one lookup, one insert for the new link
+            links = fresh.generate_affiliate_links(['https://www.aliexpress.com/item/1.html', 'https://x.test/2'])
+        self.assertEqual(links['https://www.aliexpress.com/item/1.html'], link)
+        self.assertEqual(self.backend.calls, [('links', [url]), ('links', ['https://x.test/2'])])
+        with self.assertNumQueries(0):
+            self.assertEqual(fresh.generate_affiliate_link('https://x.test/2'), links['https://x.test/2'])
+
+    def test_urls_keep_identifying_query_parameters(self):
+        base = 'https://www.aliexpress.com/item/1.html'
+        self.assertEqual(normalize_url(f'{base}?utm_source=x&spm=a.b&aff_fcid=1&gclid=2'), base)
+        self.assertEqual(
+            normalize_url(f'{base}?spm=a&skuId=12&sourceType=5'),
+            normalize_url(f'{base}?sourceType=5&skuId=12&utm_medium=email'),
+        )
+        self.assertNotEqual(url_hash(f'{base}?skuId=12'), url_hash(f'{base}?skuId=13'))
+
+    def test_client_backend_against_fake_api(self):
+        with FakeAliExpressServer(secret='secret') as server:
+            transport = AliExpressTransport(max_connections=2)
+            self.addCleanup(transport.close)
+            client = AliExpressClient(transport=transport, base_url=server.url)
+            batcher = ProductDetailBatcher(client, window=0.001)
+            self.addCleanup(batcher.close)
+            cached = CachedAliExpress(ClientBackend(client, batcher), alias='')
+            details = cached.get_product_details(3)
+            self.assertEqual((details['aliexpress_id'], details['title']), (3, 'Fake product 3'))
+            self.assertEqual(details['price'], 10.03)
+            self.assertEqual(details['seller']['name'], 'Store 3')
+            self.assertEqual(len(cached.search_products('Lamp', limit=5)), 5)
+            cached.get_product_details(3)
+            cached.search_products('lamp', limit=5)
+            url = 'https://www.aliexpress.com/item/3.html'
+            self.assertTrue(cached.generate_affiliate_link(url).startswith('https://s.click.aliexpress.com/'))
+            self.assertEqual(cached.generate_affiliate_link(url), AffiliateLink.objects.get().promotion_link)
+            self.assertEqual(len(server.requests), 3)
+
+
+class PayloadBatcher:
+    """Detail batcher double serving scripted payloads"""
+
+    def __init__(self, payloads):
+        self.payloads = payloads
+        self.calls = []
+
+    def get_many(self, product_ids, timeout=None):
+        self.calls.append(list(product_ids))
+        return [self.payloads.get(product_id) for product_id in product_ids]
+
+
+class AliExpressSyncTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Imports')
+
+    def map_products(self, count):
+        for index in range(1, count + 1):
+            product = make_product(self.category, index, name=f'Fake product {index}', price=Decimal('10.00'))
+            AliExpressProduct.objects.create(product=product, aliexpress_id=str(index))
+        return {str(index): fake_product(index) for index in range(1, count + 1)}
+
+    def test_only_changed_fields_are_written(self):
+        payloads = self.map_products(3)
+        payloads['2'] = dict(payloads['2'], sale_price='1000')  # price unchanged at 10.00
+        del payloads['3']
+        run = AliExpressSync(PayloadBatcher(payloads)).run()
+        self.assertEqual((run.fetched, run.changed, run.failed), (2, 2, 1))
+        self.assertEqual(AliExpressSyncRun.objects.get(), run)
+
+        first = Product.objects.get(sku='SKU-00001')
+        self.assertEqual(first.price, Decimal('10.01'))
+        self.assertEqual(first.compare_at_price, Decimal('20.01'))
+        second = Product.objects.get(sku='SKU-00002')
+        self.assertEqual((second.price, second.compare_at_price), (Decimal('10.00'), Decimal('20.02')))
+        synced = AliExpressProduct.objects.exclude(last_synced_at=None)
+        self.assertEqual(sorted(synced.values_list('aliexpress_id', flat=True)), ['1', '2'])
+        self.assertEqual(AliExpressProduct.objects.get(aliexpress_id='3').content_hash, '')
+
+    def test_invalid_payloads_fail_without_touching_the_product(self):
+        payloads = self.map_products(4)
+        del payloads['1']['sale_price']
+        payloads['2'] = dict(payloads['2'], sale_price='n/a')
+        payloads['3'] = dict(payloads['3'], product_title='  ')
+        run = AliExpressSync(PayloadBatcher(payloads)).run()
+
+        self.assertEqual((run.fetched, run.changed, run.failed), (1, 1, 3))
+        self.assertIsNotNone(run.finished_at)
+        for sku in ('SKU-00001', 'SKU-00002', 'SKU-00003'):
+            product = Product.objects.get(sku=sku)
+            self.assertEqual((product.price, product.name[:12]), (Decimal('10.00'), 'Fake product'))
+        self.assertEqual(Product.objects.get(sku='SKU-00004').price, Decimal('10.04'))
+        self.assertEqual(AliExpressProduct.objects.filter(last_synced_at=None).count(), 3)
+
+    def test_unchanged_payloads_are_skipped_by_hash(self):
+        payloads = self.map_products(2)
+        batcher = PayloadBatcher(payloads)
+        AliExpressSync(batcher).run()
+        Product.objects.filter(sku='SKU-00001').update(price=Decimal('99.00'))  # edited locally
+        run = AliExpressSync(batcher).run()
+        self.assertEqual((run.fetched, run.changed, run.failed), (2, 0, 0))
+        self.assertEqual(Product.objects.get(sku='SKU-00001').price, Decimal('99.00'))
+
+        payloads['1'] = dict(payloads['1'], product_title='Renamed')
+        run = AliExpressSync(batcher).run()
+        self.assertEqual(run.changed, 1)
+        product = Product.objects.get(sku='SKU-00001')
+        self.assertEqual((product.name, product.price), ('Renamed', Decimal('10.01')))
+
+    def test_queries_do_not_grow_with_batch_size(self):
+        payloads = self.map_products(40)
+        with CaptureQueriesContext(connection) as small:
+            AliExpressSync(PayloadBatcher(dict(list(payloads.items())[:5])), batch_size=50).run(
+                AliExpressProduct.objects.filter(aliexpress_id__in=list(payloads)[:5])
+            )
+        AliExpressProduct.objects.update(content_hash='', last_synced_at=None)
+        with CaptureQueriesContext(connection) as large:
+            AliExpressSync(PayloadBatcher(payloads), batch_size=50).run()
+        self.assertEqual(len(small), len(large))
+
+    def test_stale_after_limits_the_run(self):
+        payloads = self.map_products(2)
+        batcher = PayloadBatcher(payloads)
+        sync_products(batcher=batcher)
+        AliExpressProduct.objects.filter(aliexpress_id='2').update(last_synced_at=timezone.now() - timedelta(days=1))
+        run = sync_products(batcher=batcher)
+        self.assertEqual(run.fetched, 1)
+        self.assertEqual(batcher.calls[-1], ['2'])
+        self.assertEqual(sync_products(stale_after=None, batcher=batcher).fetched, 2)
+
+
+@override_settings(
+    ALIEXPRESS_API_KEY='key', ALIEXPRESS_API_SECRET='secret', ALIEXPRESS_TRACKING_ID='track',
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-governor'}},
+)
+class AliExpressGovernorTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.server = FakeAliExpressServer(secret='secret').start()
+        self.addCleanup(self.server.stop)
+
+    def make_client(self, governor, max_retries=0):
+        transport = AliExpressTransport(max_retries=max_retries, backoff_base=0.001, governor=governor)
+        self.addCleanup(transport.close)
+        return AliExpressClient(transport=transport, base_url=self.server.url)
+
+    def test_breaker_fails_fast_and_recovers_through_a_probe(self):
+        governor = Governor(min_calls=4, threshold=0.5, reset_timeout=0.2, rate=1000, burst=1000)
+        client = self.make_client(governor)
+        self.server.fail_next(3, status=503)
+        with self.assertLogs('shop.services.aliexpress_client', 'ERROR'):
+            client.get_product_details([1])
+            client.get_product_details([2])
+        self.assertEqual(governor.breaker.state, 'closed')  # 2 calls is below min_calls
+        with self.assertLogs('shop.services.aliexpress_client', 'ERROR'):
+            client.get_product_details([3])
+            client.get_product_details([4])  # the fake is healthy again: 1 of 4 ok
+        with self.assertLogs('shop.services.aliexpress_governor', 'WARNING'):
+            self.server.fail_next(1, status=503)
+            with self.assertLogs('shop.services.aliexpress_client', 'ERROR'):
+                client.get_product_details([5])
+        self.assertEqual(governor.breaker.state, 'open')
+
+        with self.assertLogs('shop.services.aliexpress_client', 'WARNING') as logs:
+            self.assertEqual(client.get_product_details([6]), [])
+        self.assertIn('skipped', logs.output[0])
+        self.assertEqual(len(self.server.requests), 5)
+        self.assertEqual(governor.stats['rejected'], 1)
+
+        time.sleep(0.25)
+        self.assertEqual(governor.breaker.state, 'half_open')
+        self.assertEqual(client.get_product_details([7])[0]['product_id'], 7)
+        self.assertEqual(governor.breaker.state, 'closed')
+
+    def test_breaker_is_shared_through_the_cache(self):
+        first = Governor(min_calls=1, threshold=0.5, reset_timeout=60)
+        second = Governor(min_calls=1, threshold=0.5, reset_timeout=60)
+        with self.assertLogs('shop.services.aliexpress_governor', 'WARNING'), self.assertRaises(ValueError):
+            first.call(int, 'not a number')
+        with self.assertRaises(CircuitOpen):
+            second.call(int, '1')
+
+    def test_rate_limit_is_shared_and_bounded(self):
+        first = Governor(rate=0.01, burst=3, max_wait=0)
+        second = Governor(rate=0.01, burst=3, max_wait=0)
+        first.call(int, '1')
+        first.call(int, '2')
+        second.call(int, '3')
+        with self.assertRaises(RateLimited):
+            second.call(int, '4')
+        self.assertEqual(second.stats['rate_limited'], 1)
+
+    def test_rate_limiter_refills_one_token_at_a_time(self):
+        limiter = RateLimiter(cache, 'governor:bucket', rate=1, burst=2, max_wait=0)
+
+        def calls(at, attempts=3):
+            with mock.patch('shop.services.aliexpress_governor.time.time', return_value=at):
+                admitted = 0
+                for _ in range(attempts):
+                    try:
+                        limiter.acquire()
+                        admitted += 1
+                    except RateLimited:
+                        pass
+                return admitted
+
+        self.assertEqual(calls(1000.0), 2)
+        self.assertEqual(calls(1001.0), 1)  # one token back, not a fresh window
+        self.assertEqual(calls(1001.5), 0)
+        self.assertEqual(calls(1010.0), 2)  # an idle bucket holds no more than burst
+
+        limiter.max_wait = 5
+        with mock.patch('shop.services.aliexpress_governor.time.sleep') as sleep:
+            self.assertEqual(calls(1010.0, attempts=1), 1)
+        sleep.assert_called_once_with(1.0)
+
+    @override_settings(WEB_CONCURRENCY=3)
+    def test_per_process_bucket_gets_a_share_of_the_limit(self):
+        governor = Governor(rate=0.03, burst=6, max_wait=0)  # locmem: one bucket per worker
+        governor.call(int, '1')
+        governor.call(int, '2')
+        with self.assertRaises(RateLimited):
+            governor.call(int, '3')
+        self.assertEqual([warning.id for warning in check_governor_cache(None)], ['shop.W001'])
+
+    def test_metrics(self):
+        governor = Governor(rate=1000, burst=1000)
+        client = self.make_client(governor)
+        for product_id in range(1, 6):
+            client.get_product_details([product_id])
+        metrics = governor.metrics()
+        self.assertEqual((metrics['calls'], metrics['failures'], metrics['state']), (5, 0, 'closed'))
+        self.assertEqual(metrics['window'], {'calls': 5, 'failures': 0, 'error_rate': 0.0})
+        self.assertEqual(metrics['latency']['samples'], 5)
+        self.assertLessEqual(metrics['latency']['p50'], metrics['latency']['max'])
+
+
+class SalesReportTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        order_numbers._allocator = None
+        User = get_user_model()
+        self.admin = User.objects.create_user('boss', 'boss@example.com', 'pw', is_staff=True)
+        self.buyer = User.objects.create_user('buyer', 'buyer@example.com', 'pw')
+        category = Category.objects.create(name='Accessories')
+        self.watch = make_product(category, 1, price=Decimal('100.00'), cost_price=Decimal('60.00'))
+        self.strap = make_product(category, 2, price=Decimal('20.00'))
+        self.ring = make_product(category, 3, price=Decimal('50.00'), cost_price=Decimal('10.00'))
+        self.today = timezone.localdate()
+
+        self.order(0, 'delivered', (self.watch, 2, '100.00'), (self.strap, 1, '20.00'))
+        self.order(0, 'cancelled', (self.ring, 1, '50.00'))
+        self.order(1, 'shipped', (self.ring, 3, '50.00'))
+        self.old = self.order(40, 'delivered', (self.watch, 1, '90.00'))
+
+    def order(self, days_ago, status, *lines):
+        total = sum(Decimal(price) * quantity for _, quantity, price in lines)
+        order = Order.objects.create(
+            user=self.buyer, status=status, payment_method='cash', payment_status='paid',
+            subtotal=total, total=total, **CUSTOMER,
+        )
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, product=product, quantity=quantity, price=Decimal(price))
+            for product, quantity, price in lines
+        )
+        order.created_at = timezone.now() - timedelta(days=days_ago)
+        Order.objects.filter(pk=order.pk).update(created_at=order.created_at)
+        return order
+
+    def days(self, *days_ago):
+        return [self.today - timedelta(days=days) for days in days_ago]
+
+    def test_sales_per_day_in_one_query(self):
+        with self.assertNumQueries(1):
+            rows, totals = reports.sales_by_period(*self.days(3, 0), period='day')
+
+        self.assertEqual([row['period'] for row in rows], self.days(3, 2, 1, 0))
+        self.assertEqual(rows[0]['orders'], 0)
+        self.assertEqual(
+            {key: rows[2][key] for key in ('orders', 'units', 'revenue', 'cost', 'margin', 'margin_pct')},
+            {'orders': 1, 'units': 3, 'revenue': Decimal('150.00'), 'cost': Decimal('30.00'),
+             'margin': Decimal('120.00'), 'margin_pct': Decimal('80.00')},
+        )
+        today = rows[3]
+        # The strap has no cost price, so margin covers the watches only
+        self.assertEqual((today['revenue'], today['costed_revenue'], today['margin']),
+                         (Decimal('220.00'), Decimal('200.00'), Decimal('80.00')))
+        self.assertEqual(today['lost_revenue'], Decimal('50.00'))
+        self.assertEqual((totals['orders'], totals['units'], totals['revenue']), (2, 6, Decimal('370.00')))
+
+    def test_closed_periods_are_cached_until_an_old_order_changes(self):
+        closed = self.days(45, 30)
+        first, _ = reports.sales_by_period(*closed)
+        with self.assertNumQueries(0):
+            second, totals = reports.sales_by_period(*closed)
+        self.assertEqual(first, second)
+        self.assertEqual(totals['revenue'], Decimal('90.00'))
+
+        # Only the open days are queried next to the cached closed ones
+        reports.sales_by_period(*self.days(45, 0))
+        with CaptureQueriesContext(connection) as queries:
+            rows, totals = reports.sales_by_period(*self.days(45, 0))
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(totals['revenue'], Decimal('460.00'))
+
+        self.old.status = 'refunded'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.old.save()
+        _, totals = reports.sales_by_period(*closed)
+        self.assertEqual((totals['revenue'], totals['lost_revenue']), (Decimal('0.00'), Decimal('90.00')))
+
+    def test_admin_status_actions_drop_cached_reports(self):
+        closed = self.days(45, 30)
+        reports.sales_by_period(*closed)
+        admin_user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'pw')
+        self.client.force_login(admin_user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('admin:shop_order_changelist'),
+                             {'action': 'mark_as_cancelled', '_selected_action': [self.old.pk]})
+        _, totals = reports.sales_by_period(*closed)
+        self.assertEqual((totals['revenue'], totals['lost_revenue']), (Decimal('0.00'), Decimal('90.00')))
+
+    def test_periods_cover_whole_weeks_and_months(self):
+        rows, totals = reports.sales_by_period(*self.days(1, 0), period='month')
+        self.assertEqual(rows[0]['period'], (self.today - timedelta(days=1)).replace(day=1))
+        self.assertEqual(sum(row['revenue'] for row in rows), Decimal('370.00'))
+        rows, _ = reports.sales_by_period(self.today, self.today, period='week')
+        self.assertEqual(rows[0]['period'].weekday(), 0)
+
+    def test_top_products(self):
+        start, end = self.days(1, 0)
+        by_revenue = reports.top_products(start, end)
+        self.assertEqual([(row['name'], row['revenue']) for row in by_revenue], [
+            (self.watch.name, Decimal('200.00')), (self.ring.name, Decimal('150.00')), (self.strap.name, Decimal('20.00')),
+        ])
+        self.assertEqual(by_revenue[1]['lost_revenue'], Decimal('50.00'))
+        self.assertEqual([row['product_id'] for row in reports.top_products(start, end, 2, 'units')],
+                         [self.ring.id, self.watch.id])
+        self.assertEqual([row['margin'] for row in reports.top_products(start, end, order_by='margin')],
+                         [Decimal('120.00'), Decimal('80.00'), Decimal('0.00')])
+
+    def test_order_statuses_in_one_query(self):
+        with self.assertNumQueries(1):
+            report = reports.order_statuses(*self.days(1, 0))
+        self.assertEqual(report['orders'], 3)
+        statuses = {row['status']: (row['orders'], row['total']) for row in report['statuses']}
+        self.assertEqual(statuses['delivered'], (1, Decimal('220.00')))
+        self.assertEqual(statuses['pending'], (0, Decimal('0.00')))
+        self.assertEqual([(row['stage'], row['orders']) for row in report['funnel']], [
+            ('placed', 3), ('processing', 2), ('confirmed', 2), ('shipped', 2), ('delivered', 1),
+        ])
+        self.assertEqual(report['payment_statuses'][1], {'status': 'paid', 'label': 'Paid', 'orders': 3})
+
+    def test_endpoints_are_admin_only_and_validate_input(self):
+        client = APIClient()
+        client.force_authenticate(self.buyer)
+        self.assertEqual(client.get(reverse('sales_report')).status_code, 403)
+
+        client.force_authenticate(self.admin)
+        window = {'start': self.days(45)[0].isoformat()}
+        response = client.get(reverse('sales_report'), {**window, 'period': 'month'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Decimal(response.json()['totals']['revenue']), Decimal('460.00'))
+        response = client.get(reverse('top_products_report'), {'order_by': 'units', 'limit': 1})
+        self.assertEqual(response.json()['products'][0]['product_id'], self.ring.id)
+        self.assertEqual(client.get(reverse('order_status_report'), window).json()['orders'], 4)
+        self.assertEqual(client.get(reverse('order_status_report')).json()['orders'], 3)
+
+        for params in ({'period': 'year'}, {'start': '2024-02-30'}, {'start': '2024-02-02', 'end': '2024-02-01'}):
+            self.assertEqual(client.get(reverse('sales_report'), params).status_code, 400, params)
+        self.assertEqual(client.get(reverse('top_products_report'), {'limit': 'x'}).status_code, 400)
+
+
+class ProductRatingTests(TestCase):
+
+    def setUp(self):
+        User = get_user_model()
+        self.users = [User.objects.create_user(f'reviewer{i}', f'reviewer{i}@example.com', 'pw') for i in range(4)]
+        category = Category.objects.create(name='Jewellery')
+        self.ring = make_product(category, 1)
+        self.chain = make_product(category, 2)
+
+    def review(self, user, rating, product=None, approved=True):
+        return ProductReview.objects.create(
+            product=product or self.ring, user=user, rating=rating, comment='-', is_approved=approved,
+        )
+
+    def assertRatings(self, product, avg, histogram):
+        product.refresh_from_db()
+        self.assertAlmostEqual(product.rating_avg, avg)
+        self.assertEqual(product.rating_count, sum(histogram))
+        self.assertEqual(product.rating_histogram, dict(zip(range(1, 6), histogram)))
+
+    def test_review_changes_update_the_product_incrementally(self):
+        first = self.review(self.users[0], 5)
+        second = self.review(self.users[1], 2)
+        pending = self.review(self.users[2], 1, approved=False)
+        self.assertRatings(self.ring, 3.5, [0, 1, 0, 0, 1])
+
+        second = ProductReview.objects.get(pk=second.pk)
+        second.rating = 4
+        with self.assertNumQueries(5):  # savepoint, lock the stored row, the review, the product, release
+            second.save()
+        self.assertRatings(self.ring, 4.5, [0, 0, 0, 1, 1])
+
+        pending.is_approved = True
+        pending.save()
+        self.assertRatings(self.ring, 10 / 3, [1, 0, 0, 1, 1])
+
+        first.product = self.chain
+        first.save()
+        self.assertRatings(self.ring, 2.5, [1, 0, 0, 1, 0])
+        self.assertRatings(self.chain, 5.0, [0, 0, 0, 0, 1])
+
+        ProductReview.objects.filter(pk=pending.pk).delete()
+        second.is_approved = False
+        second.save()
+        self.assertRatings(self.ring, 0.0, [0, 0, 0, 0, 0])
+
+        # Loaded without the compared fields: the stored row still says what changed
+        first = ProductReview.objects.only('id', 'rating').get(pk=first.pk)
+        first.rating = 3
+        first.save()
+        self.assertRatings(self.chain, 3.0, [0, 0, 1, 0, 0])
+
+    def test_stale_copies_are_counted_from_the_stored_row(self):
+        review = self.review(self.users[0], 4, approved=False)
+        admin_copy = ProductReview.objects.get(pk=review.pk)
+        ratings.set_approved(ProductReview.objects.filter(pk=review.pk), True)
+        self.assertRatings(self.ring, 4.0, [0, 0, 0, 1, 0])
+
+        # A change form loaded before the approval approves it again
+        admin_copy.is_approved = True
+        admin_copy.save()
+        self.assertRatings(self.ring, 4.0, [0, 0, 0, 1, 0])
+        # ... or saves its stale unapproved state, which then stops counting
+        admin_copy.is_approved = False
+        ratings.set_approved(ProductReview.objects.filter(pk=review.pk), True)
+        admin_copy.save()
+        self.assertRatings(self.ring, 0.0, [0, 0, 0, 0, 0])
+
+        stale = ProductReview.objects.get(pk=review.pk)
+        ratings.set_approved(ProductReview.objects.filter(pk=review.pk), True)
+        stale.delete()
+        self.assertRatings(self.ring, 0.0, [0, 0, 0, 0, 0])
+
+    def test_saving_a_stale_product_keeps_its_counters(self):
+        stale = Product.objects.get(pk=self.ring.pk)
+        self.review(self.users[0], 5)
+        Product.objects.filter(pk=self.ring.pk).update(views_count=F('views_count') + 3)
+        stale.name = 'Gold ring'
+        stale.save()
+        self.assertRatings(self.ring, 5.0, [0, 0, 0, 0, 1])
+        self.assertEqual((self.ring.name, self.ring.views_count), ('Gold ring', 3))
+
+    def test_admin_bulk_actions_keep_ratings_in_step(self):
+        admin_user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'pw')
+        self.client.force_login(admin_user)
+        reviews = [self.review(user, rating, approved=False) for user, rating in zip(self.users, (5, 4, 4, 1))]
+        self.review(self.users[0], 2, product=self.chain)
+        url = reverse('admin:shop_productreview_changelist')
+
+        ids = [review.pk for review in reviews[:3]]
+        self.client.post(url, {'action': 'approve_reviews', '_selected_action': ids})
+        self.assertRatings(self.ring, 13 / 3, [0, 0, 0, 2, 1])
+        # Approving again does not count the same reviews twice
+        self.client.post(url, {'action': 'approve_reviews', '_selected_action': ids + [reviews[3].pk]})
+        self.assertRatings(self.ring, 3.5, [1, 0, 0, 2, 1])
+
+        self.client.post(url, {'action': 'disapprove_reviews', '_selected_action': [reviews[0].pk, reviews[3].pk]})
+        self.assertRatings(self.ring, 4.0, [0, 0, 0, 2, 0])
+        self.assertRatings(self.chain, 2.0, [0, 1, 0, 0, 0])
+        self.assertEqual(ProductReview.objects.filter(is_approved=True).count(), 3)
+
+    def test_repair_command_recounts_drifted_products(self):
+        self.review(self.users[0], 5)
+        self.review(self.users[1], 3)
+        self.review(self.users[0], 1, product=self.chain, approved=False)
+        Product.objects.update(rating_avg=1.0, rating_count=7, rating_1=7, rating_3=0, rating_5=0)
+
+        out = StringIO()
+        call_command('repair_ratings', batch_size=1, stdout=out)
+        self.assertIn('Corrected ratings of 2 products', out.getvalue())
+        self.assertRatings(self.ring, 4.0, [0, 0, 1, 0, 1])
+        self.assertRatings(self.chain, 0.0, [0, 0, 0, 0, 0])
+        self.assertEqual(ratings.recompute(), 0)
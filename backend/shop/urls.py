@@ -4,4 +4,15 @@ from . import views
 urlpatterns = [
     path('products/', views.product_list, name='product_list'),
     path('products/<int:pk>/', views.product_detail, name='product_detail'),
+    path('search/', views.product_search, name='product_search'),
+    path('categories/tree/', views.category_tree, name='category_tree'),
+    path('cache/stats/', views.catalog_cache_stats, name='catalog_cache_stats'),
+    path('aliexpress/stats/', views.aliexpress_stats, name='aliexpress_stats'),
+    path('reports/sales/', views.sales_report, name='sales_report'),
+    path('reports/top-products/', views.top_products_report, name='top_products_report'),
+    path('reports/order-status/', views.order_status_report, name='order_status_report'),
+    path('cart/', views.cart_detail, name='cart_detail'),
+    path('cart/items/', views.cart_add_item, name='cart_add_item'),
+    path('cart/items/<int:product_id>/', views.cart_item, name='cart_item'),
+    path('cart/merge/', views.cart_merge, name='cart_merge'),
 ]
\ No newline at end of file
@@ -0,0 +1,261 @@
+# backend/shop/view_counter.py
+import atexit
+import hashlib
+import logging
+import re
+import threading
+from collections import Counter, defaultdict
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import F
+
+from users.activity import log_request_activity
+
+from .models import Product
+
+logger = logging.getLogger(__name__)
+
+BOT_RE = re.compile(r'bot|crawl|spider|slurp|curl|wget|python-requests|httpclient|headless', re.I)
+
+
+def flush_to_database(deltas):
+    """Apply {product_id: delta} with UPDATE ... SET views_count = views_count + delta.
+
+    Products sharing a delta are updated together, so the statement count is
+    bounded by the number of distinct deltas rather than products.
+    """
+    by_delta = defaultdict(list)
+    for product_id, delta in deltas.items():
+        if delta > 0:
+            by_delta[delta].append(product_id)
+    with transaction.atomic():
+        for delta, product_ids in by_delta.items():
+            Product.objects.filter(pk__in=product_ids).update(views_count=F('views_count') + delta)
+    return sum(deltas.values())
+
+
+# ============================================
+# Counter backends
+# ============================================
+
+class MemoryViewCounter:
+    """Buffers views in this process and flushes them from a daemon thread"""
+
+    def __init__(self, flush_interval):
+        self.flush_interval = flush_interval
+        self._counts = Counter()
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def incr(self, product_id):
+        with self._lock:
+            self._counts[product_id] += 1
+            if self._timer is None and self.flush_interval > 0:
+                self._schedule()
+
+    def _schedule(self):
+        self._timer = threading.Timer(self.flush_interval, self._flush_from_timer)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _flush_from_timer(self):
+        with self._lock:
+            self._timer = None
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Failed to flush product view counts")
+        finally:
+            # Each timer is a new thread with its own connection; don't leak it
+            connection.close()
+
+    def pending(self):
+        with self._lock:
+            return dict(self._counts)
+
+    def discard(self):
+        """Drop buffered views and stop the flush timer"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._counts.clear()
+
+    def flush(self):
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+        if not counts:
+            return 0
+        try:
+            return flush_to_database(counts)
+        except Exception:
+            # Put the views back so the next flush retries them
+            with self._lock:
+                self._counts.update(counts)
+            raise
+
+
+class CacheViewCounter:
+    """Aggregates views across workers in the shared cache.
+
+    Writers increment per-product counters under the current generation and
+    register each product once per generation in a dirty list. A flush
+    advances the generation and drains only generations that stopped
+    receiving writes at least one flush earlier, so in-flight increments
+    are never lost to the swap.
+    """
+
+    prefix = 'views'
+    timeout = 60 * 60 * 24
+
+    def _key(self, *parts):
+        return ':'.join([self.prefix, *map(str, parts)])
+
+    def _generation(self):
+        key = self._key('gen')
+        generation = cache.get(key)
+        if generation is None:
+            cache.add(key, 1, timeout=None)
+            generation = cache.get(key)
+        return generation
+
+    def incr(self, product_id):
+        generation = self._generation()
+        count_key = self._key(generation, 'count', product_id)
+        if cache.add(count_key, 1, self.timeout):
+            slot = self._incr(self._key(generation, 'dirty'))
+            cache.set(self._key(generation, 'dirty', slot), product_id, self.timeout)
+        else:
+            self._incr(count_key)
+
+    def _incr(self, key):
+        try:
+            return cache.incr(key)
+        except ValueError:
+            if cache.add(key, 1, self.timeout):
+                return 1
+            return cache.incr(key)
+
+    def _drain(self, generation):
+        size = cache.get(self._key(generation, 'dirty')) or 0
+        slot_keys = [self._key(generation, 'dirty', slot) for slot in range(1, size + 1)]
+        product_ids = list(cache.get_many(slot_keys).values())
+        count_keys = {self._key(generation, 'count', pk): pk for pk in product_ids}
+        counts = cache.get_many(list(count_keys))
+        cache.delete_many([*slot_keys, *count_keys, self._key(generation, 'dirty')])
+        return {count_keys[key]: value for key, value in counts.items()}
+
+    def pending(self):
+        deltas = Counter()
+        generation = self._generation()
+        flushed = cache.get(self._key('flushed')) or 0
+        for gen in range(flushed + 1, generation + 1):
+            size = cache.get(self._key(gen, 'dirty')) or 0
+            slot_keys = [self._key(gen, 'dirty', slot) for slot in range(1, size + 1)]
+            for pk in cache.get_many(slot_keys).values():
+                deltas[pk] += cache.get(self._key(gen, 'count', pk)) or 0
+        return dict(deltas)
+
+    def flush(self, settle=True):
+        """Drain settled generations; ``settle=False`` also drains the newest"""
+        current = self._incr(self._key('gen'))
+        last = current - (2 if settle else 1)
+        flushed = cache.get(self._key('flushed')) or 0
+        deltas = Counter()
+        for generation in range(flushed + 1, last + 1):
+            deltas.update(self._drain(generation))
+        if last > flushed:
+            cache.set(self._key('flushed'), last, timeout=None)
+        if not deltas:
+            return 0
+        return flush_to_database(deltas)
+
+
+# ============================================
+# Public API
+# ============================================
+
+_counter = None
+_counter_lock = threading.Lock()
+
+
+def get_counter():
+    global _counter
+    if _counter is None:
+        with _counter_lock:
+            if _counter is None:
+                if settings.VIEW_COUNTER_BACKEND == 'cache':
+                    _counter = CacheViewCounter()
+                else:
+                    _counter = MemoryViewCounter(settings.VIEW_COUNTER_FLUSH_INTERVAL)
+    return _counter
+
+
+def reset_counter():
+    """Forget the current counter, discarding anything it has buffered"""
+    global _counter
+    with _counter_lock:
+        if isinstance(_counter, MemoryViewCounter):
+            _counter.discard()
+        _counter = None
+
+
+@atexit.register
+def _flush_at_exit():
+    """Write this worker's buffered views before the process exits"""
+    if not isinstance(_counter, MemoryViewCounter):
+        return
+    try:
+        _counter.flush()
+    except Exception:
+        logger.exception("Failed to flush product view counts at exit")
+
+
+def _visitor_id(request):
+    session = getattr(request, 'session', None)
+    if session is not None and session.session_key:
+        return session.session_key
+    raw = f"{request.META.get('REMOTE_ADDR', '')}|{request.META.get('HTTP_USER_AGENT', '')}"
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def should_count(request, product_id):
+    if settings.VIEW_COUNTER_IGNORE_BOTS and BOT_RE.search(request.META.get('HTTP_USER_AGENT', '')):
+        return False
+    window = settings.VIEW_COUNTER_DEDUP_WINDOW
+    if window:
+        # add() only succeeds for the first view in the window
+        return cache.add(f'views:seen:{product_id}:{_visitor_id(request)}', 1, window)
+    return True
+
+
+def record_view(request, product_id):
+    """Count a product view without touching the database"""
+    if should_count(request, product_id):
+        get_counter().incr(product_id)
+
+
+def flush():
+    """Write buffered views to Product.views_count; returns views written"""
+    counter = get_counter()
+    if isinstance(counter, CacheViewCounter):
+        return counter.flush(settle=True)
+    return counter.flush()
+
+
+def count_product_view(view):
+    """Record a view (and the user's activity) for each successful product_detail response"""
+    @wraps(view)
+    def wrapper(request, pk, *args, **kwargs):
+        response = view(request, pk, *args, **kwargs)
+        if response.status_code in (200, 304):
+            try:
+                record_view(request, int(pk))
+            except Exception:
+                logger.exception("Failed to record product view")
+            log_request_activity(request, 'view_product', f'Viewed product {pk}', product_id=int(pk))
+        return response
+    return wrapper
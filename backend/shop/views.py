@@ -1,18 +1,231 @@
 from django.shortcuts import render
 from django.shortcuts import get_object_or_404
-from rest_framework.decorators import api_view
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from datetime import timedelta
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
+from . import reports
+from . import search as search_engine
+from .categories import get_tree
+from .filters import ProductFilterSet
 from .models import Product
-from .serializers import ProductSerializer
+from .pagination import KeysetPagination
+from .response_cache import cache_catalog_response, get_stats
+from .serializers import CartSerializer, ProductSerializer, ProductListSerializer
+from .services import cart as cart_service
+from .services.aliexpress_governor import get_governor
+from .view_counter import count_product_view
+from users.activity import log_request_activity
+
+# Query params that switch product_list into paginated catalog mode
+CATALOG_PARAMS = ('cursor', 'page_size', 'fields')
+
+
+def _parse_fields(request):
+    """Validate the ``fields=`` projection against the list serializer"""
+    raw = request.query_params.get('fields')
+    if not raw:
+        return None
+    allowed = ProductListSerializer.Meta.fields
+    fields = [f.strip() for f in raw.split(',') if f.strip()]
+    unknown = [f for f in fields if f not in allowed]
+    if unknown:
+        raise ValidationError({'fields': f"Unknown fields: {', '.join(unknown)}"})
+    return fields
+
 
 @api_view(['GET'])
+@cache_catalog_response
 def product_list(request):
-    products = Product.objects.filter(is_active=True)
-    serializer = ProductSerializer(products, many=True)
-    return Response(serializer.data)
+    filterset = ProductFilterSet(request.query_params)
+    products = filterset.filter_queryset(Product.objects.filter(is_active=True))
+
+    if not any(param in request.query_params for param in CATALOG_PARAMS):
+        serializer = ProductSerializer(products, many=True)
+        return Response(serializer.data)
+
+    # Catalog mode: keyset-paginated, compact and optionally projected
+    fields = _parse_fields(request)
+    columns = fields or ProductListSerializer.Meta.fields
+    # The cursor needs the ordering columns even when they are not returned
+    ordering_columns = {order.lstrip('-') for order in filterset.get_ordering()}
+    products = products.only(*set(columns) | ordering_columns)
+
+    paginator = KeysetPagination(request, ordering=filterset.get_ordering())
+    rows, next_cursor = paginator.paginate_queryset(products)
+    serializer = ProductListSerializer(rows, many=True, fields=fields)
+    return Response({
+        'results': serializer.data,
+        'next_cursor': next_cursor,
+        'page_size': paginator.page_size,
+    })
 
 @api_view(['GET'])
+@count_product_view
+@cache_catalog_response
 def product_detail(request, pk):
     product = get_object_or_404(Product, pk=pk, is_active=True)
     serializer = ProductSerializer(product)
     return Response(serializer.data)
+
+@api_view(['GET'])
+def product_search(request):
+    """Ranked full-text product search; ``prefix=true`` for autocomplete"""
+    query = request.query_params.get('q', '').strip()
+    try:
+        limit = max(1, min(int(request.query_params.get('limit', 20)), 100))
+    except ValueError:
+        raise ValidationError({'limit': 'Must be an integer'})
+    prefix = request.query_params.get('prefix', '').lower() in ('true', '1', 'yes')
+
+    ranked = search_engine.search(query, limit=limit, prefix=prefix) if query else []
+    products = Product.objects.only('is_active', *ProductListSerializer.Meta.fields).in_bulk(
+        [product_id for product_id, _ in ranked]
+    )
+    results = []
+    for product_id, score in ranked:
+        product = products.get(product_id)
+        if product is None or not product.is_active:
+            continue
+        row = ProductListSerializer(product).data
+        row['score'] = round(float(score), 4)
+        results.append(row)
+    return Response({'query': query, 'results': results})
+
+@api_view(['GET'])
+def category_tree(request):
+    """Active category hierarchy with per-node product counts"""
+    return Response(get_tree()['tree'])
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def catalog_cache_stats(request):
+    """Hit/miss counters for the product list/detail response cache"""
+    return Response(get_stats())
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def aliexpress_stats(request):
+    """Latency, error rate and circuit breaker state for AliExpress calls"""
+    return Response(get_governor().metrics())
+
+# ============================================
+# Reports (admin only)
+# ============================================
+
+def _report_window(request, default_days=30):
+    """(start, end) dates from ?start=&end= (ISO, inclusive); the last 30 days by default"""
+    try:
+        end = parse_date(request.query_params.get('end') or '') or timezone.localdate()
+        start = parse_date(request.query_params.get('start') or '') or end - timedelta(days=default_days - 1)
+    except ValueError:
+        raise ValidationError({'date': 'Dates must be valid YYYY-MM-DD'})
+    if start > end:
+        raise ValidationError({'start': 'Must not be after end'})
+    return start, end
+
+
+def _choice(request, name, choices, default):
+    value = request.query_params.get(name, default)
+    if value not in choices:
+        raise ValidationError({name: f'Must be one of: {", ".join(choices)}'})
+    return value
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def sales_report(request):
+    """Revenue, cost and margin per ?period=day|week|month"""
+    start, end = _report_window(request)
+    period = _choice(request, 'period', reports.PERIODS, 'day')
+    rows, totals = reports.sales_by_period(start, end, period)
+    return Response({'start': start, 'end': end, 'period': period, 'totals': totals, 'rows': rows})
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def top_products_report(request):
+    """Top sellers by ?order_by=revenue|units|margin"""
+    start, end = _report_window(request)
+    order_by = _choice(request, 'order_by', reports.TOP_PRODUCT_ORDERINGS, 'revenue')
+    try:
+        limit = min(max(int(request.query_params.get('limit', 10)), 1), 100)
+    except ValueError:
+        raise ValidationError({'limit': 'Must be an integer'})
+    products = reports.top_products(start, end, limit, order_by)
+    return Response({'start': start, 'end': end, 'order_by': order_by, 'products': products})
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def order_status_report(request):
+    """Order and payment status counts with the fulfilment funnel"""
+    start, end = _report_window(request)
+    return Response({'start': start, 'end': end, **reports.order_statuses(start, end)})
+
+# ============================================
+# Cart API
+# ============================================
+
+EMPTY_CART = {'id': None, 'items': [], 'total_items': 0, 'subtotal': '0.00', 'updated_at': None}
+
+
+def _cart_response(request, status_code=status.HTTP_200_OK):
+    cart = cart_service.get_cart(request)
+    if cart is None:
+        return Response(EMPTY_CART, status=status_code)
+    return Response(CartSerializer(cart, context={'request': request}).data, status=status_code)
+
+
+def _parse_quantity(data, default=None):
+    try:
+        return int(data.get('quantity', default))
+    except (TypeError, ValueError):
+        raise ValidationError({'quantity': 'Must be an integer'})
+
+
+@api_view(['GET'])
+def cart_detail(request):
+    """Current cart: the user's when logged in, otherwise the session's"""
+    return _cart_response(request)
+
+
+@api_view(['POST'])
+def cart_add_item(request):
+    cart = cart_service.get_cart(request, create=True)
+    quantity = _parse_quantity(request.data, 1)
+    try:
+        product = cart_service.add_item(cart, request.data.get('product_id'), quantity)
+    except cart_service.CartError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    log_request_activity(request, 'add_to_cart', 'Added to cart', product_id=product.pk, quantity=quantity)
+    return _cart_response(request, status.HTTP_201_CREATED)
+
+
+@api_view(['PATCH', 'DELETE'])
+def cart_item(request, product_id):
+    cart = cart_service.get_cart(request)
+    if cart is None:
+        return Response({'error': 'Cart is empty'}, status=status.HTTP_404_NOT_FOUND)
+    try:
+        if request.method == 'DELETE':
+            cart_service.remove_item(cart, product_id)
+            log_request_activity(request, 'remove_from_cart', 'Removed from cart', product_id=product_id)
+        else:
+            cart_service.set_quantity(cart, product_id, _parse_quantity(request.data))
+    except cart_service.CartError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return _cart_response(request)
+
+
+@api_view(['POST'])
+def cart_merge(request):
+    """Merge the anonymous session cart into the logged-in user's cart"""
+    if not request.user.is_authenticated:
+        return Response({'error': 'Login required'}, status=status.HTTP_401_UNAUTHORIZED)
+    cart_service.merge_session_cart(request, request.user)
+    return _cart_response(request)
@@ -0,0 +1,194 @@
+# backend/users/activity.py
+import atexit
+import logging
+import threading
+from collections import deque
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, close_old_connections, connection
+from django.utils import timezone
+
+from .models import UserActivity
+
+logger = logging.getLogger(__name__)
+
+
+class ActivityBuffer:
+    """Collects UserActivity rows in this process and bulk-inserts them.
+
+    ``log()`` only appends to a bounded in-memory queue, so a request never
+    waits on the database. A daemon thread writes the queue with
+    ``bulk_create`` every ``flush_interval`` seconds, or as soon as it
+    holds ``flush_size`` events; with no interval nothing is written until
+    ``flush()`` is called. When the queue is full (the database is slow or
+    down) new events are dropped and counted instead of blocking the
+    caller or growing memory.
+    """
+
+    def __init__(self, flush_size, flush_interval, max_size):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_size = max_size
+        self._events = deque()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self.stats = {'logged': 0, 'written': 0, 'dropped': 0}
+
+    def log(self, activity):
+        with self._lock:
+            if len(self._events) >= self.max_size:
+                self.stats['dropped'] += 1
+                return False
+            self._events.append(activity)
+            self.stats['logged'] += 1
+            if self._thread is None and self.flush_interval > 0:
+                self._start()
+            if len(self._events) >= self.flush_size:
+                self._wake.set()
+        return True
+
+    def _start(self):
+        self._thread = threading.Thread(target=self._run, name='activity-flush', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        # This thread owns its own database connection: nothing outside a
+        # request cycle would otherwise drop it once stale or past CONN_MAX_AGE
+        try:
+            while True:
+                self._wake.wait(self.flush_interval)
+                self._wake.clear()
+                close_old_connections()
+                try:
+                    self.flush()
+                except Exception:
+                    logger.exception("Failed to write user activity")
+        finally:
+            connection.close()
+
+    def pending(self):
+        with self._lock:
+            return len(self._events)
+
+    def discard(self):
+        with self._lock:
+            self._events.clear()
+
+    def flush(self):
+        """Write everything buffered so far; returns the rows written"""
+        with self._lock:
+            events, self._events = list(self._events), deque()
+        if not events:
+            return 0
+        try:
+            try:
+                UserActivity.objects.bulk_create(events, batch_size=self.flush_size)
+            except IntegrityError:
+                # A user was deleted meanwhile; their events go with them
+                kept = _with_existing_users(events)
+                UserActivity.objects.bulk_create(kept, batch_size=self.flush_size)
+                with self._lock:
+                    self.stats['dropped'] += len(events) - len(kept)
+                events = kept
+        except Exception:
+            # Keep what still fits for the next attempt; the rest is dropped
+            with self._lock:
+                room = max(self.max_size - len(self._events), 0)
+                self._events.extendleft(reversed(events[:room]))
+                self.stats['dropped'] += len(events) - min(room, len(events))
+            raise
+        with self._lock:
+            self.stats['written'] += len(events)
+        return len(events)
+
+
+def _with_existing_users(events):
+    User = get_user_model()
+    existing = set(User.objects.filter(pk__in={event.user_id for event in events}).values_list('pk', flat=True))
+    return [event for event in events if event.user_id in existing]
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer():
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = ActivityBuffer(
+                    settings.ACTIVITY_FLUSH_SIZE, settings.ACTIVITY_FLUSH_INTERVAL, settings.ACTIVITY_MAX_BUFFER,
+                )
+    return _buffer
+
+
+@atexit.register
+def _flush_at_exit():
+    """Write this worker's buffered events before the process exits"""
+    if _buffer is None:
+        return
+    try:
+        _buffer.flush()
+    except Exception:
+        logger.exception("Failed to write user activity at exit")
+
+
+def log_activity(user, activity_type, description='', request=None, **metadata):
+    """Record an activity for ``user`` without touching the database.
+
+    Never raises: losing an analytics event must not fail the request.
+    Events without a user (anonymous visitors, guests) are not recorded;
+    one such row would fail the NOT NULL constraint for its whole batch.
+    """
+    if getattr(user, 'pk', user) is None:
+        return False
+    try:
+        activity = UserActivity(
+            user_id=getattr(user, 'pk', user),
+            activity_type=activity_type,
+            description=description[:255],
+            metadata=metadata,
+            created_at=timezone.now(),
+        )
+        if request is not None:
+            activity.ip_address = request.META.get('REMOTE_ADDR') or None
+            activity.user_agent = request.META.get('HTTP_USER_AGENT', '')[:500]
+        return get_buffer().log(activity)
+    except Exception:
+        logger.exception("Failed to log user activity")
+        return False
+
+
+def log_request_activity(request, activity_type, description='', **metadata):
+    """``log_activity`` for the request's user; anonymous requests are skipped"""
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return False
+    return log_activity(user, activity_type, description, request=request, **metadata)
+
+
+def flush():
+    return get_buffer().flush()
+
+
+def prune(days=None, batch_size=10000):
+    """Delete activity older than ``days`` (ACTIVITY_RETENTION_DAYS) in id batches.
+
+    Walks the oldest rows through the created_at index a batch at a time,
+    so no single DELETE holds locks over the whole expired range.
+    """
+    days = settings.ACTIVITY_RETENTION_DAYS if days is None else days
+    cutoff = timezone.now() - timedelta(days=days)
+    deleted = 0
+    while True:
+        ids = list(
+            UserActivity.objects.filter(created_at__lt=cutoff).order_by('created_at')
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        if not ids:
+            return deleted
+        deleted += UserActivity.objects.filter(pk__in=ids).delete()[0]
@@ -1,9 +1,11 @@
 from django.contrib import admin
 # backend/users/admin.py
 from django.contrib import admin
+from django.contrib import messages
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.utils.html import format_html
-from .models import User, Address, UserActivity, Notification
+from .models import User, Address, UserActivity, Notification, Newsletter
+from .tasks import queue_newsletter
 
 class AddressInline(admin.TabularInline):
     """Inline for user addresses"""
@@ -104,8 +106,17 @@ class UserAdmin(BaseUserAdmin):
     deactivate_users.short_description = "Deactivate selected users"
     
     def send_newsletter(self, request, queryset):
-        """Send newsletter to selected users"""
-        self.message_user(request, 'Newsletter feature coming soon!')
+        """Queue the latest draft newsletter for the selected subscribers"""
+        newsletter = Newsletter.objects.filter(status='draft').first()
+        if newsletter is None:
+            self.message_user(request, 'There is no draft newsletter to send.', level=messages.WARNING)
+            return
+        newsletter.recipient_ids = list(queryset.filter(newsletter_subscription=True).values_list('pk', flat=True))
+        newsletter.save(update_fields=['recipient_ids'])
+        queue_newsletter(newsletter)
+        self.message_user(
+            request, f'"{newsletter}" was queued for {len(newsletter.recipient_ids)} subscribed users.'
+        )
     send_newsletter.short_description = "Send newsletter to selected users"
 
 
@@ -122,6 +133,8 @@ class AddressAdmin(admin.ModelAdmin):
     
     search_fields = ['user__email', 'first_name', 'last_name', 'city', 'phone']
     
+    list_select_related = ['user']
+    
     list_editable = ['is_default']
     
     readonly_fields = ['created_at', 'updated_at']
@@ -159,6 +172,8 @@ class UserActivityAdmin(admin.ModelAdmin):
     
     search_fields = ['user__email', 'user__username', 'description', 'ip_address']
     
+    list_select_related = ['user']
+    
     readonly_fields = ['created_at']
     
     def has_add_permission(self, request):
@@ -180,6 +195,8 @@ class NotificationAdmin(admin.ModelAdmin):
     
     search_fields = ['user__email', 'title', 'message']
     
+    list_select_related = ['user']
+    
     list_editable = ['is_read']
     
     readonly_fields = ['created_at']
@@ -203,3 +220,30 @@ class NotificationAdmin(admin.ModelAdmin):
         updated = queryset.update(is_archived=True)
         self.message_user(request, f'{updated} notifications archived.')
     archive_selected.short_description = "Archive selected"
+
+
+
+@admin.register(Newsletter)
+class NewsletterAdmin(admin.ModelAdmin):
+    """Newsletter Admin"""
+    
+    list_display = ['id', 'subject', 'status', 'recipients', 'sent_count', 'created_at', 'finished_at']
+    
+    list_filter = ['status', 'created_at']
+    
+    search_fields = ['subject']
+    
+    readonly_fields = ['status', 'recipients', 'sent_count', 'last_user_id', 'started_at', 'finished_at', 'created_at']
+    
+    exclude = ['recipient_ids']
+    
+    actions = ['send_to_subscribers']
+    
+    def send_to_subscribers(self, request, queryset):
+        """Queue the selected newsletters for their recipients"""
+        queued = 0
+        for newsletter in queryset.exclude(status='sent'):
+            queue_newsletter(newsletter)
+            queued += 1
+        self.message_user(request, f'{queued} newsletters were queued for sending.')
+    send_to_subscribers.short_description = "Send selected newsletters to subscribers"
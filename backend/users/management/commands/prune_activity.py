@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from users import activity
+
+
+class Command(BaseCommand):
+    help = "Delete UserActivity rows older than the retention window"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None,
+                            help='Keep this many days (default ACTIVITY_RETENTION_DAYS)')
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument('--interval', type=int, default=0,
+                            help='Keep running, pruning every N seconds')
+
+    def handle(self, *args, **options):
+        while True:
+            deleted = activity.prune(options['days'], options['batch_size'])
+            self.stdout.write(f'Pruned {deleted} activity rows.')
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils.dateparse import parse_date
+
+from users import rollups
+
+
+class Command(BaseCommand):
+    help = "Fold new UserActivity rows into the daily ActivityRollup table"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', nargs='+', metavar='DATE',
+                            help='Recompute these days (YYYY-MM-DD) instead of folding new rows')
+        parser.add_argument('--interval', type=int, default=0,
+                            help='Keep running, folding every N seconds')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            rows = rollups.rebuild_days([parse_date(day) for day in options['rebuild']])
+            self.stdout.write(f'Rebuilt {len(options["rebuild"])} days into {rows} rollup rows.')
+            return
+        while True:
+            days = rollups.rollup()
+            self.stdout.write(f'Rolled up activity for {days} days.')
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,39 @@
+# Generated by Django 5.1.6 on 2026-10-17 17:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_activity_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('last_id', models.PositiveBigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ActivityRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('activity_type', models.CharField(choices=[('login', 'Login'), ('logout', 'Logout'), ('view_product', 'View Product'), ('add_to_cart', 'Add to Cart'), ('remove_from_cart', 'Remove from Cart'), ('place_order', 'Place Order'), ('view_order', 'View Order'), ('add_review', 'Add Review'), ('update_profile', 'Update Profile')], max_length=20)),
+                ('product_id', models.PositiveBigIntegerField(blank=True, null=True)),
+                ('events', models.PositiveIntegerField(default=0)),
+                ('quantity', models.PositiveIntegerField(default=0)),
+                ('users', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-date', 'activity_type', 'product_id'],
+                'indexes': [models.Index(fields=['activity_type', 'date'], name='rollup_type_date_idx'), models.Index(fields=['product_id', 'date'], name='rollup_product_date_idx')],
+                'constraints': [models.UniqueConstraint(fields=('date', 'activity_type', 'product_id'), name='rollup_day_type_product_uniq')],
+            },
+        ),
+    ]
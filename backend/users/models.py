@@ -2,6 +2,7 @@ from django.db import models
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import RegexValidator
+from django.utils import timezone
 
 # ============================================
 # Custom User Model (if you want to extend User)
@@ -142,11 +143,19 @@ class UserActivity(models.Model):
     ip_address = models.GenericIPAddressField(blank=True, null=True)
     user_agent = models.TextField(blank=True)
     metadata = models.JSONField(default=dict, blank=True)  # Store additional data
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Stamped when the event happens, not when the buffer writes it (see users.activity)
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
     
     class Meta:
         ordering = ['-created_at']
         verbose_name_plural = "User activities"
+        indexes = [
+            # A user's timeline, and per-type time ranges for analytics
+            models.Index(fields=['user', '-created_at'], name='activity_user_recent_idx'),
+            models.Index(fields=['activity_type', '-created_at'], name='activity_type_recent_idx'),
+            # Retention pruning walks the oldest rows (see users.activity.prune)
+            models.Index(fields=['created_at'], name='activity_created_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.username} - {self.activity_type} - {self.created_at}"
@@ -180,3 +189,72 @@ class Notification(models.Model):
     
     def __str__(self):
         return f"{self.user.username} - {self.title}"
+
+# ============================================
+# Newsletter
+# ============================================
+
+class Newsletter(models.Model):
+    """A newsletter and the progress of sending it (see users.newsletter)"""
+    
+    STATUS_CHOICES = [
+        ('draft', 'Draft'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+    ]
+    
+    subject = models.CharField(max_length=200)  # template, like the body
+    body = models.TextField(help_text='Django template; gets first_name and site_url')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='draft')
+    # Only these users (when they are subscribed); None sends to every subscriber
+    recipient_ids = models.JSONField(null=True, blank=True)
+    recipients = models.PositiveIntegerField(default=0)
+    sent_count = models.PositiveIntegerField(default=0)
+    last_user_id = models.PositiveBigIntegerField(default=0)  # resume cursor
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return self.subject
+
+# ============================================
+# Activity Rollups
+# ============================================
+
+class ActivityRollup(models.Model):
+    """UserActivity counted per day, type and product (see users.rollups)"""
+    
+    date = models.DateField()
+    activity_type = models.CharField(max_length=20, choices=UserActivity.ACTIVITY_TYPES)
+    product_id = models.PositiveBigIntegerField(null=True, blank=True)  # metadata.product_id, if any
+    events = models.PositiveIntegerField(default=0)
+    quantity = models.PositiveIntegerField(default=0)  # sum of metadata.quantity
+    users = models.PositiveIntegerField(default=0)  # distinct users that day
+    
+    class Meta:
+        ordering = ['-date', 'activity_type', 'product_id']
+        indexes = [
+            models.Index(fields=['activity_type', 'date'], name='rollup_type_date_idx'),
+            models.Index(fields=['product_id', 'date'], name='rollup_product_date_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'activity_type', 'product_id'], name='rollup_day_type_product_uniq'),
+        ]
+    
+    def __str__(self):
+        return f"{self.date} {self.activity_type} #{self.product_id}: {self.events}"
+
+
+class RollupWatermark(models.Model):
+    """Highest source row id already folded into a rollup"""
+    
+    name = models.CharField(max_length=50, unique=True)
+    last_id = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.name} @ {self.last_id}"
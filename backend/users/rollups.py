@@ -0,0 +1,130 @@
+# backend/users/rollups.py
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import BigIntegerField, Case, Count, IntegerField, Max, Sum, When
+from django.db.models.fields.json import KT
+from django.db.models.functions import Cast, Coalesce, TruncDate
+from django.db.models.lookups import Regex
+from django.utils import timezone
+
+from .models import ActivityRollup, RollupWatermark, UserActivity
+
+WATERMARK = 'activity_daily'
+# Metadata values counted as ids and quantities; anything else is ignored
+PRODUCT_ID_RE = r'^[0-9]{1,18}$'
+QUANTITY_RE = r'^-?[0-9]{1,9}$'
+
+
+def _metadata_int(key, pattern, output_field):
+    """metadata[key] as an integer, or NULL when it does not look like one.
+
+    Logged metadata is free-form; a plain cast of a value such as 'abc'
+    would abort the whole query on PostgreSQL.
+    """
+    value = KT(f'metadata__{key}')
+    return Case(When(Regex(value, pattern), then=Cast(value, output_field)), default=None, output_field=output_field)
+
+
+def _day_range(days):
+    """Aware [start, end) datetimes covering ``days`` in the current time zone"""
+    tz = timezone.get_current_timezone()
+    start = timezone.make_aware(datetime.combine(min(days), time.min), tz)
+    end = timezone.make_aware(datetime.combine(max(days) + timedelta(days=1), time.min), tz)
+    return start, end
+
+
+def rebuild_days(days):
+    """Recompute the rollup rows of ``days`` from UserActivity; returns rows written.
+
+    The counting is one GROUP BY over the days' rows, found through the
+    created_at index, and the days' old rows are replaced in the same
+    transaction. Rebuilding a day any number of times gives the same rows,
+    including events that arrived late from a worker's buffer.
+    """
+    days = sorted(set(days))
+    if not days:
+        return 0
+    start, end = _day_range(days)
+    groups = (
+        UserActivity.objects
+        .filter(created_at__gte=start, created_at__lt=end)
+        .annotate(day=TruncDate('created_at'), product=_metadata_int('product_id', PRODUCT_ID_RE, BigIntegerField()))
+        .filter(day__in=days)
+        .values('day', 'activity_type', 'product')
+        .annotate(
+            event_count=Count('id'),
+            quantity_sum=Coalesce(Sum(_metadata_int('quantity', QUANTITY_RE, IntegerField())), 0),
+            user_count=Count('user', distinct=True),
+        )
+        .order_by()
+    )
+    rows = [
+        ActivityRollup(
+            date=group['day'], activity_type=group['activity_type'], product_id=group['product'],
+            events=group['event_count'], quantity=max(group['quantity_sum'], 0), users=group['user_count'],
+        )
+        for group in groups
+    ]
+    with transaction.atomic():
+        ActivityRollup.objects.filter(date__in=days).delete()
+        ActivityRollup.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def rollup():
+    """Fold UserActivity rows added since the watermark into the daily rollups.
+
+    The days those rows fall on are rebuilt, and the watermark moves to
+    the highest id seen in the same transaction. Ids are allocated before
+    commit, so a concurrent bulk insert can commit rows below that id
+    after this run has read it. The last ACTIVITY_ROLLUP_TRAILING_DAYS
+    days are therefore rebuilt on every run as well, which picks those
+    rows up. A run that fails leaves the watermark where it was, and the
+    next one redoes the same days. Returns the number of days rebuilt.
+    """
+    today = timezone.localdate()
+    days = {today - timedelta(days=n) for n in range(settings.ACTIVITY_ROLLUP_TRAILING_DAYS)}
+    with transaction.atomic():
+        watermark, _ = RollupWatermark.objects.select_for_update().get_or_create(name=WATERMARK)
+        high = UserActivity.objects.aggregate(high=Max('id'))['high'] or 0
+        if high > watermark.last_id:
+            days.update(
+                UserActivity.objects.filter(pk__gt=watermark.last_id, pk__lte=high)
+                .annotate(day=TruncDate('created_at')).values_list('day', flat=True).distinct().order_by()
+            )
+        rebuild_days(days)
+        if high > watermark.last_id:
+            watermark.last_id = high
+            watermark.save(update_fields=['last_id', 'updated_at'])
+    return len(days)
+
+
+# ============================================
+# Dashboard queries (rollup tables only)
+# ============================================
+
+def daily_totals(start, end, activity_types=None, product_id=None):
+    """Per day and type totals between two dates (inclusive)"""
+    rows = ActivityRollup.objects.filter(date__gte=start, date__lte=end)
+    if activity_types:
+        rows = rows.filter(activity_type__in=activity_types)
+    if product_id is not None:
+        rows = rows.filter(product_id=product_id)
+    return list(
+        rows.values('date', 'activity_type')
+        .annotate(events=Sum('events'), quantity=Sum('quantity'))
+        .order_by('date', 'activity_type')
+    )
+
+
+def top_products(start, end, activity_type, limit=10):
+    """Products with the most events of one type between two dates"""
+    return list(
+        ActivityRollup.objects
+        .filter(date__gte=start, date__lte=end, activity_type=activity_type, product_id__isnull=False)
+        .values('product_id')
+        .annotate(events=Sum('events'), quantity=Sum('quantity'))
+        .order_by('-events', 'product_id')[:limit]
+    )
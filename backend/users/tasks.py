@@ -0,0 +1,55 @@
+# backend/users/tasks.py
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.tokens import default_token_generator
+from django.core.mail import send_mail
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+
+from jobs.queue import task
+from jobs.worker import heartbeat
+
+from . import rollups
+from .models import Newsletter
+from .newsletter import NewsletterSender
+
+User = get_user_model()
+
+
+@task(priority=10, max_attempts=5)
+def send_password_reset_email(user_id):
+    """Email a password reset link to the user"""
+    user = User.objects.filter(pk=user_id, is_active=True).first()
+    if user is None:
+        return
+    link = settings.PASSWORD_RESET_URL.format(
+        uid=urlsafe_base64_encode(force_bytes(user.pk)),
+        token=default_token_generator.make_token(user),
+    )
+    send_mail(
+        'Reset your Lindsay Classics password',
+        f'Hi {user.first_name or user.username},\n\n'
+        f'Use this link to choose a new password:\n{link}\n\n'
+        'If you did not ask for a reset you can ignore this email.',
+        None,
+        [user.email],
+    )
+
+
+@task(max_attempts=5)
+def send_newsletter(newsletter_id):
+    """Send (or resume sending) a newsletter to its subscribers"""
+    newsletter = Newsletter.objects.filter(pk=newsletter_id).first()
+    if newsletter is not None:
+        NewsletterSender(newsletter, progress=lambda newsletter: heartbeat()).send()
+
+
+def queue_newsletter(newsletter):
+    """Queue a newsletter for sending; at most one job per newsletter"""
+    return send_newsletter.schedule([newsletter.pk], idempotency_key=f'newsletter:{newsletter.pk}')
+
+
+@task(priority=-10, max_attempts=1)
+def rollup_activity():
+    """Fold new UserActivity rows into the daily rollups"""
+    rollups.rollup()
@@ -1,3 +1,286 @@
-from django.test import TestCase
+import threading
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core import mail
+from django.core.mail import get_connection
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from jobs.models import Job
+from jobs.worker import Worker
+
+from . import activity, rollups
+from .models import ActivityRollup, Newsletter, RollupWatermark, UserActivity
+from .newsletter import NewsletterSender
+from .tasks import queue_newsletter
+
+
+class PasswordResetTests(TestCase):
+
+    def test_reset_email_is_sent_by_the_worker(self):
+        get_user_model().objects.create_user('ada', 'ada@example.com', 'pw', first_name='Ada')
+        url = reverse('reset_password')
+        for _ in range(2):
+            response = self.client.post(url, {'email': 'ada@example.com'}, content_type='application/json')
+            self.assertEqual(response.status_code, 200)
+        self.client.post(url, {'email': 'nobody@example.com'}, content_type='application/json')
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(Job.objects.count(), 1)
+
+        Worker().run(burst=True)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['ada@example.com'])
+        self.assertIn('/reset-password/', mail.outbox[0].body)
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class NewsletterTests(TestCase):
+
+    def make_users(self, count, **kwargs):
+        User = get_user_model()
+        User.objects.bulk_create(
+            User(username=f'user{i}', email=f'user{i}@example.com', password='!',
+                 first_name=('Ada', 'Grace', '')[i % 3], newsletter_subscription=i % 10 != 0, **kwargs)
+            for i in range(count)
+        )
+
+    def test_sends_10k_in_constant_queries(self):
+        self.make_users(10_000)
+        newsletter = Newsletter.objects.create(subject='News for {{ first_name|default:"you" }}', body='Hi {{ first_name }}')
+        sender = NewsletterSender(newsletter, batch_size=1000, chunk_size=1000)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(sender.send(), 9_000)
+        self.assertLess(len(queries), 50)
+        self.assertEqual(len(mail.outbox), 9_000)
+        self.assertEqual(len({m.to[0] for m in mail.outbox}), 9_000)
+        self.assertEqual(mail.outbox[0].subject, 'News for Grace')
+        self.assertEqual(sender.render.cache_info().misses, 3)  # once per first name
+        newsletter.refresh_from_db()
+        self.assertEqual((newsletter.status, newsletter.recipients, newsletter.sent_count), ('sent', 9_000, 9_000))
+
+    def test_recipient_ids_limit_the_send(self):
+        self.make_users(20)
+        ids = list(get_user_model().objects.order_by('pk').values_list('pk', flat=True))
+        selected = Newsletter.objects.create(subject='Hi', body='-', recipient_ids=ids[:5])
+        self.assertEqual(NewsletterSender(selected).send(), 4)  # user0 is unsubscribed
+        # Only None means every subscriber; an empty selection sends nothing
+        nobody = Newsletter.objects.create(subject='Hi', body='-', recipient_ids=[])
+        self.assertEqual(NewsletterSender(nobody).send(), 0)
+        self.assertEqual(len(mail.outbox), 4)
+
+    def test_interrupted_run_resumes_without_duplicates(self):
+        self.make_users(50)
+        newsletter = Newsletter.objects.create(subject='Sale', body='Hi {{ first_name }}')
+        smtp = get_connection()
+        with mock.patch.object(smtp, 'send_messages', side_effect=[1] * 12 + [OSError('SMTP down')]):
+            with self.assertRaises(OSError):
+                NewsletterSender(newsletter, batch_size=5, connection=smtp).send()
+        newsletter.refresh_from_db()
+        self.assertEqual((newsletter.status, newsletter.sent_count), ('sending', 12))
+
+        NewsletterSender(newsletter, batch_size=5).send()
+        newsletter.refresh_from_db()
+        self.assertEqual((newsletter.status, newsletter.sent_count), ('sent', 45))
+        self.assertEqual(len(mail.outbox), 45 - 12)
+        self.assertTrue(all(int(m.to[0][4:].split('@')[0]) > 13 for m in mail.outbox))
+        self.assertEqual(NewsletterSender(newsletter).send(), 0)
+
+    def test_admin_action_queues_the_draft_for_selected_subscribers(self):
+        self.make_users(20)
+        User = get_user_model()
+        admin_user = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        newsletter = Newsletter.objects.create(subject='Hello', body='Hi')
+        self.client.force_login(admin_user)
+        selected = list(User.objects.filter(username__in=['user0', 'user1', 'user2']).values_list('pk', flat=True))
+        response = self.client.post(
+            reverse('admin:users_user_changelist'),
+            {'action': 'send_newsletter', '_selected_action': selected},
+        )
+        self.assertEqual(response.status_code, 302)
+        Worker().run(burst=True)
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), ['user1@example.com', 'user2@example.com'])
+        newsletter.refresh_from_db()
+        self.assertEqual((newsletter.status, newsletter.sent_count), ('sent', 2))
+
+    def test_failed_send_can_be_queued_again_and_resumes(self):
+        self.make_users(10)
+        admin_user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'pw')
+        newsletter = Newsletter.objects.create(subject='Hello', body='Hi')
+        queue_newsletter(newsletter)
+        Job.objects.update(attempts=4)  # the next failure is the last one allowed
+        outage = [1] * 3 + [OSError('SMTP down')]
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=outage):
+            with self.assertLogs('jobs.worker', 'ERROR'):
+                Worker().run(burst=True)
+        newsletter.refresh_from_db()
+        self.assertEqual((newsletter.status, newsletter.sent_count), ('sending', 3))
+
+        self.client.force_login(admin_user)
+        self.client.post(
+            reverse('admin:users_newsletter_changelist'),
+            {'action': 'send_to_subscribers', '_selected_action': [newsletter.pk]},
+        )
+        self.assertEqual(Job.objects.filter(status=Job.QUEUED).count(), 1)
+        Worker().run(burst=True)
+        newsletter.refresh_from_db()
+        self.assertEqual((newsletter.status, newsletter.sent_count), ('sent', 9))
+        self.assertEqual(len(mail.outbox), 6)
+
+
+class UserActivityTests(TestCase):
+
+    def setUp(self):
+        activity.get_buffer().discard()
+        self.addCleanup(activity.get_buffer().discard)
+        self.user = get_user_model().objects.create_user('ada', 'ada@example.com', 'pw')
+
+    def test_events_are_buffered_then_bulk_inserted(self):
+        with self.assertNumQueries(0):
+            for i in range(1200):
+                activity.log_activity(self.user, 'view_product', f'Viewed {i}', product_id=i)
+        self.assertEqual(activity.get_buffer().pending(), 1200)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(activity.flush(), 1200)
+        self.assertLess(len(queries), 15)  # multi-row INSERTs (SQLite caps rows by bind parameters)
+        self.assertEqual(UserActivity.objects.filter(user=self.user).count(), 1200)
+        self.assertEqual(UserActivity.objects.latest('id').metadata, {'product_id': 1199})
+
+    def test_events_without_a_user_are_not_buffered(self):
+        self.assertFalse(activity.log_activity(None, 'place_order', 'Ordered ORD-1', order_id=1))
+        self.assertFalse(activity.log_activity(AnonymousUser(), 'view_product'))
+        activity.log_activity(self.user, 'login')
+        self.assertEqual(activity.get_buffer().pending(), 1)
+
+    def test_full_buffer_drops_instead_of_blocking(self):
+        buffer = activity.ActivityBuffer(flush_size=10, flush_interval=0, max_size=5)
+        results = [buffer.log(UserActivity(user=self.user, activity_type='login')) for _ in range(8)]
+        self.assertEqual(results, [True] * 5 + [False] * 3)
+        self.assertEqual(buffer.stats['dropped'], 3)
+
+    def test_background_flush_on_size(self):
+        buffer = activity.ActivityBuffer(flush_size=3, flush_interval=60, max_size=100)
+        flushed = threading.Event()
+        with mock.patch.object(buffer, 'flush', side_effect=flushed.set) as flush, \
+                mock.patch('users.activity.close_old_connections') as close_old:
+            for _ in range(3):
+                buffer.log(UserActivity(user=self.user, activity_type='login'))
+            self.assertTrue(flushed.wait(5))
+        self.assertEqual(flush.call_count, 1)
+        # Stale connections are dropped before each flush, as a request would
+        self.assertEqual(close_old.call_count, 1)
+
+    def test_login_and_logout_are_logged(self):
+        self.client.post(reverse('login'), {'email': 'ada@example.com', 'password': 'pw'},
+                         content_type='application/json')
+        self.client.post(reverse('logout'))
+        activity.flush()
+        self.assertEqual(list(UserActivity.objects.order_by('id').values_list('activity_type', flat=True)),
+                         ['login', 'logout'])
+
+    def test_prune_deletes_expired_rows_in_batches(self):
+        now = timezone.now()
+        UserActivity.objects.bulk_create(
+            UserActivity(user=self.user, activity_type='login', created_at=now - timedelta(days=days))
+            for days in (1, 100, 200, 300, 400)
+        )
+        self.assertEqual(activity.prune(days=150, batch_size=2), 3)
+        self.assertEqual(UserActivity.objects.count(), 2)
+
+
+class UserActivityConstraintTests(TransactionTestCase):
+    """Foreign keys are only checked at commit, which TestCase never reaches"""
+
+    def setUp(self):
+        activity.get_buffer().discard()
+        self.addCleanup(activity.get_buffer().discard)
+        self.user = get_user_model().objects.create_user('ada', 'ada@example.com', 'pw')
+
+    def test_events_of_deleted_users_are_dropped(self):
+        other = get_user_model().objects.create_user('bob', 'bob@example.com', 'pw')
+        activity.log_activity(self.user, 'login')
+        activity.log_activity(other, 'login')
+        other.delete()
+        self.assertEqual(activity.flush(), 1)
+        self.assertEqual(activity.get_buffer().pending(), 0)
+        self.assertEqual(list(UserActivity.objects.values_list('user_id', flat=True)), [self.user.pk])
+
+
+class ActivityRollupTests(TestCase):
+
+    def setUp(self):
+        self.ada = get_user_model().objects.create_user('ada', 'ada@example.com', 'pw', is_staff=True)
+        self.bob = get_user_model().objects.create_user('bob', 'bob@example.com', 'pw')
+        self.today = timezone.localdate()
+        self.yesterday = self.today - timedelta(days=1)
+
+    def add(self, user, activity_type, days_ago=0, **metadata):
+        at = timezone.now() - timedelta(days=days_ago)
+        return UserActivity.objects.create(user=user, activity_type=activity_type, metadata=metadata, created_at=at)
+
+    def snapshot(self):
+        return sorted(ActivityRollup.objects.values_list('date', 'activity_type', 'product_id', 'events', 'quantity', 'users'))
+
+    def test_new_rows_are_folded_once_and_reruns_are_idempotent(self):
+        for user in (self.ada, self.ada, self.bob):
+            self.add(user, 'view_product', product_id=1)
+        self.add(self.bob, 'add_to_cart', product_id=1, quantity=2)
+        self.add(self.bob, 'add_to_cart', product_id=1, quantity='3')
+        self.add(self.ada, 'login')
+        self.add(self.ada, 'login', product_id='abc', quantity=[1])
+        self.add(self.ada, 'view_product', days_ago=1, product_id=2)
+
+        self.assertEqual(rollups.rollup(), 2)
+        expected = [
+            (self.yesterday, 'view_product', 2, 1, 0, 1),
+            (self.today, 'add_to_cart', 1, 2, 5, 1),
+            (self.today, 'login', None, 2, 0, 1),
+            (self.today, 'view_product', 1, 3, 0, 2),
+        ]
+        self.assertEqual(self.snapshot(), sorted(expected))
+        # Nothing new: only the trailing days are recounted, to the same rows
+        self.assertEqual(rollups.rollup(), 2)
+        rollups.rebuild_days([self.today, self.yesterday])
+        self.assertEqual(self.snapshot(), sorted(expected))
+
+        # A late event for an older day rebuilds that day too
+        self.add(self.bob, 'view_product', days_ago=5, product_id=2)
+        self.assertEqual(rollups.rollup(), 3)
+        self.assertIn((self.today - timedelta(days=5), 'view_product', 2, 1, 0, 1), self.snapshot())
+
+    @override_settings(ACTIVITY_ROLLUP_TRAILING_DAYS=1)
+    def test_rows_committed_below_the_watermark_are_still_counted(self):
+        self.add(self.bob, 'view_product', product_id=1)
+        late = self.add(self.bob, 'view_product', product_id=1)
+        # A concurrent insert committed `late` after a run read a higher id
+        RollupWatermark.objects.create(name=rollups.WATERMARK, last_id=late.pk)
+        self.assertEqual(rollups.rollup(), 1)
+        self.assertEqual(self.snapshot(), [(self.today, 'view_product', 1, 2, 0, 1)])
+
+    def test_dashboards_read_only_the_rollups(self):
+        for product_id, views in ((1, 3), (2, 5), (3, 1)):
+            for _ in range(views):
+                self.add(self.bob, 'view_product', product_id=product_id)
+        rollups.rollup()
+        self.client.force_login(self.ada)
+        with CaptureQueriesContext(connection) as queries:
+            top = self.client.get(reverse('activity_top_products'), {'limit': 2}).json()
+            daily = self.client.get(reverse('activity_daily'), {'type': 'view_product'}).json()
+        self.assertFalse([q for q in queries if 'users_useractivity' in q['sql']])
+        self.assertEqual(top['products'], [
+            {'product_id': 2, 'events': 5, 'quantity': 0},
+            {'product_id': 1, 'events': 3, 'quantity': 0},
+        ])
+        self.assertEqual(daily['rows'], [
+            {'date': self.today.isoformat(), 'activity_type': 'view_product', 'events': 9, 'quantity': 0},
+        ])
+        # Out of range limits are clamped instead of reaching the slice
+        response = self.client.get(reverse('activity_top_products'), {'limit': -5})
+        self.assertEqual([row['product_id'] for row in response.json()['products']], [2])
+        self.client.force_login(self.bob)
+        self.assertEqual(self.client.get(reverse('activity_daily')).status_code, 403)
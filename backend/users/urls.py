@@ -21,6 +21,10 @@ urlpatterns = [
     path('update/<int:user_id>/', views.admin_update_user, name='admin_update_user'),
     path('delete/<int:user_id>/', views.delete_user, name='delete_user'),
     
+    # Activity analytics (admin only)
+    path('analytics/daily/', views.activity_daily, name='activity_daily'),
+    path('analytics/top-products/', views.activity_top_products, name='activity_top_products'),
+    
     # Address management
     path('addresses/', views.user_addresses, name='user_addresses'),
     path('addresses/add/', views.add_address, name='add_address'),
@@ -1,15 +1,23 @@
 from django.shortcuts import render
 # backend/users/views.py
-from django.contrib.auth import authenticate, login, logout
+from django.contrib.auth import authenticate, get_user_model, login, logout
 from django.contrib.auth.decorators import login_required
-from django.contrib.auth.models import User
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from datetime import timedelta
 import json
 import logging
+import time
+
+from . import rollups
+from .activity import log_request_activity
+from .tasks import send_password_reset_email
 
 logger = logging.getLogger(__name__)
+User = get_user_model()
 
 # Helper function to parse request body
 def parse_request_body(request):
@@ -114,6 +122,7 @@ def login_user(request):
         
         if user is not None:
             login(request, user)
+            log_request_activity(request, 'login', 'Logged in')
             return JsonResponse({
                 'success': True,
                 'message': 'Login successful',
@@ -142,6 +151,7 @@ def login_user(request):
 @require_http_methods(["POST"])
 def logout_user(request):
     """Logout user"""
+    log_request_activity(request, 'logout', 'Logged out')
     logout(request)
     return JsonResponse({
         'success': True,
@@ -281,8 +291,10 @@ def reset_password(request):
                 'message': 'If the email exists, a reset link has been sent'
             })
         
-        # TODO: Implement email sending logic
-        # For now, just return success
+        # Sent by the job worker; one email per user per 5-minute window
+        send_password_reset_email.schedule(
+            [user.pk], idempotency_key=f'password-reset:{user.pk}:{int(time.time() // 300)}',
+        )
         return JsonResponse({
             'success': True,
             'message': 'Password reset email sent'
@@ -491,4 +503,67 @@ def delete_address(request, address_id):
     return JsonResponse({
         'success': True,
         'message': 'Address deleted'
-    })
\ No newline at end of file
+    })
+
+# ============================================
+# Activity Analytics (admin only, rollup tables)
+# ============================================
+
+def _date_window(request, default_days=30):
+    """(start, end) dates from ?start=&end= (ISO), defaulting to the last 30 days"""
+    def date_param(name):
+        try:
+            return parse_date(request.GET.get(name) or '')
+        except ValueError:
+            return None
+
+    end = date_param('end') or timezone.localdate()
+    start = date_param('start') or end - timedelta(days=default_days - 1)
+    return start, end
+
+@login_required
+@require_http_methods(["GET"])
+def activity_daily(request):
+    """Events per day and type; ?type= (repeatable) and ?product_id= narrow it"""
+    if not request.user.is_staff:
+        return JsonResponse({
+            'success': False,
+            'error': 'Admin access required'
+        }, status=403)
+
+    start, end = _date_window(request)
+    product_id = request.GET.get('product_id')
+    rows = rollups.daily_totals(
+        start, end,
+        activity_types=request.GET.getlist('type'),
+        product_id=int(product_id) if product_id and product_id.isdigit() else None,
+    )
+    return JsonResponse({
+        'success': True,
+        'start': start,
+        'end': end,
+        'rows': rows
+    })
+
+@login_required
+@require_http_methods(["GET"])
+def activity_top_products(request):
+    """Products with the most events of ?type= (default view_product)"""
+    if not request.user.is_staff:
+        return JsonResponse({
+            'success': False,
+            'error': 'Admin access required'
+        }, status=403)
+
+    start, end = _date_window(request)
+    try:
+        limit = max(min(int(request.GET.get('limit', 10)), 100), 1)
+    except ValueError:
+        limit = 10
+    products = rollups.top_products(start, end, request.GET.get('type', 'view_product'), limit)
+    return JsonResponse({
+        'success': True,
+        'start': start,
+        'end': end,
+        'products': products
+    })